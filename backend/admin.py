@@ -0,0 +1,35 @@
+"""
+管理者向け機能の認可を扱うモジュール
+
+管理者トークンは環境変数 `ADMIN_TOKEN` で設定し、リクエストでは `X-Admin-Token` ヘッダーで渡す。
+`ADMIN_TOKEN` が未設定の場合、管理者向け機能はすべて無効になる。
+"""
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+
+def get_admin_token() -> Optional[str]:
+    """設定されている管理者トークンを返す。未設定の場合はNone。"""
+    return os.environ.get("ADMIN_TOKEN") or None
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """渡されたトークンが管理者トークンと一致するかを判定する。"""
+    expected = get_admin_token()
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    管理者のみが利用できるエンドポイント用の依存関数。
+    トークンが一致しない場合は 403 を返す。
+    """
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required.")
@@ -0,0 +1,90 @@
+#
+# コースの一括インポートのベンチマーク。
+# 一時SQLite DBを使うアプリに対して、以下の2つの方法で N 件のコースを保存する時間を比較する。
+#
+#   single: POST /users/{user_id}/courses を1件ずつ呼ぶ（ユーザーの確認・COMMIT が毎回発生する）
+#   bulk:   POST /users/{user_id}/courses/bulk で全件をまとめて送る
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_course_import
+#   python -m backend.benchmarks.bench_course_import --courses 100 1000 --route-points 500
+#
+import argparse
+import os
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from backend import models
+from backend.benchmarks.bench_course_list import random_route
+from backend.database import get_async_db, to_async_url
+from backend.main import app
+
+import numpy as np
+
+
+def make_courses(num_courses: int, route_points: int) -> list:
+    rng = np.random.default_rng(0)
+    courses = []
+    for _ in range(num_courses):
+        route = random_route(rng, route_points)
+        courses.append({"total_distance_km": 5.0, "route_points": route, "drawing_points": route[::10]})
+    return courses
+
+
+def import_single(client, user_id, courses):
+    for course in courses:
+        client.post(f"/users/{user_id}/courses", json=course).raise_for_status()
+
+
+def import_bulk(client, user_id, courses):
+    client.post(f"/users/{user_id}/courses/bulk", json={"courses": courses}).raise_for_status()
+
+
+def run(sizes, route_points: int):
+    print(f"{'courses':>8}{'single [s]':>12}{'bulk [s]':>10}{'speedup':>9}")
+    for size in sizes:
+        courses = make_courses(size, route_points)
+        timings = {}
+        for name, import_courses in (("single", import_single), ("bulk", import_bulk)):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+                engine = create_engine(url)
+                models.Base.metadata.create_all(bind=engine)
+                engine.dispose()
+                Session = async_sessionmaker(
+                    create_async_engine(to_async_url(url), poolclass=NullPool), expire_on_commit=False
+                )
+
+                async def override_get_async_db():
+                    async with Session() as db:
+                        yield db
+
+                app.dependency_overrides[get_async_db] = override_get_async_db
+                try:
+                    with TestClient(app) as client:
+                        user_id = client.post("/users").json()["user_id"]
+                        start = time.perf_counter()
+                        import_courses(client, user_id, courses)
+                        timings[name] = time.perf_counter() - start
+                finally:
+                    app.dependency_overrides.pop(get_async_db, None)
+
+        print(f"{size:>8}{timings['single']:>12.2f}{timings['bulk']:>10.2f}"
+              f"{timings['single'] / timings['bulk']:>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コースの一括インポートのベンチマーク")
+    parser.add_argument("--courses", type=int, nargs="+", default=[100, 1000], help="インポートするコースの件数")
+    parser.add_argument("--route-points", type=int, default=500, help="1コースの経路の点数")
+    args = parser.parse_args()
+    run(args.courses, args.route_points)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#
+# コース一覧のレスポンスのベンチマーク。
+# 一時SQLite DBに1ユーザー分のコースを作成し、一覧のレスポンスを組み立てて JSON にするまでの時間と
+# レスポンスサイズを、以下の2つの方法で比較する。
+#
+#   full:    全コースの route_points をそのまま返す（以前の方法）
+#   preview: 保存時に簡略化した preview_points を返し、全体の経路は読み込まない
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_course_list
+#   python -m backend.benchmarks.bench_course_list --courses 100 --route-points 500 3000 --repeat 5
+#
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import course_queries, models, schemas
+
+COURSE_LIST = TypeAdapter(list[schemas.CourseSummary])
+
+
+def random_route(rng, num_points: int) -> list:
+    """札幌付近から始まる、道路に沿ったような折れ線の経路を作る。"""
+    steps = rng.normal(0, 1, (num_points, 2))
+    # 同じ方向に進み続ける区間が多くなるよう、方向をなめらかに変化させる
+    headings = np.cumsum(steps[:, 0] * 0.3)
+    lengths = np.abs(steps[:, 1]) * 2e-4
+    lats = 43.06 + np.cumsum(np.sin(headings) * lengths)
+    lngs = 141.35 + np.cumsum(np.cos(headings) * lengths)
+    return [{"lat": lat, "lng": lng} for lat, lng in zip(lats.tolist(), lngs.tolist())]
+
+
+def build_list_response(session, user_id, preview: bool) -> bytes:
+    query = session.query(models.Course).filter(models.Course.user_id == user_id)
+    if preview:
+        query = query.options(*course_queries.SUMMARY_LOAD_OPTIONS)
+    courses = query.all()
+    return COURSE_LIST.dump_json([
+        schemas.CourseSummary(
+            id=str(course.id),
+            total_distance_km=course.total_distance_km,
+            distance_to_start_km=0.0,
+            is_favorite=course.is_favorite,
+            created_at=course.created_at,
+            route_points=(course_queries.preview_route_points(course) if preview else course.route_points).to_list(),
+            drawing_points=None,
+        )
+        for course in courses
+    ])
+
+
+def run(num_courses: int, route_sizes, repeat: int):
+    print(f"{'route points':>13}{'full [ms]':>11}{'full [KB]':>11}"
+          f"{'preview [ms]':>14}{'preview [KB]':>14}{'speedup':>9}{'size':>8}")
+    rng = np.random.default_rng(0)
+    for route_size in route_sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+            models.Base.metadata.create_all(bind=engine)
+            Session = sessionmaker(bind=engine)
+            user_id = uuid.uuid4()
+            with Session() as session:
+                session.add(models.User(id=user_id))
+                for _ in range(num_courses):
+                    session.add(models.Course(
+                        user_id=user_id,
+                        total_distance_km=5.0,
+                        route_points=random_route(rng, route_size),
+                        drawing_points=[],
+                    ))
+                session.commit()
+
+            results = {}
+            for name, preview in (("full", False), ("preview", True)):
+                best = float("inf")
+                for _ in range(repeat):
+                    with Session() as session:
+                        start = time.perf_counter()
+                        body = build_list_response(session, user_id, preview)
+                        best = min(best, time.perf_counter() - start)
+                results[name] = (best, len(body))
+            engine.dispose()
+
+        (full_s, full_bytes), (preview_s, preview_bytes) = results["full"], results["preview"]
+        print(f"{route_size:>13}{full_s * 1000:>11.1f}{full_bytes / 1024:>11.1f}"
+              f"{preview_s * 1000:>14.1f}{preview_bytes / 1024:>14.1f}"
+              f"{full_s / preview_s:>8.1f}x{full_bytes / preview_bytes:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コース一覧のレスポンスのベンチマーク")
+    parser.add_argument("--courses", type=int, default=100, help="ユーザーが持つコースの件数")
+    parser.add_argument("--route-points", type=int, nargs="+", default=[500, 1000, 3000],
+                        help="1コースあたりの経路の点数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.courses, args.route_points, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#
+# 形状前処理の幾何計算カーネルのマイクロベンチマーク。
+# 以前のPythonループによる実装と、ndarrayを一括処理するカーネルの実行時間を比較する。
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_geometry
+#   python -m backend.benchmarks.bench_geometry --sizes 100 1000 --repeat 10
+#
+import argparse
+import timeit
+
+import numpy as np
+
+from backend.calculator import geometry
+
+RESAMPLE_POINTS = 200  # GPSArtGenerator.rotation_search_points と同じ
+
+
+# ------------------------------------------------------------
+# 比較用: ループによる以前の実装
+# ------------------------------------------------------------
+def legacy_resample(shape_points, num_points):
+    points = np.array(shape_points)
+    segment_lengths = np.sqrt(np.sum(np.diff(points, axis=0)**2, axis=1))
+    cumulative_lengths = np.insert(np.cumsum(segment_lengths), 0, 0)
+    if cumulative_lengths[-1] == 0:
+        return [tuple(points[0])] * num_points
+    interval = cumulative_lengths[-1] / (num_points - 1) if num_points > 1 else 0
+    new_points = []
+    segment_index = 0
+    for i in range(num_points):
+        target_dist = i * interval
+        while segment_index < len(segment_lengths) and target_dist > cumulative_lengths[segment_index + 1]:
+            segment_index += 1
+        if segment_index >= len(segment_lengths):
+            segment_index = len(segment_lengths) - 1
+        dist_in_segment = target_dist - cumulative_lengths[segment_index]
+        segment_len = segment_lengths[segment_index]
+        fraction = 0.0 if segment_len == 0 else dist_in_segment / segment_len
+        p1 = points[segment_index]
+        p2 = points[segment_index + 1]
+        new_points.append(tuple(p1 + fraction * (p2 - p1)))
+    return new_points
+
+
+def legacy_path_length(path):
+    length = 0
+    for i in range(len(path) - 1):
+        length += np.linalg.norm(np.array(path[i + 1]) - np.array(path[i]))
+    return length
+
+
+def legacy_scale_to_geo(raw_path, anchor_lat, anchor_lon, target_path_km):
+    target_path_meters = target_path_km * 1000
+    scale_factor = target_path_meters / legacy_path_length(raw_path)
+    anchor_point_raw = np.array(raw_path[0])
+    scaled_path_meters = [(np.array(point) - anchor_point_raw) * scale_factor for point in raw_path]
+    m_per_deg_lat = (2 * np.pi * 6378137) / 360
+    m_per_deg_lon = m_per_deg_lat * np.cos(np.radians(anchor_lat))
+    return [(anchor_lon + x / m_per_deg_lon, anchor_lat - y / m_per_deg_lat) for x, y in scaled_path_meters]
+
+
+def legacy_rotate(shape_points, angle_deg):
+    angle_rad = np.radians(angle_deg)
+    rotation_matrix = np.array([
+        [np.cos(angle_rad), -np.sin(angle_rad)],
+        [np.sin(angle_rad), np.cos(angle_rad)]
+    ])
+    anchor_point = np.array(shape_points[0])
+    return [(rotation_matrix @ (point - anchor_point)) + anchor_point for point in shape_points]
+
+
+# ------------------------------------------------------------
+# ベンチマーク本体
+# ------------------------------------------------------------
+def make_drawing(num_points: int, seed: int = 0) -> np.ndarray:
+    """手書きに近い、ノイズの乗った閉曲線のディスプレイ座標を生成する。"""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 2 * np.pi, num_points)
+    radius = 150 + 20 * np.sin(5 * t) + rng.normal(0, 1.0, num_points)
+    return np.column_stack((300 + radius * np.cos(t), 300 + radius * np.sin(t)))
+
+
+def best_time(func, repeat: int) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def run(sizes, repeat: int):
+    print(f"{'kernel':<16}{'points':>10}{'legacy [ms]':>14}{'vectorized [ms]':>18}{'speedup':>10}")
+    for size in sizes:
+        drawing = make_drawing(size)
+        drawing_list = [tuple(p) for p in drawing.tolist()]
+        cases = [
+            ("resample",
+             lambda: legacy_resample(drawing_list, RESAMPLE_POINTS),
+             lambda: geometry.resample(drawing, RESAMPLE_POINTS)),
+            ("path_length",
+             lambda: legacy_path_length(drawing_list),
+             lambda: geometry.path_length(drawing)),
+            ("scale_to_geo",
+             lambda: legacy_scale_to_geo(drawing_list, 43.0686, 141.3508, 8.4),
+             lambda: geometry.scale_to_geo(drawing, 43.0686, 141.3508, 8400)),
+            ("rotate",
+             lambda: legacy_rotate(drawing, 37.0),
+             lambda: geometry.rotate(drawing, 37.0)),
+        ]
+        for name, legacy, vectorized in cases:
+            legacy_s = best_time(legacy, repeat)
+            vectorized_s = best_time(vectorized, repeat)
+            print(f"{name:<16}{size:>10}{legacy_s * 1000:>14.3f}{vectorized_s * 1000:>18.3f}"
+                  f"{legacy_s / vectorized_s:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="幾何計算カーネルのマイクロベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000],
+                        help="入力の点数")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数（最小値を採用）")
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
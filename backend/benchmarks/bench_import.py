@@ -0,0 +1,63 @@
+#
+# 起動時間（backend.main の import）のベンチマーク。
+# 新しい Python プロセスで以下の2つを計測し、中央値を比較する。
+#
+#   lazy:  backend.main を import するだけ（経路計算は最初に必要になったときに初期化する）
+#   eager: import に加えて routing.get_generator() で経路計算を初期化する
+#          （以前は import 時に osmnx などの読み込みと GPSArtGenerator の生成を行っていたため、
+#           以前の import 時間に相当する）
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_import
+#   python -m backend.benchmarks.bench_import --repeat 10
+#
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("osmnx", "geopandas", "networkx", "scipy", "shapely", "matplotlib")
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import backend.main
+if {eager}:
+    from backend import routing
+    routing.get_generator()
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(eager: bool) -> dict:
+    env = {**os.environ, "ROUTING_WARMUP": "0"}
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(eager=eager, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(repeat: int):
+    print(f"{'mode':>6}{'median [s]':>12}{'min [s]':>10}  loaded heavy modules")
+    medians = {}
+    for name, eager in (("lazy", False), ("eager", True)):
+        results = [measure(eager) for _ in range(repeat)]
+        seconds = [result["seconds"] for result in results]
+        medians[name] = statistics.median(seconds)
+        print(f"{name:>6}{medians[name]:>12.3f}{min(seconds):>10.3f}  {', '.join(results[-1]['heavy']) or '-'}")
+    print(f"speedup: {medians['eager'] / medians['lazy']:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="backend.main の import 時間のベンチマーク")
+    parser.add_argument("--repeat", type=int, default=5, help="計測するプロセスの数")
+    args = parser.parse_args()
+    run(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#
+# 「近くのコース」検索のベンチマーク。
+# 1ユーザーが大量のコースを持つ一時SQLite DBを作成し、以下の2つの方法で k 件の近傍を求める時間を比較する。
+#
+#   scan:    ユーザーの全コースの始点を読み込み、全件の距離を計算する（従来の方法）
+#   indexed: 始点の格子セルのインデックスで候補を絞り込む（course_queries.find_nearby_courses）
+#
+# どちらもAPIと同じく非同期セッション（aiosqlite）で実行する。
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_nearby
+#   python -m backend.benchmarks.bench_nearby --sizes 10000 100000 --queries 50
+#
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from backend import models, spatial
+from backend.calculator import geometry
+from backend.course_queries import find_nearby_courses
+from backend.database import to_async_url
+
+# 日本の本州付近の範囲にコースの始点を分布させる
+LAT_RANGE = (33.0, 41.0)
+LNG_RANGE = (130.0, 142.0)
+INSERT_CHUNK = 50000
+
+
+def populate(engine, user_id: uuid.UUID, num_courses: int, seed: int = 0):
+    """num_courses 件のコースを一括挿入する。"""
+    rng = np.random.default_rng(seed)
+    courses = models.Course.__table__
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{"id": user_id}])
+    for offset in range(0, num_courses, INSERT_CHUNK):
+        count = min(INSERT_CHUNK, num_courses - offset)
+        lats = rng.uniform(*LAT_RANGE, count)
+        lngs = rng.uniform(*LNG_RANGE, count)
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "user_id": user_id,
+                "total_distance_km": 5.0,
+                "is_favorite": False,
+                "route_points": [{"lat": lat, "lng": lng}],
+                "preview_points": [{"lat": lat, "lng": lng}],
+                "drawing_points": [],
+                "start_lat": lat,
+                "start_lng": lng,
+                "start_cell": spatial.cell_id(lat, lng),
+            }
+            for lat, lng in zip(lats.tolist(), lngs.tolist())
+        ]
+        with engine.begin() as conn:
+            conn.execute(courses.insert(), rows)
+
+
+async def nearest_by_scan(session, user_id, lat, lng, radius_km, k):
+    rows = (
+        await session.execute(
+            select(models.Course.id, models.Course.start_lat, models.Course.start_lng)
+            .where(models.Course.user_id == user_id)
+        )
+    ).all()
+    distances = geometry.haversine_km(lat, lng, [r.start_lat for r in rows], [r.start_lng for r in rows])
+    order = np.argsort(distances)[:k]
+    return [(distances[i], rows[i].id) for i in order if distances[i] <= radius_km]
+
+
+async def time_queries(Session, search, points) -> float:
+    """points の各点で search を実行し、1回あたりの秒数を返す。"""
+    async with Session() as session:
+        start = time.perf_counter()
+        for lat, lng in points:
+            await search(session, lat, lng)
+        return (time.perf_counter() - start) / len(points)
+
+
+def run(sizes, queries: int, radius_km: float, k: int):
+    print(f"{'courses':>10}{'scan [ms/query]':>18}{'indexed [ms/query]':>21}{'speedup':>10}")
+    rng = np.random.default_rng(1)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+            engine = create_engine(url)
+            models.Base.metadata.create_all(bind=engine)
+            user_id = uuid.uuid4()
+            populate(engine, user_id, size)
+            engine.dispose()
+            # 計測ごとに asyncio.run でイベントループが変わるため、接続はプールしない
+            async_engine = create_async_engine(to_async_url(url), poolclass=NullPool)
+            Session = async_sessionmaker(async_engine)
+
+            points = list(zip(rng.uniform(*LAT_RANGE, queries).tolist(), rng.uniform(*LNG_RANGE, queries).tolist()))
+            timings = {}
+            for name, search in (
+                ("scan", lambda s, lat, lng: nearest_by_scan(s, user_id, lat, lng, radius_km, k)),
+                ("indexed", lambda s, lat, lng: find_nearby_courses(s, user_id, lat, lng, radius_km, k)),
+            ):
+                timings[name] = asyncio.run(time_queries(Session, search, points))
+            asyncio.run(async_engine.dispose())
+
+        print(f"{size:>10}{timings['scan'] * 1000:>18.2f}{timings['indexed'] * 1000:>21.2f}"
+              f"{timings['scan'] / timings['indexed']:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近くのコース検索のベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="ユーザーが持つコースの件数")
+    parser.add_argument("--queries", type=int, default=20, help="計測する検索の回数")
+    parser.add_argument("--radius-km", type=float, default=10.0)
+    parser.add_argument("-k", type=int, default=20)
+    args = parser.parse_args()
+    run(args.sizes, args.queries, args.radius_km, args.k)
+
+
+if __name__ == "__main__":
+    main()
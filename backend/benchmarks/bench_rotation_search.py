@@ -0,0 +1,98 @@
+#
+# 回転角度の探索（GPSArtGenerator._find_best_rotation）のベンチマーク。
+# 格子状の道路網（合成データ、ネットワーク接続は不要）で以下の2つを比較する。
+#
+#   kdtree: 以前の実装。ノードの KDTree を作り、角度ごとに回転と最近傍ノードの検索を行う
+#   field:  道路網の距離場から全角度の誤差を一括で求める（距離場の計算はキャッシュに保存するため別に表示）
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_rotation_search
+#   python -m backend.benchmarks.bench_rotation_search --extents 2000 4000 8000 --repeat 5
+#
+import argparse
+import time
+
+import networkx as nx
+import numpy as np
+from scipy.spatial import KDTree
+
+from backend.calculator import distance_field, geometry
+
+ROTATION_SEARCH_STEPS = 360  # GPSArtGenerator.rotation_search_steps と同じ
+ROTATION_SEARCH_POINTS = 200  # GPSArtGenerator.rotation_search_points と同じ
+BLOCK_M = 80.0
+
+
+def make_grid_network(extent_m: float) -> nx.MultiDiGraph:
+    """中心から東西南北に extent_m の範囲の、BLOCK_M 間隔の格子状の道路網"""
+    graph = nx.MultiDiGraph()
+    ticks = np.arange(-extent_m, extent_m + 1, BLOCK_M)
+    n = len(ticks)
+    for i, y in enumerate(ticks):
+        for j, x in enumerate(ticks):
+            graph.add_node(i * n + j, x=float(x), y=float(y), coords=np.array([x, y]))
+            # 双方向に通行できる道路
+            for neighbor in ([i * n + j - 1] if j > 0 else []) + ([(i - 1) * n + j] if i > 0 else []):
+                graph.add_edge(neighbor, i * n + j, length=BLOCK_M)
+                graph.add_edge(i * n + j, neighbor, length=BLOCK_M)
+    return graph
+
+
+def make_shape(extent_m: float) -> np.ndarray:
+    """範囲の半分ほどの大きさのハート形（始点が中心）"""
+    t = np.linspace(0, 2 * np.pi, 400)
+    heart = np.column_stack((16 * np.sin(t) ** 3, 13 * np.cos(t) - 5 * np.cos(2 * t) - 2 * np.cos(3 * t) - np.cos(4 * t)))
+    heart = (heart - heart[0]) * (extent_m / 2 / np.ptp(heart[:, 0]))
+    return geometry.resample(heart, ROTATION_SEARCH_POINTS)
+
+
+def kdtree_search(road_network, shape) -> float:
+    all_node_coords = np.array([road_network.nodes[node]['coords'] for node in road_network.nodes()])
+    node_tree = KDTree(all_node_coords)
+    best_angle, min_total_distance = 0, float('inf')
+    for i in range(ROTATION_SEARCH_STEPS):
+        angle = (360 / ROTATION_SEARCH_STEPS) * i
+        distances, _ = node_tree.query(geometry.rotate(shape, angle))
+        total_error = np.sum(distances ** 4)
+        if total_error < min_total_distance:
+            min_total_distance, best_angle = total_error, angle
+    return best_angle
+
+
+def field_search(field, shape) -> float:
+    angles = (360 / ROTATION_SEARCH_STEPS) * np.arange(ROTATION_SEARCH_STEPS)
+    return float(angles[int(np.argmin(distance_field.fit_errors(field, shape, angles)))])
+
+
+def best_time(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(extents, repeat: int):
+    print(f"{'extent [m]':>10}{'nodes':>8}{'kdtree [ms]':>13}{'field [ms]':>12}{'speedup':>9}{'build [ms]':>12}")
+    for extent in extents:
+        road_network = make_grid_network(extent)
+        shape = make_shape(extent)
+        build_s = best_time(lambda: distance_field.build(road_network), 1)
+        field = distance_field.build(road_network)
+        kdtree_s = best_time(lambda: kdtree_search(road_network, shape), repeat)
+        field_s = best_time(lambda: field_search(field, shape), repeat)
+        print(f"{extent:>10}{road_network.number_of_nodes():>8}{kdtree_s * 1000:>13.1f}{field_s * 1000:>12.1f}"
+              f"{kdtree_s / field_s:>8.1f}x{build_s * 1000:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回転角度の探索のベンチマーク")
+    parser.add_argument("--extents", type=int, nargs="+", default=[1000, 4000, 8000], help="道路網の範囲（メートル）")
+    parser.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（最小値を表示）")
+    args = parser.parse_args()
+    run(args.extents, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
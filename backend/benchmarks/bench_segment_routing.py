@@ -0,0 +1,68 @@
+#
+# 区間ごとの経路探索（GPSArtGenerator._find_route_for_shape）のベンチマーク。
+# 格子状の道路網（合成データ、ネットワーク接続は不要）で、頂点数 --vertices の形状のコースを
+# 逐次に探索する場合と、ワーカープロセスで並列に探索する場合の実行時間を比較する。
+# 並列の場合はワーカープロセスの起動を含まない時間（2回目以降のリクエストに相当）を表示する。
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_segment_routing
+#   python -m backend.benchmarks.bench_segment_routing --workers 2 4 8 --vertices 40
+#
+import argparse
+import os
+import time
+
+import numpy as np
+
+from backend.benchmarks.bench_rotation_search import make_grid_network
+from backend.calculator.gps_art_generator import GPSArtGenerator
+from backend.calculator.network_cache import LoadedNetwork
+from backend.calculator.segment_routing import SegmentRoutingPool
+
+
+def make_shape(extent_m: float, vertices: int) -> np.ndarray:
+    """頂点数 vertices の星形（中心は原点、範囲の半分ほどの大きさ）"""
+    angles = np.linspace(0, 2 * np.pi, vertices)
+    radius = np.where(np.arange(vertices) % 2 == 0, extent_m / 2, extent_m / 5)
+    return np.column_stack((radius * np.sin(angles), radius * np.cos(angles)))
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(extent: float, vertices: int, workers_list):
+    generator = GPSArtGenerator()
+    # 経路探索は投影後のグラフだけを使うため、緯度経度のグラフは持たないネットワークにする
+    network = LoadedNetwork((0.0, 0.0), int(extent), None, make_grid_network(extent))
+    shape = make_shape(extent, vertices)
+
+    generator.segment_routing = SegmentRoutingPool(workers=0)
+    # 1回目は初回の呼び出しのオーバーヘッドを含むため2回目を計測する
+    generator._find_route_for_shape(network, shape)
+    sequential_s = timed(lambda: generator._find_route_for_shape(network, shape))
+    print(f"{'workers':>8}{'time [s]':>10}{'speedup':>9}{'startup [s]':>13}")
+    print(f"{'1':>8}{sequential_s:>10.2f}{'1.0x':>9}{'-':>13}")
+
+    for workers in workers_list:
+        pool = SegmentRoutingPool(workers=workers)
+        generator.segment_routing = pool
+        first_s = timed(lambda: generator._find_route_for_shape(network, shape))
+        parallel_s = timed(lambda: generator._find_route_for_shape(network, shape))
+        print(f"{workers:>8}{parallel_s:>10.2f}{sequential_s / parallel_s:>8.1f}x{first_s - parallel_s:>13.2f}")
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="区間ごとの経路探索の並列化のベンチマーク")
+    parser.add_argument("--extent", type=float, default=2000, help="道路網の範囲（メートル）")
+    parser.add_argument("--vertices", type=int, default=40, help="形状の頂点数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1], help="ワーカープロセス数")
+    args = parser.parse_args()
+    run(args.extent, args.vertices, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#
+# コース計算のレスポンスのシリアライズのベンチマーク。
+# 経路の点数ごとに、以下の方法で JSON バイト列にするまでの時間とサイズを比較する。
+#
+#   pydantic: 点ごとに schemas.LatLng を作り、RouteCalculateResponse.model_dump_json で出力する（以前の方法）
+#   fast:     dict のまま serialization.json_response で出力する（既定の形式）
+#   compact:  座標列を [[lat, lng], ...] にして出力する（Accept: application/vnd.gpsart.compact+json）
+#
+# サイズは非圧縮と gzip 圧縮後（GZipMiddleware と同じ圧縮レベル 9）を表示する。
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.bench_serialization
+#   python -m backend.benchmarks.bench_serialization --sizes 1000 100000 --repeat 5
+#
+import argparse
+import gzip
+import timeit
+
+import numpy as np
+
+from backend import schemas, serialization
+
+
+def make_result(num_points: int) -> dict:
+    rng = np.random.default_rng(0)
+    lats = 43.06 + np.cumsum(rng.normal(0, 1e-4, num_points))
+    lngs = 141.35 + np.cumsum(rng.normal(0, 1e-4, num_points))
+    route_points = [{"lat": lat, "lng": lng} for lat, lng in zip(lats.tolist(), lngs.tolist())]
+    return {"total_distance_km": 5.0, "route_points": route_points, "drawing_points": route_points[:200]}
+
+
+def serialize_pydantic(result) -> bytes:
+    return schemas.RouteCalculateResponse(
+        total_distance_km=result["total_distance_km"],
+        route_points=[schemas.LatLng(**point) for point in result["route_points"]],
+        drawing_points=[schemas.LatLng(**point) for point in result["drawing_points"]],
+    ).model_dump_json().encode()
+
+
+def serialize_fast(result, compact: bool = False) -> bytes:
+    return serialization.json_response(
+        {
+            "total_distance_km": result["total_distance_km"],
+            "route_points": serialization.points_payload(result["route_points"], compact),
+            "drawing_points": serialization.points_payload(result["drawing_points"], compact),
+        },
+        compact,
+    ).body
+
+
+def run(sizes, repeat: int):
+    methods = (
+        ("pydantic", serialize_pydantic),
+        ("fast", serialize_fast),
+        ("compact", lambda result: serialize_fast(result, compact=True)),
+    )
+    print(f"{'points':>8}{'method':>10}{'time [ms]':>11}{'speedup':>9}{'size [KB]':>11}{'gzip [KB]':>11}")
+    for size in sizes:
+        result = make_result(size)
+        baseline = None
+        for name, serialize in methods:
+            seconds = min(timeit.repeat(lambda: serialize(result), number=1, repeat=repeat))
+            baseline = baseline or seconds
+            body = serialize(result)
+            gzipped = gzip.compress(body, compresslevel=9)
+            print(f"{size:>8}{name:>10}{seconds * 1000:>11.2f}{baseline / seconds:>8.1f}x"
+                  f"{len(body) / 1024:>11.1f}{len(gzipped) / 1024:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コース計算のレスポンスのシリアライズのベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="経路の点数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+#
+# HTTP の負荷試験。
+# 一時ディレクトリの SQLite DB を使うサーバー（uvicorn、別プロセス）を起動し、以下の操作を混ぜたリクエストを
+# 目標のリクエスト数/秒（--rps）で送って、操作ごとのレイテンシ（p50/p95/p99）とスループットを表示する。
+#
+#   calculate: POST /routes/calculate（手書きの図形からコースを計算）
+#   notice:    POST /routes/calculate-notice（道路ネットワークの事前読み込み）
+#   list:      GET  /users/{user_id}/courses（コース一覧）
+#   favorite:  POST /users/{user_id}/courses/{course_id}/toggle_favorite（お気に入りの切り替え）
+#
+# 道路ネットワークは Overpass API から取得せず、格子状の固定の道路網（合成データ）を GPSArtGenerator に
+# 読み込んで固定する（範囲外の地点のリクエストは 400 になる）。ユーザーとコースは計測前に作成する。
+#
+# リクエストは前のレスポンスを待たずに一定の間隔で送り、レイテンシは送信予定の時刻から計測する
+# （サーバーが詰まって送信が遅れた時間もレイテンシに含める）。最初の --warmup 秒の結果は集計しない。
+# --output で結果を JSON に保存し、--compare で2つの結果（コミット間など）を比較できる。
+#
+# 実行方法（リポジトリのルートで）:
+#   python -m backend.benchmarks.load_test
+#   python -m backend.benchmarks.load_test --rps 20 --duration 60 --mix calculate=1 notice=1 list=6 favorite=2 \
+#       --output after.json
+#   python -m backend.benchmarks.load_test --compare before.json after.json
+#
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+# 固定の道路網の中心（東京駅付近）と範囲
+FIXTURE_LAT = 35.681
+FIXTURE_LNG = 139.767
+FIXTURE_DISTANCE_M = 4000
+FIXTURE_BLOCK_M = 100.0
+# コースの開始地点は中心からこの範囲（緯度経度）でばらつかせる
+START_JITTER_DEG = 0.003
+METERS_PER_DEGREE = 111_320.0
+
+OPERATIONS = ("calculate", "notice", "list", "favorite")
+DEFAULT_MIX = {"calculate": 1, "notice": 1, "list": 6, "favorite": 2}
+PERCENTILES = (50, 95, 99)
+COURSE_SORT_OPTIONS = ("distance_asc", "created_at_desc", "total_distance_asc")
+
+
+# ------------------------------------------------------------
+# サーバー（別プロセス）
+# ------------------------------------------------------------
+def make_fixture_network(lat: float, lng: float, distance_m: float, block_m: float):
+    """(lat, lng) を中心に東西南北 distance_m の範囲の、block_m 間隔の格子状の道路網（緯度経度）"""
+    import networkx as nx
+
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+    ticks = np.arange(-distance_m, distance_m + 1, block_m)
+    n = len(ticks)
+    meters_per_degree_lng = METERS_PER_DEGREE * np.cos(np.radians(lat))
+    for i, dy in enumerate(ticks):
+        for j, dx in enumerate(ticks):
+            node = i * n + j
+            graph.add_node(node, x=lng + dx / meters_per_degree_lng, y=lat + dy / METERS_PER_DEGREE)
+            # 双方向に通行できる道路
+            for neighbor in ([node - 1] if j > 0 else []) + ([node - n] if i > 0 else []):
+                graph.add_edge(neighbor, node, length=block_m)
+                graph.add_edge(node, neighbor, length=block_m)
+    return graph
+
+
+def install_fixture_network(generator, lat: float = FIXTURE_LAT, lng: float = FIXTURE_LNG,
+                            distance_m: int = FIXTURE_DISTANCE_M, block_m: float = FIXTURE_BLOCK_M):
+    """
+    固定の道路網を generator のメモリに読み込んで固定し、道路ネットワークを新規に取得しないようにする。
+    固定の道路網に含まれない範囲を要求された場合は ValueError（/routes/calculate では 400）にする。
+    読み込んだネットワーク（LoadedNetwork）を返す。
+    """
+    import osmnx as ox
+    from backend.calculator.network_cache import LoadedNetwork
+
+    road_network_latlon = make_fixture_network(lat, lng, distance_m, block_m)
+    road_network = ox.project_graph(road_network_latlon)
+    for _, data in road_network.nodes(data=True):
+        data['coords'] = np.array([data['x'], data['y']])
+    network = LoadedNetwork(
+        (lat, lng), distance_m, road_network_latlon, road_network,
+        distance_field=generator._build_distance_field(road_network),
+    )
+
+    def fetch_disabled(center_lat: float, center_lon: float, distance_m: int):
+        raise ValueError(f"負荷試験の道路網の範囲外です: ({center_lat}, {center_lon}) {distance_m}m")
+
+    generator._fetch_road_network = fetch_disabled
+    with generator._network_lock:
+        generator.memory_networks.add(network)
+        generator.memory_networks.set_pinned(network.id, True)
+        generator._activate_network(network)
+    return network
+
+
+def serve(port: int):
+    """固定の道路網を読み込んだアプリを起動する（環境変数 DATABASE_URL などは起動元で設定する）"""
+    import uvicorn
+    from backend import routing
+    from backend.main import app
+
+    install_fixture_network(routing.get_generator())
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(work_dir: str, port: int) -> subprocess.Popen:
+    """一時ディレクトリの DB と道路ネットワークのキャッシュを使うサーバーを起動する（ログは server.log）"""
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(work_dir, 'load_test.db')}",
+        DB_AUTO_MIGRATE="1",
+        ROUTING_WARMUP="0",
+        NETWORK_CACHE_DIR=os.path.join(work_dir, "network_cache"),
+        PYTHONUNBUFFERED="1",
+    )
+    env.pop("ASYNC_DATABASE_URL", None)
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "backend.benchmarks.load_test", "--serve", "--port", str(port)],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+# ------------------------------------------------------------
+# リクエストの作成と送信
+# ------------------------------------------------------------
+class Sample(NamedTuple):
+    operation: str
+    status: int  # 接続エラーやタイムアウトは 0
+    latency_s: float
+    measured: bool  # ウォームアップ中のリクエストは False
+
+
+def drawing_shapes() -> List[List[Dict[str, float]]]:
+    """手書きの図形（ディスプレイ座標）: 円、ハート、星"""
+    t = np.linspace(0, 2 * np.pi, 120)
+    circle = np.column_stack((150 + 100 * np.cos(t), 150 + 100 * np.sin(t)))
+    heart = np.column_stack((16 * np.sin(t) ** 3, -(13 * np.cos(t) - 5 * np.cos(2 * t) - 2 * np.cos(3 * t) - np.cos(4 * t))))
+    heart = 150 + heart * 7
+    star_angles = np.radians(np.arange(0, 360 * 2 + 1, 144))
+    star = np.column_stack((150 + 100 * np.sin(star_angles), 150 - 100 * np.cos(star_angles)))
+    return [[{"x": x, "y": y} for x, y in shape.tolist()] for shape in (circle, heart, star)]
+
+
+def random_route(rng: random.Random, lat: float, lng: float, num_points: int = 200) -> List[Dict[str, float]]:
+    """(lat, lng) から始まる折れ線の経路（コース一覧のデータ用）"""
+    points = []
+    for _ in range(num_points):
+        points.append({"lat": lat, "lng": lng})
+        lat += rng.uniform(-2e-4, 2e-4)
+        lng += rng.uniform(-2e-4, 2e-4)
+    return points
+
+
+def random_start(rng: random.Random) -> Dict[str, float]:
+    return {
+        "lat": FIXTURE_LAT + rng.uniform(-START_JITTER_DEG, START_JITTER_DEG),
+        "lng": FIXTURE_LNG + rng.uniform(-START_JITTER_DEG, START_JITTER_DEG),
+    }
+
+
+async def create_users(client, rng: random.Random, num_users: int, courses_per_user: int) -> Dict[str, List[str]]:
+    """ユーザーとコースを作成し、{user_id: [course_id, ...]} を返す"""
+    users = {}
+    for _ in range(num_users):
+        response = await client.post("/users")
+        response.raise_for_status()
+        user_id = response.json()["user_id"]
+        courses = []
+        for _ in range(courses_per_user):
+            start = random_start(rng)
+            courses.append({
+                "total_distance_km": round(rng.uniform(1, 10), 1),
+                "route_points": random_route(rng, start["lat"], start["lng"]),
+                "drawing_points": [],
+                "is_favorite": rng.random() < 0.2,
+            })
+        response = await client.post(f"/users/{user_id}/courses/bulk", json={"courses": courses})
+        response.raise_for_status()
+        users[user_id] = response.json()["course_ids"]
+    return users
+
+
+def make_request(operation: str, rng: random.Random, users: Dict[str, List[str]], shapes) -> tuple:
+    """操作に対応するリクエスト (method, url, body) を作る"""
+    user_id = rng.choice(list(users))
+    if operation == "calculate":
+        body = {
+            "drawing_display_points": rng.choice(shapes),
+            "start_location": random_start(rng),
+            "target_distance_km": rng.choice((2.0, 3.0, 4.0)),
+        }
+        return "POST", "/routes/calculate", body
+    if operation == "notice":
+        return "POST", "/routes/calculate-notice", {"start_location": random_start(rng), "target_distance_km": 3.0}
+    if operation == "list":
+        start = random_start(rng)
+        params = f"current_lat={start['lat']}&current_lng={start['lng']}&sort_by={rng.choice(COURSE_SORT_OPTIONS)}&limit=20"
+        return "GET", f"/users/{user_id}/courses?{params}", None
+    if operation == "favorite":
+        return "POST", f"/users/{user_id}/courses/{rng.choice(users[user_id])}/toggle_favorite", None
+    raise ValueError(f"unknown operation: {operation}")
+
+
+async def send(client, operation: str, request: tuple, scheduled: float, measured: bool) -> Sample:
+    import httpx
+
+    method, url, body = request
+    try:
+        response = await client.request(method, url, json=body)
+        status = response.status_code
+    except httpx.HTTPError:
+        status = 0
+    return Sample(operation, status, time.perf_counter() - scheduled, measured)
+
+
+async def run_load(client, users, mix: Dict[str, float], rps: float, duration_s: float, warmup_s: float,
+                   seed: int) -> tuple:
+    """
+    mix の比率で操作を選び、1/rps 秒ごとにリクエストを送る（レスポンスを待たない）。
+    (全リクエストの Sample のリスト, 計測した区間の秒数) を返す。
+    """
+    rng = random.Random(seed)
+    shapes = drawing_shapes()
+    operations, weights = zip(*mix.items())
+    total = int((warmup_s + duration_s) * rps)
+    tasks = []
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        operation = rng.choices(operations, weights)[0]
+        request = make_request(operation, rng, users, shapes)
+        tasks.append(asyncio.create_task(send(client, operation, request, scheduled, i / rps >= warmup_s)))
+    samples = await asyncio.gather(*tasks)
+    return samples, time.perf_counter() - start - warmup_s
+
+
+# ------------------------------------------------------------
+# 集計と表示
+# ------------------------------------------------------------
+def summarize(samples: List[Sample], elapsed_s: float) -> Dict[str, Dict]:
+    """操作ごと（と全体 "all"）のレイテンシ[ms]、エラー数、スループット[リクエスト/秒]"""
+    measured = [sample for sample in samples if sample.measured]
+    groups = {operation: [s for s in measured if s.operation == operation] for operation in OPERATIONS}
+    groups["all"] = measured
+    summary = {}
+    for operation, group in groups.items():
+        if not group:
+            continue
+        latencies_ms = np.array([sample.latency_s for sample in group]) * 1000
+        errors = sum(1 for sample in group if not 200 <= sample.status < 400)
+        summary[operation] = {
+            "count": len(group),
+            "errors": errors,
+            "statuses": {str(status): count for status, count in sorted(Counter(s.status for s in group).items())},
+            "throughput_rps": (len(group) - errors) / elapsed_s,
+            "mean_ms": float(latencies_ms.mean()),
+            **{f"p{p}_ms": float(value) for p, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES))},
+            "max_ms": float(latencies_ms.max()),
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict]):
+    print(f"{'operation':>10}{'count':>8}{'errors':>8}{'rps':>8}{'mean':>9}"
+          + "".join(f"{f'p{p}':>9}" for p in PERCENTILES) + f"{'max':>9}  [ms]")
+    for operation, row in summary.items():
+        print(f"{operation:>10}{row['count']:>8}{row['errors']:>8}{row['throughput_rps']:>8.1f}{row['mean_ms']:>9.1f}"
+              + "".join(f"{row[f'p{p}_ms']:>9.1f}" for p in PERCENTILES) + f"{row['max_ms']:>9.1f}")
+    errors = {operation: row["statuses"] for operation, row in summary.items() if row["errors"] and operation != "all"}
+    for operation, statuses in errors.items():
+        print(f"  {operation} のステータスコード: {statuses}")
+
+
+def print_comparison(before: Dict, after: Dict):
+    """2つの結果のレイテンシとスループットを操作ごとに比較する（変化率は after / before - 1）"""
+    print(f"before: {before.get('commit') or '-'} {before['created_at']}")
+    print(f"after:  {after.get('commit') or '-'} {after['created_at']}")
+    metrics = ["throughput_rps", *(f"p{p}_ms" for p in PERCENTILES)]
+    print(f"{'operation':>10}{'metric':>16}{'before':>10}{'after':>10}{'change':>9}")
+    for operation in [*OPERATIONS, "all"]:
+        if operation not in before["summary"] or operation not in after["summary"]:
+            continue
+        for metric in metrics:
+            old, new = before["summary"][operation][metric], after["summary"][operation][metric]
+            change = f"{(new / old - 1) * 100:>+8.1f}%" if old else f"{'-':>9}"
+            print(f"{operation:>10}{metric:>16}{old:>10.1f}{new:>10.1f}{change}")
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(values: List[str]) -> Dict[str, float]:
+    mix = {}
+    for value in values:
+        operation, _, weight = value.partition("=")
+        if operation not in OPERATIONS or not weight:
+            raise argparse.ArgumentTypeError(f"--mix は {'|'.join(OPERATIONS)}=比率 の形式で指定してください: {value}")
+        if float(weight) > 0:
+            mix[operation] = float(weight)
+    if not mix:
+        raise argparse.ArgumentTypeError("--mix に比率が正の操作がありません")
+    return mix
+
+
+# ------------------------------------------------------------
+# 実行
+# ------------------------------------------------------------
+async def wait_until_ready(client, server: subprocess.Popen, log_path: str, timeout_s: float = 120):
+    import httpx
+
+    deadline = time.perf_counter() + timeout_s
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            with open(log_path) as log:
+                raise RuntimeError(f"サーバーが終了しました:\n{log.read()[-2000:]}")
+        try:
+            if (await client.get("/api/message")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"サーバーが {timeout_s:.0f} 秒以内に起動しませんでした（ログ: {log_path}）")
+
+
+async def load_test(args, mix: Dict[str, float]) -> Dict:
+    import httpx
+
+    with tempfile.TemporaryDirectory(prefix="gpsart-load-") as work_dir:
+        port = free_port()
+        server = start_server(work_dir, port)
+        limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                         timeout=args.timeout) as client:
+                print("サーバーを起動しています（固定の道路網を読み込みます）...")
+                await wait_until_ready(client, server, os.path.join(work_dir, "server.log"))
+                users = await create_users(client, random.Random(args.seed), args.users, args.courses_per_user)
+                print(f"{args.users} ユーザー（各 {args.courses_per_user} コース）を作成しました。"
+                      f"{args.rps} リクエスト/秒で {args.warmup + args.duration} 秒間送信します"
+                      f"（最初の {args.warmup} 秒は集計しない）。")
+                samples, elapsed_s = await run_load(client, users, mix, args.rps, args.duration, args.warmup, args.seed)
+        finally:
+            stop_server(server)
+
+    return {
+        "commit": current_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "rps": args.rps, "duration_s": args.duration, "warmup_s": args.warmup, "mix": mix,
+            "users": args.users, "courses_per_user": args.courses_per_user, "seed": args.seed,
+            "max_connections": args.max_connections,
+        },
+        "elapsed_s": elapsed_s,
+        "summary": summarize(samples, elapsed_s),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP の負荷試験（固定の道路網と一時DBを使う）")
+    parser.add_argument("--rps", type=float, default=10, help="目標のリクエスト数/秒")
+    parser.add_argument("--duration", type=float, default=30, help="計測する秒数")
+    parser.add_argument("--warmup", type=float, default=5, help="計測前に同じ負荷をかける秒数（集計しない）")
+    parser.add_argument("--mix", nargs="+", default=[f"{op}={weight}" for op, weight in DEFAULT_MIX.items()],
+                        help="操作の比率（例: calculate=1 notice=1 list=6 favorite=2）")
+    parser.add_argument("--users", type=int, default=20, help="作成するユーザー数")
+    parser.add_argument("--courses-per-user", type=int, default=20, help="ユーザーごとに作成するコース数")
+    parser.add_argument("--max-connections", type=int, default=100, help="同時に開く接続数の上限")
+    parser.add_argument("--timeout", type=float, default=60, help="リクエストのタイムアウト（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="リクエストの内容と順序の乱数シード")
+    parser.add_argument("--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="保存した2つの結果を比較する")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+    if args.compare:
+        before, after = (json.load(open(path)) for path in args.compare)
+        print_comparison(before, after)
+        return
+
+    try:
+        mix = parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    result = asyncio.run(load_test(args, mix))
+    print_summary(result["summary"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
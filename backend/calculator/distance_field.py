@@ -0,0 +1,142 @@
+"""
+道路ネットワークの距離場（ディスタンスフィールド）
+
+投影座標系(UTM)の道路ネットワークを一定間隔の格子にラスタ化し、各セルから最も近い道路（エッジ上の点を含む）
+までの距離（メートル）を距離変換で事前に計算しておく。形状の任意の回転・平行移動について、
+各点から道路までの距離を格子の双線形補間で一括に求められる。
+
+距離場はネットワークと一緒にディスクキャッシュに保存し、領域ごとに一度だけ計算する。
+"""
+from typing import NamedTuple
+
+import numpy as np
+from scipy import ndimage
+
+from .geometry import PointsLike, as_points
+
+# 格子の間隔（メートル）の既定値と、1辺のセル数の上限（広い範囲では間隔を広げてメモリを抑える）
+DEFAULT_RESOLUTION_M = 10.0
+MAX_CELLS_PER_SIDE = 2048
+
+
+class DistanceField(NamedTuple):
+    origin_x: float
+    origin_y: float
+    resolution: float
+    # values[row, col] はセル (origin_x + col * resolution, origin_y + row * resolution) から道路までの距離
+    values: np.ndarray
+
+    def lookup(self, points: PointsLike) -> np.ndarray:
+        """
+        点（(..., 2) の配列、UTM）から最も近い道路までの距離（メートル）を双線形補間で求めます。
+        格子の外の点は、格子の端の値に格子からはみ出した距離を加えます。
+        """
+        points = np.asarray(points, dtype=np.float64)
+        rows, cols = self.values.shape
+        gx = (points[..., 0] - self.origin_x) / self.resolution
+        gy = (points[..., 1] - self.origin_y) / self.resolution
+        cx = np.clip(gx, 0, cols - 1)
+        cy = np.clip(gy, 0, rows - 1)
+        outside = np.hypot(gx - cx, gy - cy) * self.resolution
+
+        x0 = np.minimum(cx.astype(np.intp), max(cols - 2, 0))
+        y0 = np.minimum(cy.astype(np.intp), max(rows - 2, 0))
+        x1 = np.minimum(x0 + 1, cols - 1)
+        y1 = np.minimum(y0 + 1, rows - 1)
+        fx = cx - x0
+        fy = cy - y0
+
+        values = self.values
+        top = values[y0, x0] * (1 - fx) + values[y0, x1] * fx
+        bottom = values[y1, x0] * (1 - fx) + values[y1, x1] * fx
+        return top * (1 - fy) + bottom * fy + outside
+
+
+def edge_segments(road_network) -> np.ndarray:
+    """
+    道路ネットワークのエッジを線分の配列 (N, 4) = (x1, y1, x2, y2) にします。
+    エッジに geometry（折れ線）がある場合はその各線分、ない場合はノード間の直線を使います。
+    """
+    segments = []
+    for u, v, data in road_network.edges(data=True):
+        geometry = data.get("geometry")
+        if geometry is not None:
+            coords = np.asarray(geometry.coords, dtype=np.float64)
+        else:
+            coords = np.array([
+                (road_network.nodes[u]["x"], road_network.nodes[u]["y"]),
+                (road_network.nodes[v]["x"], road_network.nodes[v]["y"]),
+            ], dtype=np.float64)
+        if len(coords) >= 2:
+            segments.append(np.hstack((coords[:-1], coords[1:])))
+    if not segments:
+        return np.zeros((0, 4))
+    return np.vstack(segments)
+
+
+def rasterize_segments(segments: np.ndarray, origin_x: float, origin_y: float,
+                       resolution: float, shape) -> np.ndarray:
+    """線分が通るセルを True にした格子（bool, shape=(rows, cols)）を返します。"""
+    grid = np.zeros(shape, dtype=bool)
+    if len(segments) == 0:
+        return grid
+    starts = segments[:, :2]
+    ends = segments[:, 2:]
+    # 線分ごとにセル間隔の半分以下の間隔で点を打つ
+    lengths = np.hypot(*(ends - starts).T)
+    counts = np.maximum(np.ceil(lengths / (resolution / 2)).astype(np.intp), 1) + 1
+    segment_index = np.repeat(np.arange(len(segments)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = offsets / np.repeat(counts - 1, counts)
+    points = starts[segment_index] + (ends - starts)[segment_index] * t[:, None]
+
+    cols = np.rint((points[:, 0] - origin_x) / resolution).astype(np.intp)
+    rows = np.rint((points[:, 1] - origin_y) / resolution).astype(np.intp)
+    inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+    grid[rows[inside], cols[inside]] = True
+    return grid
+
+
+def build(road_network, resolution: float = DEFAULT_RESOLUTION_M,
+          max_cells_per_side: int = MAX_CELLS_PER_SIDE) -> DistanceField:
+    """
+    投影済みの道路ネットワークから距離場を計算します。
+    範囲はノードとエッジのバウンディングボックスで、1辺のセル数が max_cells_per_side を超える場合は間隔を広げます。
+    """
+    segments = edge_segments(road_network)
+    node_coords = np.array([(data["x"], data["y"]) for _, data in road_network.nodes(data=True)], dtype=np.float64)
+    all_points = np.vstack([node_coords.reshape(-1, 2), segments[:, :2], segments[:, 2:]])
+    if len(all_points) == 0:
+        raise ValueError("道路ネットワークにノードがありません。")
+
+    min_x, min_y = all_points.min(axis=0)
+    max_x, max_y = all_points.max(axis=0)
+    span = max(max_x - min_x, max_y - min_y)
+    resolution = max(resolution, span / (max_cells_per_side - 1))
+    shape = (int(np.ceil((max_y - min_y) / resolution)) + 1, int(np.ceil((max_x - min_x) / resolution)) + 1)
+
+    roads = rasterize_segments(segments, min_x, min_y, resolution, shape)
+    # エッジのない孤立したノードも道路として扱う
+    roads |= rasterize_segments(np.hstack((node_coords, node_coords)), min_x, min_y, resolution, shape)
+    # 道路のセルが0、それ以外のセルは最も近い道路のセルまでの距離
+    values = ndimage.distance_transform_edt(~roads) * resolution
+    return DistanceField(float(min_x), float(min_y), float(resolution), values.astype(np.float32))
+
+
+def fit_errors(field: DistanceField, shape_points: PointsLike, angles_deg: np.ndarray,
+               power: float = 4) -> np.ndarray:
+    """
+    形状を始点を中心に各角度で回転させたときの当てはまりの誤差（道路までの距離の power 乗の和）を一括で求めます。
+    """
+    shape_points = as_points(shape_points)
+    origin = shape_points[0]
+    relative = shape_points - origin
+    angles_rad = np.radians(np.asarray(angles_deg, dtype=np.float64))
+    cos, sin = np.cos(angles_rad)[:, None], np.sin(angles_rad)[:, None]
+    # (角度数, 点数, 2) の回転後の座標（geometry.rotate と同じく反時計回り）
+    rotated = np.stack((
+        relative[:, 0] * cos - relative[:, 1] * sin,
+        relative[:, 0] * sin + relative[:, 1] * cos,
+    ), axis=-1) + origin
+    distances = field.lookup(rotated)
+    return np.sum(distances.astype(np.float64) ** power, axis=1)
@@ -0,0 +1,104 @@
+"""
+描画の編集セッション
+
+描画画面で取り消しや編集をして再計算する場合、同じ編集セッション（edit_session_id）の再計算では、最初の計算で
+求めた回転角度と縮尺（ディスプレイ座標の1単位あたりのメートル）をそのまま使う。描画の変わっていない部分は
+同じ座標の区間になるため、区間の探索結果をセッションの SegmentCache から再利用し、変わった区間だけを探索する。
+開始地点または目標距離が変わった場合は新しいセッションとして計算し直す。
+
+セッションIDはサーバーが推測できない値で発行し（最初の計算のレスポンスで返す）、クライアントは再計算と
+セッションの終了にそのIDを使う。知らないID（破棄されたセッションなど）の場合は新しいIDでセッションを始める。
+区間の探索結果はセッションが最後に使ったネットワーク（LoadedNetwork）に結び付け、他のリクエストが別の
+ネットワークを読み込んでも破棄しない（セッションはネットワークを弱参照で持ち、メモリから破棄されたら読み込み直す）。
+
+セッションはプロセスのメモリに保持し、件数（EDIT_SESSION_MAX_ENTRIES）または最後に使ってからの秒数
+（EDIT_SESSION_TTL_SECONDS）が上限を超えたものから破棄する。
+"""
+import os
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .network_cache import LoadedNetwork
+from .segment_routing import SegmentCache
+
+EDIT_SESSION_MAX_ENTRIES = int(os.environ.get("EDIT_SESSION_MAX_ENTRIES", "100"))
+EDIT_SESSION_TTL_SECONDS = float(os.environ.get("EDIT_SESSION_TTL_SECONDS", "1800"))
+
+
+class EditSession:
+    """1つの描画の編集セッション（回転角度と縮尺は最初の計算で決める）"""
+
+    def __init__(self, anchor_point: tuple, target_distance_km: float):
+        self.anchor_point = tuple(anchor_point)
+        self.target_distance_km = target_distance_km
+        self.angle_deg: Optional[float] = None
+        self.meters_per_unit: Optional[float] = None
+        # 描画の単純化（RDP）の epsilon（最初の計算の描画から決める）
+        self.rdp_epsilon: Optional[float] = None
+        self.segments = SegmentCache(match_geometry=True)
+        self._network: Optional[weakref.ref] = None
+        self.last_access = time.time()
+
+    @property
+    def placed(self) -> bool:
+        """回転角度と縮尺が決まっているか（最初の計算が済んでいるか）"""
+        return self.angle_deg is not None
+
+    @property
+    def network(self) -> Optional[LoadedNetwork]:
+        """セッションが最後に使ったネットワーク（メモリから破棄された場合は None）"""
+        return self._network() if self._network is not None else None
+
+    def use_network(self, network: LoadedNetwork):
+        """network で計算する（以前と異なるネットワークの場合は区間の探索結果を空にする）"""
+        self._network = weakref.ref(network)
+        self.segments.bind(network.version)
+
+    def matches(self, anchor_point: tuple, target_distance_km: float) -> bool:
+        return self.anchor_point == tuple(anchor_point) and self.target_distance_km == target_distance_km
+
+
+class EditSessionStore:
+    """編集セッションID → EditSession（LRU、一定時間使われなかったものは破棄）"""
+
+    def __init__(self, max_entries: int = EDIT_SESSION_MAX_ENTRIES, ttl_seconds: float = EDIT_SESSION_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, EditSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def session_for(self, session_id: Optional[str], anchor_point: tuple,
+                    target_distance_km: float) -> Tuple[str, EditSession]:
+        """
+        (セッションID, セッション) を返す。session_id が None または知らないIDの場合は新しいIDでセッションを作り、
+        開始地点・目標距離が変わった場合は同じIDで新しいセッションにする。
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id) if session_id is not None else None
+            if session is None:
+                session_id = secrets.token_urlsafe(16)
+            if session is None or not session.matches(anchor_point, target_distance_km):
+                session = EditSession(anchor_point, target_distance_km)
+                self._sessions[session_id] = session
+            session.last_access = time.time()
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > max(self.max_entries, 1):
+                self._sessions.popitem(last=False)
+            return session_id, session
+
+    def remove(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        deadline = time.time() - self.ttl_seconds
+        for session_id in [sid for sid, session in self._sessions.items() if session.last_access < deadline]:
+            del self._sessions[session_id]
@@ -0,0 +1,191 @@
+"""
+形状の前処理に使う幾何計算カーネル
+
+すべての関数は (N, 2) の ndarray を受け取り、ndarray を返します。
+リスト・タプルの列を渡した場合も ndarray に変換してから処理します。
+"""
+import functools
+import heapq
+from typing import Sequence, Union
+
+import numpy as np
+
+PointsLike = Union[np.ndarray, Sequence[Sequence[float]]]
+
+EARTH_RADIUS = 6378137
+M_PER_DEG_LAT = (2 * np.pi * EARTH_RADIUS) / 360
+EARTH_MEAN_RADIUS_KM = 6371.0088
+
+
+def as_points(points: PointsLike) -> np.ndarray:
+    """座標列を (N, 2) の float64 配列に変換します。"""
+    array = np.asarray(points, dtype=np.float64)
+    if array.size == 0:
+        return array.reshape(0, 2)
+    return array.reshape(-1, 2)
+
+
+def cumulative_lengths(points: PointsLike) -> np.ndarray:
+    """始点からの累積距離（長さ N、先頭は0）を返します。"""
+    points = as_points(points)
+    if len(points) == 0:
+        return np.zeros(0)
+    segment_lengths = np.hypot(*np.diff(points, axis=0).T)
+    return np.concatenate(([0.0], np.cumsum(segment_lengths)))
+
+
+def path_length(points: PointsLike) -> float:
+    """座標列で定義されたパスの全長を返します。"""
+    points = as_points(points)
+    if len(points) < 2:
+        return 0.0
+    return float(np.sum(np.hypot(*np.diff(points, axis=0).T)))
+
+
+def resample(points: PointsLike, num_points: int) -> np.ndarray:
+    """
+    パスを弧長に沿って等間隔な num_points 個の点にリサンプリングします。
+    """
+    points = as_points(points)
+    distances = cumulative_lengths(points)
+
+    if len(points) == 0 or distances[-1] == 0:
+        return np.repeat(points[:1], num_points, axis=0)
+
+    targets = np.linspace(0.0, distances[-1], num_points)
+    return np.column_stack((
+        np.interp(targets, distances, points[:, 0]),
+        np.interp(targets, distances, points[:, 1]),
+    ))
+
+
+def scale_to_geo(points: PointsLike, anchor_lat: float, anchor_lon: float,
+                 target_length_m: float) -> np.ndarray:
+    """
+    ディスプレイ座標のパスを全長が target_length_m になるようにスケーリングし、
+    始点をアンカーに合わせた (lon, lat) の配列に変換します。
+    ディスプレイ座標は y 軸が下向きのため、y を反転して緯度に変換します。
+    """
+    points = as_points(points)
+    if len(points) == 0:
+        return points
+
+    current_length = path_length(points)
+    if current_length == 0:
+        return np.tile([anchor_lon, anchor_lat], (len(points), 1)).astype(np.float64)
+
+    scaled_meters = (points - points[0]) * (target_length_m / current_length)
+
+    m_per_deg_lon = M_PER_DEG_LAT * np.cos(np.radians(anchor_lat))
+    lon = anchor_lon + scaled_meters[:, 0] / m_per_deg_lon
+    lat = anchor_lat - scaled_meters[:, 1] / M_PER_DEG_LAT
+    return np.column_stack((lon, lat))
+
+
+def rotation_matrix(angle_deg: float) -> np.ndarray:
+    """反時計回りに angle_deg 度回転する 2x2 の回転行列を返します。"""
+    angle_rad = np.radians(angle_deg)
+    cos, sin = np.cos(angle_rad), np.sin(angle_rad)
+    return np.array([[cos, -sin], [sin, cos]])
+
+
+def rotate(points: PointsLike, angle_deg: float, origin: PointsLike = None) -> np.ndarray:
+    """
+    パスを origin（省略時は始点）を中心に angle_deg 度回転させます。
+    """
+    points = as_points(points)
+    if len(points) == 0:
+        return points
+    origin = points[0] if origin is None else np.asarray(origin, dtype=np.float64)
+    return (points - origin) @ rotation_matrix(angle_deg).T + origin
+
+
+@functools.lru_cache(maxsize=32)
+def _get_transformer(from_crs: str, to_crs: str):
+    from pyproj import Transformer
+    return Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+
+def project_points(points: PointsLike, from_crs, to_crs) -> np.ndarray:
+    """
+    (x, y) の配列を from_crs から to_crs に一括で座標変換します。
+    緯度経度の場合は (lon, lat) の順で渡します。
+    """
+    points = as_points(points)
+    if len(points) == 0:
+        return points
+    transformer = _get_transformer(str(from_crs), str(to_crs))
+    x, y = transformer.transform(points[:, 0], points[:, 1])
+    return np.column_stack((x, y))
+
+
+def haversine_km(lat: float, lng: float, lats, lngs) -> np.ndarray:
+    """
+    1点 (lat, lng) から複数点 (lats, lngs) までの大円距離(km)を一括で計算します。
+    """
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lng2 = np.radians(np.asarray(lngs, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_MEAN_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def max_radius_m(lonlat_points: PointsLike, anchor_lat: float, anchor_lon: float) -> float:
+    """
+    (lon, lat) の配列のうち、アンカーから最も遠い点までの距離（メートル）を返します。
+    アンカーを中心に回転させても変わらないため、回転後の形状がすべて収まる範囲の見積もりに使います。
+    """
+    points = as_points(lonlat_points)
+    if len(points) == 0:
+        return 0.0
+    return float(np.max(haversine_km(anchor_lat, anchor_lon, points[:, 1], points[:, 0]))) * 1000
+
+
+def _farthest_from_segment(points: np.ndarray, start: int, end: int):
+    """points[start+1:end] のうち線分 points[start]-points[end] から最も遠い点の添字と距離を返します。"""
+    a, b = points[start], points[end]
+    interior = points[start + 1:end]
+    ab = b - a
+    length_sq = float(ab @ ab)
+    if length_sq == 0:
+        # 閉じた図形などで始点と終点が一致する場合は点からの距離
+        distances = np.hypot(*(interior - a).T)
+    else:
+        t = np.clip((interior - a) @ ab / length_sq, 0.0, 1.0)
+        distances = np.hypot(*(interior - (a + t[:, None] * ab)).T)
+    index = int(np.argmax(distances))
+    return start + 1 + index, float(distances[index])
+
+
+def simplify(points: PointsLike, max_points: int, tolerance: float = 0.0) -> np.ndarray:
+    """
+    Ramer-Douglas-Peucker 法でパスを最大 max_points 点に間引きます。
+
+    誤差の大きい区間から順に分割するため、点数の上限で打ち切っても形状の特徴が残ります。
+    分割しても誤差が tolerance 以下の区間はそれ以上分割しません。始点と終点は常に残します。
+    """
+    points = as_points(points)
+    if len(points) <= 2:
+        return points.copy()
+    max_points = max(max_points, 2)
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    heap = []
+
+    def push(start: int, end: int):
+        if end - start < 2:
+            return
+        index, distance = _farthest_from_segment(points, start, end)
+        if distance > tolerance:
+            heapq.heappush(heap, (-distance, start, end, index))
+
+    push(0, len(points) - 1)
+    count = 2
+    while heap and count < max_points:
+        _, start, end, index = heapq.heappop(heap)
+        keep[index] = True
+        count += 1
+        push(start, index)
+        push(index, end)
+    return points[keep]
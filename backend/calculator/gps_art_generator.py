@@ -1,14 +1,19 @@
 import osmnx as ox
-from osmnx import projection, _errors
+from osmnx import _errors
 import networkx as nx
 import numpy as np
-from shapely.geometry import Point
 from scipy.spatial import KDTree
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional
 from simplification.cutil import simplify_coords
-import pickle
 import os
 import threading
+import time
+from ..metrics import record_stage, timed_stage, network_cache_requests_total, segment_cache_requests_total
+from . import distance_field, geometry
+from .geometry import PointsLike
+from .network_cache import NETWORK_CACHE_DIR, LoadedNetwork, NetworkDiskCache, NetworkMemoryCache
+from .edit_sessions import EditSession, EditSessionStore
+from .segment_routing import SegmentCache, SegmentRoutingPool
 
 class GPSArtGenerator:
     """
@@ -30,21 +35,48 @@ class GPSArtGenerator:
         
         self.network_type = "walk"
         self.path_length_adjustment = 0.7 # 目標距離の調整係数
+        # 目標距離に合わせる場合（fit_distance）: 許容する経路の長さの誤差の割合と最大の探索回数
+        self.distance_tolerance = 0.05
+        self.max_distance_iterations = 6
+        # 目標距離に合わせる場合に、形状の長さを目標距離の何倍まで変えるか
+        self.min_length_adjustment = 0.2
+        self.max_length_adjustment = 1.5
         self.rotation_search_steps = 360 # 経路角度探索のステップ数
         self.rotation_search_points = 200 # 角度決定のためにリサンプリングする点の数
         self.sampling_interval_m = 10.0 # C3コスト計算のサンプリング間隔（メートル）
         
-        self.cache_threshold = 0.01 # キャッシュの有効範囲(緯度経度)
-        self.cache_dir = "backend/calculator/cache"
+        # 道路ネットワークの取得範囲（中心点から東西南北のメートル）。
+        # 経路計算では形状から求め、形状が分からない場合（set_network_parameters で指定した場合など）はこの値を使う
+        self.network_distance = 4000
+        self.network_margin_m = 300 # 形状の外側に確保する余白（メートル）
+        self.network_margin_ratio = 0.1 # 形状の大きさに比例して追加する余白の割合
+        self.min_network_distance = 500
+        self.max_network_distance = 20000
+
+        self.cache_threshold = 0.01 # 同じ領域とみなす範囲(緯度経度)。ネットワーク取得のロックの単位
+        self.cache_dir = NETWORK_CACHE_DIR
         self._network_lock = threading.Lock()
         
-        # キャッシュディレクトリが存在しない場合は作成
-        os.makedirs(self.cache_dir, exist_ok=True)
+        # 道路ネットワークのディスクキャッシュ（サイズと件数の上限を超えたら古いものから削除）
+        self.network_cache = NetworkDiskCache(self.cache_dir)
+        # メモリに読み込んだネットワーク（固定したもの以外は上限を超えたら古いものから破棄）
+        self.memory_networks = NetworkMemoryCache()
 
-        # 現在アクティブなネットワークデータ
+        # 最後に読み込んだ（アクティブな）ネットワークデータ。管理APIの一覧と get_road_network で使う
+        # （経路計算は _load_road_network が返したネットワークを使い、これらの属性は参照しない）
         self._road_network = None
         self._road_network_latlon = None
         self._anchor_point = None
+        self._network_distance = None
+        self._distance_field = None
+        # アクティブなネットワークの LoadedNetwork.version（管理APIの一覧でアクティブなものを示す）
+        self._network_version = 0
+
+        # 区間ごとの経路探索を並列に行うワーカープロセス（SEGMENT_ROUTING_WORKERS が 2 以上の場合）
+        self.segment_routing = SegmentRoutingPool()
+
+        # 描画の編集セッション（同じセッションの再計算では回転角度と縮尺を固定し、区間の探索結果を再利用する）
+        self.edit_sessions = EditSessionStore()
 
     def get_road_network(self):
         """投影された道路ネットワーク(UTM)を返します。"""
@@ -76,256 +108,335 @@ class GPSArtGenerator:
         
         Args:
             network_type (str): ネットワークタイプ ("walk", "drive", "bike" など)
-            distance (int): 取得範囲（メートル）
+            distance (int): 形状が分からない場合の取得範囲（メートル）
         """
         if network_type is not None:
             self.network_type = network_type
         if distance is not None:
             self.network_distance = distance
 
-    def _load_road_network(self, center_lat: float, center_lon: float, force_reload: bool = False):
+    def _network_distance_for_radius(self, radius_m: float) -> int:
+        """
+        中心点から radius_m 以内の形状を描くのに必要な取得範囲（メートル）を返します。
+        キャッシュを再利用しやすいよう100メートル単位に切り上げます。
+        """
+        distance = radius_m * (1 + self.network_margin_ratio) + self.network_margin_m
+        distance = int(np.ceil(distance / 100) * 100)
+        if distance > self.max_network_distance:
+            print(f"警告: 必要な取得範囲 {distance}m が上限を超えるため {self.max_network_distance}m に制限します。")
+        return int(np.clip(distance, self.min_network_distance, self.max_network_distance))
+
+    def _estimate_network_distance(self, target_distance_km: float) -> int:
+        """
+        形状が分からない場合（事前読み込み）に、目標距離から取得範囲を見積もります。
+        始点を通る円を描く場合の始点から最も遠い点までの距離（円の直径）を形状の大きさとして見積もります。
+        """
+        path_length_m = target_distance_km * self.path_length_adjustment * 1000
+        return self._network_distance_for_radius(path_length_m / np.pi)
+
+    def _activate_network(self, network: LoadedNetwork):
+        """ネットワークをアクティブにします。呼び出し元で `_network_lock` を取得している必要があります。"""
+        self._anchor_point = network.anchor_point
+        self._road_network_latlon = network.road_network_latlon
+        self._road_network = network.road_network
+        self._network_distance = network.distance_m
+        self._distance_field = network.distance_field
+        self._network_version = network.version
+
+    def _load_cached_network(self, center_lat: float, center_lon: float, distance_m: int) -> Optional[LoadedNetwork]:
+        """
+        指定された範囲をすべて含むキャッシュファイルを探し、見つかればアクティブなネットワークとして読み込みます。
+        呼び出し元で `_network_lock` を取得している必要があります。
+
+        Returns:
+            キャッシュから読み込んだネットワーク（見つからなければ None）
+        """
+        with timed_stage("cache_lookup"):
+            cached_data = self.network_cache.find(center_lat, center_lon, distance_m)
+        if cached_data is None:
+            return None
+
+        network = LoadedNetwork(
+            cached_data['anchor_point'], cached_data['distance_m'],
+            cached_data['road_network_latlon'], cached_data['road_network'],
+            distance_field=cached_data.get('distance_field'),
+            cache_path=cached_data['path'],
+            build_seconds=self.network_cache.metadata(cached_data['path']).get('build_seconds'),
+        )
+        if network.distance_field is None:
+            # 距離場を保存していなかった頃のキャッシュは、距離場を計算して保存し直す
+            network.distance_field = self._build_distance_field(network.road_network)
+            self.memory_networks.add(network)
+            self._store_network(network, replace_path=cached_data['path'])
+        else:
+            self.memory_networks.add(network)
+        self._activate_network(network)
+        return network
+
+    def _build_distance_field(self, road_network) -> distance_field.DistanceField:
+        """ネットワークの距離場を計算します。"""
+        print("道路ネットワークの距離場を計算中...")
+        with timed_stage("distance_field"):
+            return distance_field.build(road_network)
+
+    def _store_network(self, network: LoadedNetwork, replace_path: str = None):
+        """
+        ネットワークを距離場やメタデータと一緒にキャッシュに保存します（上限を超えた場合は古いキャッシュを削除する）。
+        メモリにあるネットワークのファイルは削除しません。replace_path が保存先と異なる場合は、そのファイルを削除します。
+        """
+        cache_data = {
+            'anchor_point': network.anchor_point,
+            'road_network_latlon': network.road_network_latlon,
+            'road_network': network.road_network,
+            'distance_field': network.distance_field,
+        }
+        metadata = {
+            'node_count': network.road_network.number_of_nodes(),
+            'edge_count': network.road_network.number_of_edges(),
+            'build_seconds': network.build_seconds,
+            'network_type': self.network_type,
+        }
+        try:
+            path = self.network_cache.store(
+                *network.anchor_point, network.distance_m, cache_data,
+                protected=self.memory_networks.cache_paths(), metadata=metadata,
+            )
+        except Exception as e:
+            print(f"キャッシュファイルの保存に失敗しました: {e}")
+            return
+        if replace_path is not None and replace_path != path:
+            self.network_cache.remove(replace_path)
+        network.cache_path = path
+
+    def _load_road_network(self, center_lat: float, center_lon: float, force_reload: bool = False,
+                           distance_m: int = None) -> LoadedNetwork:
         """
         指定された中心点の周囲の道路ネットワークを取得・投影します。
+        メモリ上のネットワークやキャッシュが指定された範囲をすべて含む場合はそれを再利用します。
         この処理はスレッドセーフです。
+
+        経路計算では返したネットワークを最後まで使います（他のリクエストが別のネットワークを読み込んで
+        アクティブなネットワークが変わっても、計算の途中でネットワークが入れ替わらないようにするため）。
         
         Args:
             center_lat (float): 中心点の緯度
             center_lon (float): 中心点の経度
             force_reload (bool): 既存のキャッシュを無視して強制的に再取得するか
+            distance_m (int): 取得範囲（中心点から東西南北のメートル）。省略時は network_distance
+
+        Returns:
+            LoadedNetwork: 読み込んだネットワーク
         """
+        if distance_m is None:
+            distance_m = self.network_distance
         with self._network_lock:
-            if not force_reload:
-                # 既存のキャッシュファイルを検索
-                for filename in os.listdir(self.cache_dir):
-                    if filename.startswith("network_") and filename.endswith(".pkl"):
-                        try:
-                            parts = filename.replace("network_", "").replace(".pkl", "").split('_')
-                            cached_lat, cached_lon = float(parts[0]), float(parts[1])
-                            
-                            if abs(cached_lat - center_lat) < self.cache_threshold and \
-                               abs(cached_lon - center_lon) < self.cache_threshold:
-                                
-                                cache_filepath = os.path.join(self.cache_dir, filename)
-                                print(f"キャッシュヒット: {cache_filepath} のデータを読み込みます。")
-                                try:
-                                    with open(cache_filepath, 'rb') as f:
-                                        cached_data = pickle.load(f)
-                                    
-                                    self._anchor_point = cached_data['anchor_point']
-                                    self._road_network_latlon = cached_data['road_network_latlon']
-                                    self._road_network = cached_data['road_network']
-                                    return
-                                except (pickle.UnpicklingError, EOFError, KeyError) as e:
-                                    print(f"キャッシュファイルの読み込みに失敗しました: {e}。ファイルを削除します。")
-                                    try:
-                                        os.remove(cache_filepath)
-                                    except Exception as remove_error:
-                                        print(f"キャッシュファイルの削除に失敗しました: {remove_error}")
-                                    continue # 次のキャッシュファイルを試す
-                        except (ValueError, IndexError):
-                            # ファイル名が期待したフォーマットでない場合は無視
-                            continue
-
-            # キャッシュにない、またはforce_reload=Trueの場合
-            print("道路ネットワークデータを新規に取得中...")
-            
-            # ファイル名用に緯度経度をフォーマット
-            lat_str = f"{center_lat:.4f}"
-            lon_str = f"{center_lon:.4f}"
-            cache_filename = f"network_{lat_str}_{lon_str}.pkl"
-            cache_filepath = os.path.join(self.cache_dir, cache_filename)
-            
-            current_anchor = (center_lat, center_lon)
-            
-            try:
+            network = None if force_reload else self.memory_networks.find(center_lat, center_lon, distance_m)
+            if network is not None:
+                self._activate_network(network)
+                network_cache_requests_total.inc(result="hit")
+                return network
+            network = None if force_reload else self._load_cached_network(center_lat, center_lon, distance_m)
+            if network is not None:
+                network_cache_requests_total.inc(result="hit")
+                return network
+
+            # 同じ領域を他のプロセスが取得中の場合はロックを待ち、保存されたキャッシュを読み込む
+            with self.network_cache.build_lock(center_lat, center_lon, self.cache_threshold):
+                network = None if force_reload else self._load_cached_network(center_lat, center_lon, distance_m)
+                if network is not None:
+                    network_cache_requests_total.inc(result="waited")
+                    return network
+                network_cache_requests_total.inc(result="miss")
+                return self._fetch_road_network(center_lat, center_lon, distance_m)
+
+    def _fetch_road_network(self, center_lat: float, center_lon: float, distance_m: int) -> LoadedNetwork:
+        """
+        道路ネットワークを新規に取得・投影し、アクティブなネットワークとしてキャッシュに保存します。
+        呼び出し元で `_network_lock` と領域のロックを取得している必要があります。
+        """
+        # キャッシュにない、またはforce_reload=Trueの場合
+        print(f"道路ネットワークデータを新規に取得中（範囲: {distance_m}m）...")
+        
+        current_anchor = (center_lat, center_lon)
+        build_start = time.perf_counter()
+        
+        try:
+            with timed_stage("graph_fetch"):
                 road_network_latlon = ox.graph_from_point(
                     current_anchor, 
-                    dist=self.network_distance, 
+                    dist=distance_m, 
                     network_type=self.network_type
                 )
-            except _errors.InsufficientResponseError as e:
-                print(f"エラー: 指定された座標({center_lat}, {center_lon})周辺に道路データが見つかりませんでした。")
-                raise ValueError("指定された場所の近くに道路が見つかりませんでした。") from e
+        except _errors.InsufficientResponseError as e:
+            print(f"エラー: 指定された座標({center_lat}, {center_lon})周辺に道路データが見つかりませんでした。")
+            raise ValueError("指定された場所の近くに道路が見つかりませんでした。") from e
 
-            print("グラフを投影中...")
+        print("グラフを投影中...")
+        with timed_stage("projection"):
             road_network = ox.project_graph(road_network_latlon)
             
             for node, data in road_network.nodes(data=True):
                 data['coords'] = np.array([data['x'], data['y']])
 
-            self._anchor_point = current_anchor
-            self._road_network_latlon = road_network_latlon
-            self._road_network = road_network
-
-            # 新しいネットワークをキャッシュに保存
-            cache_data = {
-                'anchor_point': current_anchor,
-                'road_network_latlon': road_network_latlon,
-                'road_network': road_network
-            }
-            try:
-                with open(cache_filepath, 'wb') as f:
-                    pickle.dump(cache_data, f)
-                print(f"新しいキャッシュを保存しました: {cache_filepath}")
-            except Exception as e:
-                print(f"キャッシュファイルの保存に失敗しました: {e}")
+        network = LoadedNetwork(
+            current_anchor, distance_m, road_network_latlon, road_network,
+            distance_field=self._build_distance_field(road_network),
+        )
+        network.build_seconds = time.perf_counter() - build_start
+        self.memory_networks.add(network)
+        self._activate_network(network)
+
+        # 新しいネットワークを距離場と一緒にキャッシュに保存
+        self._store_network(network)
+        return network
+
+    # ------------------------------------------------------------
+    # 管理API用の操作
+    # ------------------------------------------------------------
+    def memory_network_summaries(self) -> List[Dict]:
+        """メモリにあるネットワークの一覧（ノード・エッジ数、ヒット回数、最後に使われた日時など）"""
+        with self._network_lock:
+            return [
+                {
+                    "id": network.id,
+                    "lat": network.anchor_point[0],
+                    "lng": network.anchor_point[1],
+                    "distance_m": network.distance_m,
+                    "node_count": network.road_network.number_of_nodes(),
+                    "edge_count": network.road_network.number_of_edges(),
+                    "build_seconds": network.build_seconds,
+                    "memory_hits": network.hits,
+                    "loaded_at": network.loaded_at,
+                    "last_access": network.last_access,
+                    "pinned": network.pinned,
+                    "active": network.version == self._network_version,
+                    "cache_path": network.cache_path,
+                }
+                for network in self.memory_networks.networks()
+            ]
+
+    def pin_network(self, center_lat: float, center_lon: float, distance_m: int = None) -> str:
+        """
+        指定された範囲のネットワークを読み込み（キャッシュがなければ取得し）、メモリに固定します。
+        固定したネットワークの識別子を返します。
+        """
+        if distance_m is None:
+            distance_m = self.network_distance
+        network = self._load_road_network(center_lat, center_lon, distance_m=distance_m)
+        with self._network_lock:
+            if self.memory_networks.get(network.id) is not network:
+                # 読み込んだ直後に他のリクエストの読み込みで破棄された場合は追加し直す
+                self.memory_networks.add(network)
+            self.memory_networks.set_pinned(network.id, True)
+            print(f"ネットワークをメモリに固定しました: {network.id}")
+            return network.id
+
+    def unpin_network(self, network_id: str) -> bool:
+        """ネットワークの固定を外します（見つからない場合は False）。"""
+        with self._network_lock:
+            return self.memory_networks.set_pinned(network_id, False) is not None
 
-    def _resample_shape(self, shape_points: List[Tuple[float, float]], num_points: int) -> List[Tuple[float, float]]:
+    def evict_network(self, network_id: str, from_disk: bool = False) -> Dict[str, bool]:
+        """
+        ネットワークをメモリから破棄し、from_disk の場合はキャッシュファイルも削除します。
+        アクティブなネットワークは実行中の経路計算が使っているため、次のネットワークを読み込むまで参照が残ります。
+        """
+        with self._network_lock:
+            network = self.memory_networks.remove(network_id)
+            removed = {"memory": network is not None, "disk": False}
+            if from_disk:
+                path = self.network_cache.path_for_id(network_id)
+                if path is not None and os.path.exists(path):
+                    self.network_cache.remove(path)
+                    removed["disk"] = True
+            return removed
+
+    def rebuild_network(self, center_lat: float, center_lon: float, distance_m: int = None):
+        """キャッシュを使わずにネットワークを取得し直し、メモリとキャッシュを置き換えます（固定の状態は引き継ぎます）。"""
+        self._load_road_network(center_lat, center_lon, force_reload=True, distance_m=distance_m)
+
+    def _resample_shape(self, shape_points: PointsLike, num_points: int) -> np.ndarray:
         """
         形状のパスを等間隔の指定された数の点にリサンプリングします。
         """
-        points = np.array(shape_points)
-        segment_lengths = np.sqrt(np.sum(np.diff(points, axis=0)**2, axis=1))
-        cumulative_lengths = np.insert(np.cumsum(segment_lengths), 0, 0)
-        
-        if cumulative_lengths[-1] == 0:
-            return [tuple(points[0])] * num_points
-
-        if num_points > 1:
-            interval = cumulative_lengths[-1] / (num_points - 1)
-        else:
-            interval = 0
-        
-        new_points = []
-        segment_index = 0
-        
-        for i in range(num_points):
-            target_dist = i * interval
-            
-            while segment_index < len(segment_lengths) and target_dist > cumulative_lengths[segment_index + 1]:
-                segment_index += 1
-            
-            if segment_index >= len(segment_lengths):
-                segment_index = len(segment_lengths) - 1
+        return geometry.resample(shape_points, num_points)
 
-            dist_in_segment = target_dist - cumulative_lengths[segment_index]
-            segment_len = segment_lengths[segment_index]
-            
-            if segment_len == 0:
-                fraction = 0.0
-            else:
-                fraction = dist_in_segment / segment_len
-                
-            p1 = points[segment_index]
-            p2 = points[segment_index + 1]
-            new_point = p1 + fraction * (p2 - p1)
-            new_points.append(tuple(new_point))
-            
-        return new_points
+    def _rdp_epsilon(self, path: PointsLike, epsilon_ratio: float) -> float:
+        """描画領域のバウンディングボックスの対角線の長さに比例した RDP の epsilon"""
+        path_np = geometry.as_points(path)
+        return float(np.linalg.norm(np.max(path_np, axis=0) - np.min(path_np, axis=0))) * epsilon_ratio
 
-    def _simplify_path_rdp(self, path: List[Tuple[float, float]], epsilon_ratio: float) -> List[Tuple[float, float]]:
+    def _simplify_path_rdp(self, path: PointsLike, epsilon_ratio: float, epsilon: float = None) -> np.ndarray:
         """
         Ramer-Douglas-Peuckerアルゴリズムを使用してパスを単純化します。
-        epsilonは描画領域の対角線の長さに比例して決定されます。
+        epsilonは描画領域の対角線の長さに比例して決定されます（epsilon を指定した場合はその値を使います）。
         """
-        if len(path) < 3:
-            return path
+        path_np = geometry.as_points(path)
+        if len(path_np) < 3:
+            return path_np
 
-        path_np = np.array(path)
-        
         # 描画領域のバウンディングボックスからepsilonを計算
         min_coords = np.min(path_np, axis=0)
         max_coords = np.max(path_np, axis=0)
         diagonal_length = np.linalg.norm(max_coords - min_coords)
         
         if diagonal_length == 0:
-            return [path[0]]
+            return path_np[:1]
 
-        epsilon = diagonal_length * epsilon_ratio
+        if epsilon is None:
+            epsilon = diagonal_length * epsilon_ratio
         
-        simplified_path = simplify_coords(path_np, epsilon)
+        simplified_path = np.asarray(simplify_coords(path_np, epsilon), dtype=np.float64)
         
         # 少なくとも2点は残す
-        if len(simplified_path) < 2 and len(path) >= 2:
-            return [path[0], path[-1]]
+        if len(simplified_path) < 2:
+            return path_np[[0, -1]]
 
-        return [tuple(p) for p in simplified_path]
+        return simplified_path
 
-    def _calculate_path_length(self, path: List[Tuple[float, float]]) -> float:
+    def _calculate_path_length(self, path: PointsLike) -> float:
         """座標リストで定義されたパスの全長を計算します。"""
-        length = 0
-        for i in range(len(path) - 1):
-            p1 = np.array(path[i])
-            p2 = np.array(path[i+1])
-            length += np.linalg.norm(p2 - p1)
-        return length
-
-    def _create_scaled_geo_path(self, raw_path: List[Tuple[float, float]], 
+        return geometry.path_length(path)
+
+    def _create_scaled_geo_path(self, raw_path: PointsLike, 
                                anchor_lat: float, anchor_lon: float, 
-                               target_path_km: float) -> List[Tuple[float, float]]:
+                               target_path_km: float) -> np.ndarray:
         """
         生の座標パスを、指定されたパス長になるようにスケーリングし、
-        アンカーポイントを基準に地理座標に変換します。
+        アンカーポイントを基準に地理座標 (lon, lat) に変換します。
         """
-        if not raw_path:
-            return []
-
-        target_path_meters = target_path_km * 1000
-        current_path_length = self._calculate_path_length(raw_path)
-        
-        if current_path_length == 0:
-            return [(anchor_lon, anchor_lat)] * len(raw_path)
-
-        scale_factor = target_path_meters / current_path_length
-
-        scaled_path_meters = []
-        anchor_point_raw = np.array(raw_path[0])
-        for point in raw_path:
-            scaled_point = (np.array(point) - anchor_point_raw) * scale_factor
-            scaled_path_meters.append(scaled_point)
-
-        EARTH_RADIUS = 6378137
-        m_per_deg_lat = (2 * np.pi * EARTH_RADIUS) / 360
-        m_per_deg_lon = m_per_deg_lat * np.cos(np.radians(anchor_lat))
+        return geometry.scale_to_geo(raw_path, anchor_lat, anchor_lon, target_path_km * 1000)
+
+    def _rotate_shape(self, shape_points: PointsLike, angle_deg: float) -> np.ndarray:
+        """形状を始点を中心に指定された角度で回転させます。"""
+        return geometry.rotate(shape_points, angle_deg)
+
+    def _project_to_utm(self, network: LoadedNetwork, lonlat_points: PointsLike) -> np.ndarray:
+        """(lon, lat) の配列を道路ネットワークの投影座標系(UTM)に変換します。"""
+        return geometry.project_points(
+            lonlat_points,
+            from_crs=network.road_network_latlon.graph['crs'],
+            to_crs=network.road_network.graph['crs']
+        )
 
-        geo_path = []
-        for x_meter, y_meter in scaled_path_meters:
-            lat_offset = -y_meter / m_per_deg_lat
-            lon_offset = x_meter / m_per_deg_lon
-            
-            lat = anchor_lat + lat_offset
-            lon = anchor_lon + lon_offset
-            geo_path.append((lon, lat))
-            
-        return geo_path
-
-    def _rotate_shape(self, shape_points: List[Tuple[float, float]], 
-                     angle_deg: float) -> List[Tuple[float, float]]:
-        """形状を指定された角度で回転させます。"""
-        angle_rad = np.radians(angle_deg)
-        rotation_matrix = np.array([
-            [np.cos(angle_rad), -np.sin(angle_rad)],
-            [np.sin(angle_rad),  np.cos(angle_rad)]
-        ])
-        
-        anchor_point = np.array(shape_points[0])
-        rotated_shape = [(rotation_matrix @ (point - anchor_point)) + anchor_point 
-                        for point in shape_points]
-        
-        return rotated_shape
+    def _project_to_latlon(self, network: LoadedNetwork, utm_points: PointsLike) -> np.ndarray:
+        """投影座標系(UTM)の配列を (lon, lat) の配列に変換します。"""
+        return geometry.project_points(
+            utm_points,
+            from_crs=network.road_network.graph['crs'],
+            to_crs=network.road_network_latlon.graph['crs']
+        )
 
-    def _find_best_rotation(self, base_shape_proj: List[np.ndarray]) -> float:
+    def _find_best_rotation(self, network: LoadedNetwork, base_shape_proj: np.ndarray) -> float:
         """
         理想形状を様々な角度で回転させ、道路網に最もフィットする角度を見つけます。
+        各点から道路（エッジ上の点を含む）までの距離を距離場から求め、全角度の誤差を一括で計算します。
         """
         print(f"最適な回転角度の探索を開始します（{self.rotation_search_steps} ステップ）...")
-        best_angle = 0
-        min_total_distance = float('inf')
-
-        all_node_coords = np.array([self._road_network.nodes[node]['coords'] 
-                                  for node in self._road_network.nodes()])
-        node_tree = KDTree(all_node_coords)
-
-        for i in range(self.rotation_search_steps):
-            angle = (360 / self.rotation_search_steps) * i
-            rotated_shape = self._rotate_shape(base_shape_proj, angle)
-            
-            distances, _ = node_tree.query(rotated_shape)
-            total_error = np.sum(distances ** 4)
-
-            if total_error < min_total_distance:
-                min_total_distance = total_error
-                best_angle = angle
+        angles = (360 / self.rotation_search_steps) * np.arange(self.rotation_search_steps)
+        errors = distance_field.fit_errors(network.distance_field, base_shape_proj, angles)
+        # 誤差が同じ場合は以前と同じく小さい角度を選ぶ
+        best_angle = float(angles[int(np.argmin(errors))])
 
         print(f"探索完了。最適な回転角度: {best_angle:.1f}度")
         return best_angle
@@ -369,11 +480,11 @@ class GPSArtGenerator:
         distances = np.linalg.norm(samples[valid_indices] - projections, axis=1)
         return np.mean(distances)
 
-    def _create_weight_function(self, segment_start: np.ndarray, segment_end: np.ndarray):
+    def _create_weight_function(self, road_network, segment_start: np.ndarray, segment_end: np.ndarray):
         """3つのコスト関数を統合した重み関数を作成します。"""
         def weight_func(u, v, d):
-            prev_coords = self._road_network.nodes[u]['coords']
-            node_coords = self._road_network.nodes[v]['coords']
+            prev_coords = road_network.nodes[u]['coords']
+            node_coords = road_network.nodes[v]['coords']
             
             c1 = self._cost_c1(node_coords, segment_end)
             c2 = self._cost_c2(prev_coords, node_coords)
@@ -382,79 +493,282 @@ class GPSArtGenerator:
             return self.alpha * c1 + self.beta * c2 + self.gamma * c3
         return weight_func
 
-    def _find_route_for_shape(self, shape_points: List[np.ndarray]) -> List:
-        """指定された形状全体を描くためのコースを探索します。"""
+    def _routing_parameters(self) -> tuple:
+        """区間の経路探索の結果を左右するコストのパラメータ（segment_router の引数）"""
+        return (self.alpha, self.beta, self.gamma, self.sampling_interval_m)
+
+    @classmethod
+    def segment_router(cls, alpha: float, beta: float, gamma: float, sampling_interval_m: float) -> "GPSArtGenerator":
+        """
+        並列探索のワーカープロセスで区間の経路探索（_dijkstra_segment）にだけ使う、コストのパラメータのみを持つ
+        インスタンスを作ります（ネットワークのキャッシュやワーカーのプールは作りません）。
+        """
+        router = cls.__new__(cls)
+        router.alpha, router.beta, router.gamma = alpha, beta, gamma
+        router.sampling_interval_m = sampling_interval_m
+        return router
+
+    def _node_index(self, network: LoadedNetwork):
+        """
+        ネットワークのノードの KDTree とノードIDのリスト。
+        ネットワークに保存し、同じネットワークでは作り直さずに使い回します。
+        """
+        if network.node_index is None:
+            node_ids = list(network.road_network.nodes())
+            node_coords = np.array([network.road_network.nodes[node]['coords'] for node in node_ids])
+            network.node_index = (KDTree(node_coords), node_ids)
+        return network.node_index
+
+    def _snap_to_nodes(self, network: LoadedNetwork, points: np.ndarray) -> List:
+        """各点に最も近いノードのIDを返します。"""
+        node_tree, node_ids = self._node_index(network)
+        _, indices = node_tree.query(points)
+        return [node_ids[index] for index in np.atleast_1d(indices)]
+
+    def _dijkstra_segment(self, network: LoadedNetwork, start_node, target_node,
+                          segment_start: np.ndarray, segment_end: np.ndarray) -> Optional[List]:
+        """区間 segment_start → segment_end を描く start_node から target_node への経路（見つからなければ None）"""
+        weight_function = self._create_weight_function(network.road_network, segment_start, segment_end)
+        try:
+            return nx.dijkstra_path(network.road_network, start_node, target_node, weight=weight_function)
+        except nx.NetworkXNoPath:
+            return None
+
+    def _route_segment(self, network: LoadedNetwork, start_node, target_node,
+                       segment_start: np.ndarray, segment_end: np.ndarray) -> Optional[List]:
+        with timed_stage("segment_routing"):
+            return self._dijkstra_segment(network, start_node, target_node, segment_start, segment_end)
+
+    def _find_route_for_shape(self, network: LoadedNetwork, shape_points: np.ndarray) -> List:
+        """
+        指定された形状全体を描くためのコースを探索します。
+
+        形状の各頂点を先にノードにスナップし、各区間をそのノード間の経路として探索してつなぎます。
+        並列探索が有効な場合は全区間を先にワーカープロセスで探索しておき、つなぐ際に始点が前の区間の
+        終点と一致しない区間（前の区間で経路が見つからなかった場合）だけを探索し直すため、結果は逐次の探索と同じです。
+        """
+        return self._find_routes_for_shapes(network, [shape_points])[0]
+
+    def _find_routes_for_shapes(self, network: LoadedNetwork, shapes: List[np.ndarray],
+                                segment_cache: Optional[SegmentCache] = None) -> List[List]:
+        """
+        複数の形状のコースを探索します（形状ごとの探索は _find_route_for_shape と同じ）。
+        並列探索が有効な場合は全形状の区間をまとめてワーカープロセスに渡します。
+
+        segment_cache を渡した場合、キャッシュにある区間は探索せずに以前の経路を使い、探索した経路を追加します。
+        """
+        if segment_cache is not None:
+            segment_cache.bind(network.version)
+        snapped = [self._snap_to_nodes(network, shape_points) for shape_points in shapes]
+
+        precomputed = [{} for _ in shapes]
+        if self.segment_routing.enabled:
+            tasks = [
+                ((k, i), snapped_nodes[i], snapped_nodes[i + 1], shape_points[i], shape_points[i + 1])
+                for k, (shape_points, snapped_nodes) in enumerate(zip(shapes, snapped))
+                for i in range(len(shape_points) - 1)
+                if snapped_nodes[i] != snapped_nodes[i + 1]
+                and (segment_cache is None or segment_cache.key(
+                    snapped_nodes[i], snapped_nodes[i + 1], shape_points[i], shape_points[i + 1]) not in segment_cache)
+            ]
+            with timed_stage("parallel_segment_routing"):
+                results = self.segment_routing.route(self, network, tasks)
+            for (k, i), (path, seconds) in results.items():
+                record_stage("segment_routing", seconds)
+                precomputed[k][i] = path
+
+        return [
+            self._join_segments(network, shape_points, snapped_nodes, shape_precomputed, segment_cache)
+            for shape_points, snapped_nodes, shape_precomputed in zip(shapes, snapped, precomputed)
+        ]
+
+    def _join_segments(self, network: LoadedNetwork, shape_points: np.ndarray, snapped_nodes: List, precomputed: Dict[int, Optional[List]],
+                       segment_cache: Optional[SegmentCache] = None) -> List:
+        """
+        各区間の経路をつないで形状全体のコースにします。
+        precomputed（区間の番号 → 並列探索した経路）にない区間、または始点が前の区間の終点と一致しない区間は探索します。
+        """
         full_route = []
-        all_node_coords = np.array([self._road_network.nodes[node]['coords'] 
-                                  for node in self._road_network.nodes()])
-        all_node_ids = list(self._road_network.nodes())
-        
-        start_idx = np.argmin(np.linalg.norm(all_node_coords - shape_points[0], axis=1))
-        start_node = all_node_ids[start_idx]
-        current_node = start_node
+        current_node = snapped_nodes[0]
         
         for i in range(len(shape_points) - 1):
-            segment_start = shape_points[i]
-            segment_end = shape_points[i+1]
-            
-            target_idx = np.argmin(np.linalg.norm(all_node_coords - segment_end, axis=1))
-            target_node = all_node_ids[target_idx]
+            target_node = snapped_nodes[i + 1]
             
             if current_node == target_node:
                 continue
-            
-            weight_function = self._create_weight_function(segment_start, segment_end)
-            
-            try:
-                path = nx.dijkstra_path(self._road_network, current_node, target_node, 
-                                      weight=weight_function)
-                
-                if not full_route:
-                    full_route.extend(path)
+
+            key = None
+            if segment_cache is not None:
+                key = segment_cache.key(current_node, target_node, shape_points[i], shape_points[i + 1])
+            if key is not None and key in segment_cache:
+                path = segment_cache.get(key)
+                segment_cache_requests_total.inc(result="hit")
+            else:
+                if i in precomputed and current_node == snapped_nodes[i]:
+                    path = precomputed[i]
                 else:
-                    full_route.extend(path[1:])
-                
-                current_node = path[-1]
-            except nx.NetworkXNoPath:
+                    # 逐次の探索、または前の区間の終点から探索し直す（並列探索した区間とつながらない場合）
+                    path = self._route_segment(network, current_node, target_node, shape_points[i], shape_points[i + 1])
+                if key is not None:
+                    segment_cache.put(key, path)
+                    segment_cache_requests_total.inc(result="miss")
+
+            if path is None:
                 print(f"  - コースが見つかりませんでした。このセグメントをスキップします。")
                 continue
+
+            if not full_route:
+                full_route.extend(path)
+            else:
+                full_route.extend(path[1:])
+            
+            current_node = path[-1]
                 
         return full_route
 
-    def _calculate_route_length_km(self, route_nodes: List) -> float:
-        """計算されたコースの全長をキロメートル単位で計算します。"""
-        if not route_nodes or len(route_nodes) < 2:
-            return 0.0
-            
+    def _fit_route_distance(self, network: LoadedNetwork, shape_proj: np.ndarray, target_distance_km: float,
+                            anchor_lat: float, anchor_lon: float):
+        """
+        コースの全長が目標距離に近づくよう、形状を始点を中心に拡大・縮小して探索し直します。
+        (形状, コースのノードのリスト, 形状の長さの倍率, コースを探索したネットワーク) を返します。
+
+        shape_proj は長さを目標距離の path_length_adjustment 倍に合わせた形状（回転済み）です。
+        形状の長さの倍率を直近2回の (倍率, コースの全長) から割線法で求め、全長の誤差が distance_tolerance 以内に
+        なるか max_distance_iterations 回探索したら、最も目標距離に近かった結果を返します。
+        読み込んだネットワークとノードのインデックスは反復の間で使い回し、始点と終点のノードが前回までと同じ区間は
+        探索せずに前回の経路を使います（倍率の変化が小さくなるほど多くの区間を再利用します）。
+        拡大した形状が network に含まれない場合は広い範囲のネットワークに切り替えるため、コースの全長と座標は
+        返したネットワークで求めてください。
+        """
+        target_m = target_distance_km * 1000
+        origin = shape_proj[0]
+        segment_cache = SegmentCache(match_geometry=False)
+        history = []
+        best = None
+        length_adjustment = self.path_length_adjustment
+        for iteration in range(self.max_distance_iterations):
+            shape = origin + (shape_proj - origin) * (length_adjustment / self.path_length_adjustment)
+            # 広い範囲のネットワークに切り替えた場合、以前の経路は使わない（SegmentCache.bind）
+            network = self._ensure_network_covers(network, shape, anchor_lat, anchor_lon)
+            route_nodes = self._find_routes_for_shapes(network, [shape], segment_cache)[0]
+            length_m = self._route_length_m(network, route_nodes)
+            error = abs(length_m - target_m) / target_m
+            print(f"  距離の調整 {iteration + 1}回目: 倍率 {length_adjustment:.3f} → {length_m / 1000:.2f}km（誤差 {error:.1%}）")
+            if best is None or error < best[0]:
+                best = (error, shape, route_nodes, length_adjustment, network)
+            if error <= self.distance_tolerance or length_m == 0:
+                break
+            history.append((length_adjustment, length_m))
+            length_adjustment = self._next_length_adjustment(history, target_m)
+            if length_adjustment is None:
+                break
+        return best[1:]
+
+    def _next_length_adjustment(self, history: List[tuple], target_m: float) -> Optional[float]:
+        """
+        (形状の長さの倍率, コースの全長) の履歴から、次に試す倍率を求めます。
+        直近2回の全長が倍率とともに増えている場合は割線法、それ以外は全長と目標距離の比で求めます。
+        既に試した倍率と同じになった場合は None（これ以上改善しない）を返します。
+        """
+        adjustment, length_m = history[-1]
+        next_adjustment = adjustment * target_m / length_m
+        if len(history) >= 2:
+            previous_adjustment, previous_length_m = history[-2]
+            slope = (length_m - previous_length_m) / (adjustment - previous_adjustment)
+            if slope > 0:
+                next_adjustment = adjustment + (target_m - length_m) / slope
+        next_adjustment = float(np.clip(next_adjustment, self.min_length_adjustment, self.max_length_adjustment))
+        if any(abs(next_adjustment - tried) < 1e-3 for tried, _ in history):
+            return None
+        return next_adjustment
+
+    def _ensure_network_covers(self, network: LoadedNetwork, shape_proj: np.ndarray,
+                               anchor_lat: float, anchor_lon: float) -> LoadedNetwork:
+        """
+        network が始点を中心とする形状を含む場合はそのまま返し、含まない場合は必要な範囲のネットワークを読み込んで返します。
+        """
+        radius_m = float(np.max(np.linalg.norm(shape_proj - shape_proj[0], axis=1)))
+        distance_m = self._network_distance_for_radius(radius_m)
+        if network.covers(anchor_lat, anchor_lon, distance_m):
+            return network
+        return self._load_road_network(anchor_lat, anchor_lon, distance_m=distance_m)
+
+    def _route_length_m(self, network: LoadedNetwork, route_nodes: List) -> float:
+        """コースの全長（メートル）"""
         total_length_m = 0
         for u, v in zip(route_nodes[:-1], route_nodes[1:]):
             length = min(edge['length'] 
-                        for edge in self._road_network.get_edge_data(u, v).values())
+                        for edge in network.road_network.get_edge_data(u, v).values())
             total_length_m += length
-        
-        return round(total_length_m / 1000, 1)
+        return total_length_m
 
-    def _convert_route_to_latlon(self, route_nodes: List) -> List[Dict[str, float]]:
+    def _calculate_route_length_km(self, network: LoadedNetwork, route_nodes: List) -> float:
+        """計算されたコースの全長をキロメートル単位で計算します。"""
+        if not route_nodes or len(route_nodes) < 2:
+            return 0.0
+        return round(self._route_length_m(network, route_nodes) / 1000, 1)
+
+    def _convert_route_to_latlon(self, network: LoadedNetwork, route_nodes: List) -> List[Dict[str, float]]:
         """UTM座標系のコースを緯度経度に変換します。"""
-        route_points = []
-        for node in route_nodes:
-            x, y = self._road_network.nodes[node]['x'], self._road_network.nodes[node]['y']
-            
-            point_utm = Point(x, y)
-            point_latlon, _ = projection.project_geometry(
-                point_utm, 
-                crs=self._road_network.graph['crs'], 
-                to_crs=self._road_network_latlon.graph['crs']
-            )
-            
-            lon, lat = point_latlon.coords[0]
-            route_points.append({"lat": lat, "lng": lon})
-            
-        return route_points
+        if not route_nodes:
+            return []
+        nodes = network.road_network.nodes
+        utm_coords = np.array([(nodes[node]['x'], nodes[node]['y']) for node in route_nodes])
+        lonlat = self._project_to_latlon(network, utm_coords)
+        return [{"lat": lat, "lng": lon} for lon, lat in lonlat.tolist()]
+
+    def _prepare_drawing(self, drawing_display_points: List[Dict[str, float]],
+                         anchor_lat: float, anchor_lon: float, target_distance_km: float,
+                         edit_session: Optional[EditSession] = None):
+        """
+        手書きの座標点から、経路探索用の形状と角度探索用の形状（どちらも (lon, lat) の配列）と、
+        縮尺（ディスプレイ座標の1単位あたりのメートル）を作ります。
+        回転角度と縮尺が決まっている編集セッションでは、目標距離ではなくセッションの縮尺で変換します。
+        """
+        raw_shape_points = np.array([(point["x"], point["y"]) for point in drawing_display_points], dtype=np.float64)
+        if len(raw_shape_points) < 2:
+            raise ValueError("手書きの図形には2点以上が必要です。")
+        if target_distance_km <= 0:
+            raise ValueError("目標距離には正の値を指定してください。")
+
+        placed = edit_session is not None and edit_session.placed
+
+        # 経路探索用に形状を単純化（RDP）
+        # 編集セッションでは epsilon も固定し、描画の変わっていない部分が同じ頂点になるようにする
+        if edit_session is not None and edit_session.rdp_epsilon is None:
+            edit_session.rdp_epsilon = self._rdp_epsilon(raw_shape_points, epsilon_ratio=0.003)
+        resampled_shape = self._simplify_path_rdp(
+            raw_shape_points, epsilon_ratio=0.003, epsilon=edit_session.rdp_epsilon if edit_session else None
+        )
+        resampled_length = self._calculate_path_length(resampled_shape)
+
+        # 角度探索用に形状をリサンプリング（等間隔）
+        rotation_search_shape = self._resample_shape(raw_shape_points, self.rotation_search_points)
+
+        if placed:
+            meters_per_unit = edit_session.meters_per_unit
+            target_km = meters_per_unit * resampled_length / 1000
+            rotation_search_km = meters_per_unit * self._calculate_path_length(rotation_search_shape) / 1000
+        else:
+            target_km = rotation_search_km = target_distance_km * self.path_length_adjustment
+            meters_per_unit = target_km * 1000 / resampled_length if resampled_length > 0 else 0.0
+
+        target_shape_latlon = self._create_scaled_geo_path(
+            resampled_shape, anchor_lat, anchor_lon, target_km
+        )
+        rotation_search_latlon = self._create_scaled_geo_path(
+            rotation_search_shape, anchor_lat, anchor_lon, rotation_search_km
+        )
+        return target_shape_latlon, rotation_search_latlon, meters_per_unit
+
+    def _rounded_anchor(self, start_location: Dict[str, float]) -> tuple:
+        """開始地点を丸めたアンカー (lat, lon)（近い開始地点で道路ネットワークのキャッシュを共有するため）"""
+        return float(round(start_location["lat"], 3)), float(round(start_location["lng"], 3))
 
     def calculate_route(self, drawing_display_points: List[Dict[str, float]], 
                        start_location: Dict[str, float], 
-                       target_distance_km: float) -> Dict:
+                       target_distance_km: float, fit_distance: bool = False,
+                       edit_session_id: Optional[str] = None, start_edit_session: bool = False) -> Dict:
         """
         メインのAPI関数：手書きデータから最適なコースを計算します。
         
@@ -462,73 +776,146 @@ class GPSArtGenerator:
             drawing_display_points: 手書きの座標点 [{"x": float, "y": float}, ...]
             start_location: 開始地点 {"lat": float, "lng": float}
             target_distance_km: 目標距離（km）
+            fit_distance: コースの全長を目標距離に合わせるか（形状を拡大・縮小して探索し直す）
+            edit_session_id: 以前の計算で発行した描画の編集セッションのID。同じセッションの2回目以降の計算では、
+                最初の計算の回転角度と縮尺を使い（fit_distance は使わない）、前回までと同じ区間は探索し直さない
+                （開始地点または目標距離を変えた場合は最初の計算として扱う。知らないIDの場合は新しいセッションを始める）
+            start_edit_session: 新しい編集セッションを始めるか（edit_session_id を指定した場合は不要）
             
         Returns:
-            計算結果のDict（APIレスポンス形式）
+            計算結果のDict（APIレスポンス形式）。編集セッションを使った場合は "edit_session_id" にセッションのIDを含む
         """
-        raw_shape_points = [(point["x"], point["y"]) for point in drawing_display_points]
-        anchor_lat = float(round(start_location["lat"], 3))
-        anchor_lon = float(round(start_location["lng"], 3))
-            
-        self.network_distance = 4000
-        
-        self._load_road_network(anchor_lat, anchor_lon)
-        
-        adjusted_target_km = target_distance_km * self.path_length_adjustment
-
-        # 経路探索用に形状を単純化（RDP）
-        resampled_shape = self._simplify_path_rdp(raw_shape_points, epsilon_ratio=0.003)
-        
-        target_shape_latlon = self._create_scaled_geo_path(
-            resampled_shape, anchor_lat, anchor_lon, adjusted_target_km
-        )
-        
-        base_target_shape_proj = []
-        for lon, lat in target_shape_latlon:
-            point_proj, _ = projection.project_geometry(
-                Point(lon, lat), 
-                crs=self._road_network_latlon.graph['crs'], 
-                to_crs=self._road_network.graph['crs']
+        item = {"drawing_display_points": drawing_display_points, "target_distance_km": target_distance_km}
+        edit_session = None
+        if edit_session_id is not None or start_edit_session:
+            edit_session_id, edit_session = self.edit_sessions.session_for(
+                edit_session_id, self._rounded_anchor(start_location), target_distance_km
             )
-            base_target_shape_proj.append(np.array(point_proj.coords[0]))
-        
-        # 角度探索用に形状をリサンプリング（等間隔）
-        rotation_search_shape = self._resample_shape(raw_shape_points, self.rotation_search_points)
-        rotation_search_latlon = self._create_scaled_geo_path(
-            rotation_search_shape, anchor_lat, anchor_lon, adjusted_target_km
+        [result] = self._calculate_routes([item], start_location, fit_distance, edit_session)
+        if isinstance(result, Exception):
+            raise result
+        if edit_session is not None:
+            result["edit_session_id"] = edit_session_id
+        return result
+
+    def end_edit_session(self, edit_session_id: str) -> bool:
+        """描画の編集セッションを破棄します（なければ False）。"""
+        return self.edit_sessions.remove(edit_session_id)
+
+    def calculate_routes(self, items: List[Dict], start_location: Dict[str, float],
+                         fit_distance: bool = False) -> List[Dict]:
+        """
+        同じ開始地点から、複数の手書きデータと目標距離のコースをまとめて計算します。
+
+        道路ネットワークは全項目の形状を含む範囲で1回だけ読み込み、ノードの検索用のインデックスと
+        座標変換も全項目で共有します（fit_distance で形状を拡大して広い範囲を読み込んだ項目は、その項目だけ
+        読み込んだネットワークで全長と座標を求めます）。並列探索が有効な場合は全項目の区間をまとめてワーカープロセスで探索します。
+
+        Args:
+            items: [{"drawing_display_points": [...], "target_distance_km": float}, ...]
+            start_location: 開始地点 {"lat": float, "lng": float}
+            fit_distance: 各コースの全長を目標距離に合わせるか（calculate_route を参照）
+
+        Returns:
+            項目ごとの計算結果（items と同じ順、calculate_route と同じ形式）。
+            計算できなかった項目は {"error": メッセージ}
+        """
+        return [
+            {"error": str(result)} if isinstance(result, ValueError) else result
+            for result in self._calculate_routes(items, start_location, fit_distance)
+        ]
+
+    def _calculate_routes(self, items: List[Dict], start_location: Dict[str, float],
+                          fit_distance: bool = False, edit_session: Optional[EditSession] = None) -> List:
+        """
+        calculate_routes の本体。計算できなかった項目は結果の代わりに ValueError を返します。
+        道路ネットワークを読み込めない場合は全項目に共通のため、ValueError を送出します。
+        edit_session は1件の計算（calculate_route）でのみ指定します。
+        """
+        anchor_lat, anchor_lon = self._rounded_anchor(start_location)
+        placed = edit_session is not None and edit_session.placed
+
+        results: List = [None] * len(items)
+        prepared = {}
+        meters_per_unit = {}
+        for i, item in enumerate(items):
+            try:
+                *prepared[i], meters_per_unit[i] = self._prepare_drawing(
+                    item["drawing_display_points"], anchor_lat, anchor_lon, item["target_distance_km"], edit_session
+                )
+            except ValueError as e:
+                results[i] = e
+        if not prepared:
+            return results
+
+        # 形状は始点（アンカー）を中心に回転させるため、始点から最も遠い点までの距離に余白を加えた範囲を読み込む
+        shape_radius_m = max(
+            geometry.max_radius_m(shape, anchor_lat, anchor_lon)
+            for shapes in prepared.values() for shape in shapes
         )
-        rotation_search_proj = []
-        for lon, lat in rotation_search_latlon:
-            point_proj, _ = projection.project_geometry(
-                Point(lon, lat), 
-                crs=self._road_network_latlon.graph['crs'], 
-                to_crs=self._road_network.graph['crs']
-            )
-            rotation_search_proj.append(np.array(point_proj.coords[0]))
-        
-        best_angle = self._find_best_rotation(rotation_search_proj)
-        
-        target_shape_proj = self._rotate_shape(base_target_shape_proj, best_angle)
+        distance_m = self._network_distance_for_radius(shape_radius_m)
+        # 編集セッションでは、前回の計算のネットワークが形状を含む間はそれを使い続ける（区間の探索結果を再利用するため）
+        network = edit_session.network if edit_session is not None else None
+        if network is None or not network.covers(anchor_lat, anchor_lon, distance_m):
+            network = self._load_road_network(anchor_lat, anchor_lon, distance_m=distance_m)
+        if edit_session is not None:
+            edit_session.use_network(network)
+
+        # 全項目の形状を一括で投影座標系に変換する
+        shapes_latlon = [shape for shapes in prepared.values() for shape in shapes]
+        with timed_stage("projection"):
+            projected = self._project_to_utm(network, np.concatenate(shapes_latlon))
+        projected_shapes = iter(np.split(projected, np.cumsum([len(shape) for shape in shapes_latlon])[:-1]))
+
+        target_shapes_proj = {}
+        angles = {}
+        for i in prepared:
+            base_target_shape_proj, rotation_search_proj = next(projected_shapes), next(projected_shapes)
+            if placed:
+                angles[i] = edit_session.angle_deg
+            else:
+                with timed_stage("rotation_search"):
+                    angles[i] = self._find_best_rotation(network, rotation_search_proj)
+            target_shapes_proj[i] = self._rotate_shape(base_target_shape_proj, angles[i])
         
         print("最適な形状でコース探索を開始します。")
-        route_nodes = self._find_route_for_shape(target_shape_proj)
-        
-        total_distance_km = self._calculate_route_length_km(route_nodes)
-        route_points = self._convert_route_to_latlon(route_nodes)
-        
-        rotated_drawing_points_latlon = []
-        for point_utm_coords in target_shape_proj:
-            point_utm = Point(point_utm_coords)
-            point_latlon, _ = projection.project_geometry(
-                point_utm,
-                crs=self._road_network.graph['crs'],
-                to_crs=self._road_network_latlon.graph['crs']
+        if fit_distance and not placed:
+            # 形状を拡大して広い範囲のネットワークを読み込んだ場合は、そのコースの全長と座標をそのネットワークで求める
+            fitted = {
+                i: self._fit_route_distance(network, shape_proj, items[i]["target_distance_km"], anchor_lat, anchor_lon)
+                for i, shape_proj in target_shapes_proj.items()
+            }
+            target_shapes_proj = {i: shape_proj for i, (shape_proj, _, _, _) in fitted.items()}
+            routes = [route_nodes for _, route_nodes, _, _ in fitted.values()]
+            route_networks = [route_network for _, _, _, route_network in fitted.values()]
+            for i, (_, _, length_adjustment, _) in fitted.items():
+                meters_per_unit[i] *= length_adjustment / self.path_length_adjustment
+        else:
+            routes = self._find_routes_for_shapes(
+                network, list(target_shapes_proj.values()),
+                edit_session.segments if edit_session is not None else None
             )
-            lon, lat = point_latlon.coords[0]
-            rotated_drawing_points_latlon.append({"lat": lat, "lng": lon})
+            route_networks = [network] * len(routes)
 
-        return {
-            "total_distance_km": total_distance_km,
-            "route_points": route_points,
-            "drawing_points": rotated_drawing_points_latlon
-        }
+        if edit_session is not None and not placed:
+            # 最初の計算で決めた回転角度と縮尺を、同じセッションの再計算で使う
+            for i in prepared:
+                if meters_per_unit[i] > 0:
+                    edit_session.angle_deg, edit_session.meters_per_unit = angles[i], meters_per_unit[i]
+
+        for (i, target_shape_proj), route_nodes, route_network in zip(target_shapes_proj.items(), routes, route_networks):
+            total_distance_km = self._calculate_route_length_km(route_network, route_nodes)
+            
+            with timed_stage("projection"):
+                route_points = self._convert_route_to_latlon(route_network, route_nodes)
+                rotated_drawing_points_latlon = [
+                    {"lat": lat, "lng": lon}
+                    for lon, lat in self._project_to_latlon(route_network, target_shape_proj).tolist()
+                ]
+
+            results[i] = {
+                "total_distance_km": total_distance_km,
+                "route_points": route_points,
+                "drawing_points": rotated_drawing_points_latlon
+            }
+        return results
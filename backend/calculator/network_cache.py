@@ -0,0 +1,481 @@
+"""
+道路ネットワークのディスクキャッシュ
+
+取得・投影した道路ネットワークを `network_<lat>_<lon>_<distance>m.pkl` として保存し、
+要求された範囲（中心点から東西南北に distance メートル）をすべて含むキャッシュがあれば再利用する。
+ファイルの合計サイズと件数に上限を設け、超えた場合は最後に使われた日時が古いものから削除する（LRU）。
+
+- 最後に使われた日時はファイルの更新日時(mtime)として記録する（読み込むたびに更新するため、
+  プロセスを再起動しても順序が保たれる）
+- メモリに読み込まれているネットワークのファイルは削除しない
+
+上限は環境変数 NETWORK_CACHE_MAX_BYTES / NETWORK_CACHE_MAX_ENTRIES で変更できる（0 で無制限）。
+
+複数のワーカープロセスが同じキャッシュディレクトリを共有できるよう、
+- 保存は一時ファイルに書き込んでから os.replace でリネームする（読み込み側が書きかけのファイルを見ない）
+- 同じ領域（threshold の格子で丸めた中心点）のネットワークを取得するプロセスは、
+  ファイルロック（build_lock）で1つに限る。他のプロセスはロックを待ち、保存されたキャッシュを読み込む
+ロックを待つ時間の上限は環境変数 NETWORK_CACHE_LOCK_TIMEOUT（秒）で変更できる。
+超えた場合はロックを取得せずに取得を進める。
+
+キャッシュファイルの横には、ノード・エッジ数や取得にかかった時間を `<ファイル名>.json` として保存する（管理API用）。
+
+メモリ上には NetworkMemoryCache で読み込んだネットワークを保持する。固定（pin）していないネットワークは
+NETWORK_MEMORY_MAX_ENTRIES 件（既定は1件、アクティブなネットワークのみ）を超えると古いものから破棄する。
+"""
+import contextlib
+import itertools
+import json
+import math
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Collection, Dict, Iterator, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックを行わない（プロセス内のロックのみ）
+    fcntl = None
+
+from .geometry import M_PER_DEG_LAT
+from ..metrics import record_stage, network_cache_bytes, network_cache_entries, network_cache_evictions_total
+
+NETWORK_CACHE_MAX_BYTES = int(os.environ.get("NETWORK_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+NETWORK_CACHE_MAX_ENTRIES = int(os.environ.get("NETWORK_CACHE_MAX_ENTRIES", "200"))
+NETWORK_CACHE_LOCK_TIMEOUT = float(os.environ.get("NETWORK_CACHE_LOCK_TIMEOUT", "300"))
+NETWORK_CACHE_DIR = os.environ.get("NETWORK_CACHE_DIR", "backend/calculator/cache")
+NETWORK_MEMORY_MAX_ENTRIES = int(os.environ.get("NETWORK_MEMORY_MAX_ENTRIES", "1"))
+
+FILE_PREFIX = "network_"
+FILE_SUFFIX = ".pkl"
+METADATA_SUFFIX = ".json"
+TEMP_PREFIX = ".tmp-"
+LOCK_DIR = ".locks"
+# 取得範囲をファイル名に含めていなかった頃のキャッシュの取得範囲（メートル）
+LEGACY_DISTANCE_M = 4000
+# この時間より古い一時ファイルは書き込み中に終了したプロセスの残骸とみなして削除する
+STALE_TEMP_SECONDS = 3600
+LOCK_POLL_SECONDS = 0.1
+# キャッシュファイルに保存する dict のキー
+DATA_KEYS = ("anchor_point", "road_network_latlon", "road_network")
+
+
+def extent_covers(
+    outer_lat: float, outer_lon: float, outer_distance_m: float,
+    inner_lat: float, inner_lon: float, inner_distance_m: float,
+) -> bool:
+    """
+    中心点 outer から東西南北に outer_distance_m の範囲が、inner の範囲をすべて含むか。
+    （osmnx の graph_from_point と同じく、中心点の周囲の正方形の範囲として比べる）
+    """
+    m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(inner_lat))
+    north_south_m = abs(outer_lat - inner_lat) * M_PER_DEG_LAT
+    east_west_m = abs(outer_lon - inner_lon) * m_per_deg_lon
+    return (
+        north_south_m + inner_distance_m <= outer_distance_m
+        and east_west_m + inner_distance_m <= outer_distance_m
+    )
+
+
+def network_id(center_lat: float, center_lon: float, distance_m: int) -> str:
+    """ネットワークの識別子（キャッシュファイル名から拡張子を除いたもの）"""
+    return NetworkDiskCache.filename(center_lat, center_lon, distance_m)[:-len(FILE_SUFFIX)]
+
+
+def metadata_path(path: str) -> str:
+    """キャッシュファイルのメタデータ（JSON）のパス"""
+    return path[:-len(FILE_SUFFIX)] + METADATA_SUFFIX if path.endswith(FILE_SUFFIX) else path + METADATA_SUFFIX
+
+
+class CacheEntry(NamedTuple):
+    path: str
+    lat: float
+    lon: float
+    distance_m: int
+    size_bytes: int
+    last_access: float
+
+
+class NetworkDiskCache:
+    """道路ネットワークのファイルキャッシュ（サイズと件数の上限付き、LRU で削除）"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = NETWORK_CACHE_MAX_BYTES,
+        max_entries: int = NETWORK_CACHE_MAX_ENTRIES,
+        lock_timeout: float = NETWORK_CACHE_LOCK_TIMEOUT,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # キャッシュファイルごとのヒット回数（このプロセスでの回数）
+        self.hits_by_path: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # 同じプロセス内のスレッドは flock で排他されないため、ロックファイルごとにスレッドのロックも持つ
+        self._build_locks = {}
+        # キャッシュディレクトリが存在しない場合は作成
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._remove_stale_temp_files()
+
+    @staticmethod
+    def filename(center_lat: float, center_lon: float, distance_m: int) -> str:
+        """中心点と取得範囲のキャッシュファイル名"""
+        return f"{FILE_PREFIX}{center_lat:.4f}_{center_lon:.4f}_{int(distance_m)}m{FILE_SUFFIX}"
+
+    @staticmethod
+    def parse_filename(filename: str) -> Optional[tuple]:
+        """キャッシュファイル名から (lat, lon, distance_m) を取り出す（フォーマットが違う場合は None）"""
+        if not (filename.startswith(FILE_PREFIX) and filename.endswith(FILE_SUFFIX)):
+            return None
+        parts = filename[len(FILE_PREFIX):-len(FILE_SUFFIX)].split("_")
+        try:
+            if len(parts) == 2:
+                return float(parts[0]), float(parts[1]), LEGACY_DISTANCE_M
+            if len(parts) == 3 and parts[2].endswith("m"):
+                return float(parts[0]), float(parts[1]), int(parts[2][:-1])
+        except ValueError:
+            pass
+        return None
+
+    def entries(self) -> List[CacheEntry]:
+        """キャッシュファイルの一覧（ファイル名が期待したフォーマットでないものは無視する）"""
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            parsed = self.parse_filename(filename)
+            if parsed is None:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+            except OSError:
+                continue
+            entries.append(CacheEntry(
+                os.path.join(self.cache_dir, filename), *parsed, stat.st_size, stat.st_mtime
+            ))
+        return entries
+
+    def find(self, center_lat: float, center_lon: float, distance_m: int) -> Optional[dict]:
+        """
+        中心点から東西南北に distance_m の範囲をすべて含むキャッシュを読み込んで返す（なければ None）。
+        候補が複数ある場合は取得範囲が最も小さい（読み込みと経路探索が速い）ものを選ぶ。
+        読み込めないファイルは削除して次の候補を試す。一覧を取得した後に他のプロセスが削除・置き換えた
+        ファイル（開けないファイル）は削除せずに次の候補を試す。
+        返した dict の "path" に読み込んだファイルのパス、"distance_m" にその取得範囲を入れる。
+        """
+        candidates = sorted(
+            (
+                entry for entry in self.entries()
+                if extent_covers(entry.lat, entry.lon, entry.distance_m, center_lat, center_lon, distance_m)
+            ),
+            key=lambda entry: entry.distance_m,
+        )
+        for entry in candidates:
+            print(f"キャッシュヒット: {entry.path} のデータを読み込みます。")
+            try:
+                with open(entry.path, "rb") as f:
+                    data = pickle.load(f)
+                missing = [key for key in DATA_KEYS if key not in data]
+                if missing:
+                    raise KeyError(missing)
+            except OSError as e:
+                print(f"キャッシュファイルを開けませんでした: {e}。次の候補を試します。")
+                continue
+            except (pickle.UnpicklingError, EOFError, KeyError) as e:
+                print(f"キャッシュファイルの読み込みに失敗しました: {e}。ファイルを削除します。")
+                self._remove(entry.path)
+                continue
+            self._touch(entry.path)
+            self.hits += 1
+            self.hits_by_path[entry.path] = self.hits_by_path.get(entry.path, 0) + 1
+            return {**data, "path": entry.path, "distance_m": entry.distance_m}
+        self.misses += 1
+        return None
+
+    def store(
+        self, center_lat: float, center_lon: float, distance_m: int, data: dict, protected: Collection[str] = (),
+        metadata: Optional[dict] = None,
+    ) -> str:
+        """
+        中心点から distance_m の範囲の data をキャッシュに保存し、上限を超えた分を削除する。
+        保存したファイルのパスを返す。保存したファイルと protected のパスは削除しない。
+        metadata はキャッシュファイルの横に JSON として保存する。
+        """
+        path = os.path.join(self.cache_dir, self.filename(center_lat, center_lon, distance_m))
+        # 同じディレクトリの一時ファイルに書き込んでからリネームする（リネームはアトミック）
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=FILE_SUFFIX, dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        print(f"新しいキャッシュを保存しました: {path}")
+        if metadata is not None:
+            try:
+                with open(metadata_path(path), "w") as f:
+                    json.dump(metadata, f)
+            except OSError as e:
+                print(f"キャッシュのメタデータの保存に失敗しました: {e}")
+        self.evict(protected=set(protected) | {path})
+        return path
+
+    def evict(self, protected: Collection[str] = ()) -> List[str]:
+        """
+        合計サイズ・件数が上限以下になるまで、最後に使われた日時が古いファイルから削除する。
+        protected のパスは削除しない。削除したファイルのパスを返す。
+        """
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda entry: entry.last_access)
+            total_bytes = sum(entry.size_bytes for entry in entries)
+            count = len(entries)
+            removed = []
+            for entry in entries:
+                over_bytes = self.max_bytes > 0 and total_bytes > self.max_bytes
+                over_entries = self.max_entries > 0 and count > self.max_entries
+                if not (over_bytes or over_entries):
+                    break
+                if entry.path in protected or not self._remove(entry.path):
+                    continue
+                total_bytes -= entry.size_bytes
+                count -= 1
+                removed.append(entry.path)
+            self.evictions += len(removed)
+            network_cache_evictions_total.inc(len(removed))
+            network_cache_bytes.set(total_bytes)
+            network_cache_entries.set(count)
+        for path in removed:
+            print(f"キャッシュの上限を超えたため削除しました: {path}")
+        return removed
+
+    def remove(self, path: str):
+        """キャッシュファイルを削除する"""
+        if self._remove(path):
+            print(f"キャッシュファイルを削除しました: {path}")
+
+    def path_for_id(self, network_id: str) -> Optional[str]:
+        """識別子のキャッシュファイルのパス（識別子のフォーマットが正しくない場合は None）"""
+        filename = network_id + FILE_SUFFIX
+        if os.path.basename(filename) != filename or self.parse_filename(filename) is None:
+            return None
+        return os.path.join(self.cache_dir, filename)
+
+    def lock_key(self, center_lat: float, center_lon: float, threshold: float) -> str:
+        """中心点を threshold の格子に丸めたロックのキー（近い中心点の取得を同じロックで排他する）"""
+        return f"{round(center_lat / threshold)}_{round(center_lon / threshold)}"
+
+    @contextlib.contextmanager
+    def build_lock(self, center_lat: float, center_lon: float, threshold: float) -> Iterator[bool]:
+        """
+        中心点の領域のネットワークを取得・保存する間、他のスレッド・プロセスの取得を待たせるロック。
+        ロックを取得できた場合は True、lock_timeout 秒待っても取得できなかった場合は False を返す
+        （その場合もブロックの処理は実行する）。
+        """
+        key = self.lock_key(center_lat, center_lon, threshold)
+        with self._lock:
+            thread_lock = self._build_locks.setdefault(key, threading.Lock())
+        start = time.monotonic()
+        deadline = start + self.lock_timeout
+        if not thread_lock.acquire(timeout=self.lock_timeout):
+            record_stage("cache_lock_wait", time.monotonic() - start)
+            print(f"キャッシュのロック({key})の待機がタイムアウトしました。ロックせずに取得します。")
+            yield False
+            return
+        try:
+            lock_dir = os.path.join(self.cache_dir, LOCK_DIR)
+            os.makedirs(lock_dir, exist_ok=True)
+            with open(os.path.join(lock_dir, f"{key}.lock"), "a") as lock_file:
+                acquired = self._acquire_file_lock(lock_file, deadline)
+                record_stage("cache_lock_wait", time.monotonic() - start)
+                if not acquired:
+                    print(f"キャッシュのロック({key})の待機がタイムアウトしました。ロックせずに取得します。")
+                try:
+                    yield acquired
+                finally:
+                    if acquired and fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            thread_lock.release()
+
+    def metadata(self, path: str) -> dict:
+        """キャッシュファイルのメタデータ（保存されていなければ空の dict）"""
+        try:
+            with open(metadata_path(path)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def stats(self) -> dict:
+        """キャッシュの件数・合計サイズ・上限と、このプロセスでのヒット・ミス・削除の回数"""
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(entry.size_bytes for entry in entries),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    @staticmethod
+    def _acquire_file_lock(lock_file, deadline: float) -> bool:
+        """deadline（time.monotonic）までファイルロックの取得を試みる"""
+        if fcntl is None:
+            return True
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(LOCK_POLL_SECONDS)
+
+    def _remove_stale_temp_files(self):
+        """書き込み中に終了したプロセスが残した一時ファイルを削除する"""
+        now = time.time()
+        for filename in os.listdir(self.cache_dir):
+            if not filename.startswith(TEMP_PREFIX):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                if now - os.path.getmtime(path) > STALE_TEMP_SECONDS:
+                    self._remove(path)
+            except OSError:
+                continue
+
+    @staticmethod
+    def _touch(path: str):
+        """最後に使われた日時として更新日時を現在時刻にする"""
+        try:
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            with contextlib.suppress(OSError):
+                os.remove(metadata_path(path))
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            print(f"キャッシュファイルの削除に失敗しました: {e}")
+            return False
+
+
+# 読み込んだネットワークごとに振る番号（並列探索のワーカープロセスの作り直しに使う）
+_network_versions = itertools.count(1)
+
+
+class LoadedNetwork:
+    """メモリに読み込んだ道路ネットワークと、その利用状況"""
+
+    def __init__(self, anchor_point: tuple, distance_m: int, road_network_latlon, road_network,
+                 distance_field=None, cache_path: Optional[str] = None, build_seconds: Optional[float] = None):
+        self.anchor_point = tuple(anchor_point)
+        self.distance_m = distance_m
+        self.road_network_latlon = road_network_latlon
+        self.road_network = road_network
+        self.distance_field = distance_field
+        # ノードの検索用インデックス (KDTree, ノードIDのリスト)。経路計算で初めて使う時に作る
+        self.node_index = None
+        self.cache_path = cache_path
+        # 取得・投影・距離場の計算にかかった時間（秒）
+        self.build_seconds = build_seconds
+        self.version = next(_network_versions)
+        self.loaded_at = time.time()
+        self.last_access = self.loaded_at
+        self.hits = 0
+        self.pinned = False
+
+    @property
+    def id(self) -> str:
+        return network_id(*self.anchor_point, self.distance_m)
+
+    def covers(self, center_lat: float, center_lon: float, distance_m: int) -> bool:
+        return extent_covers(*self.anchor_point, self.distance_m, center_lat, center_lon, distance_m)
+
+
+class NetworkMemoryCache:
+    """
+    メモリに読み込んだ道路ネットワーク（識別子ごと、LRU）。
+    固定（pin）したネットワークは件数に数えず、破棄しない。
+    呼び出し元（GPSArtGenerator）で排他すること。
+    """
+
+    def __init__(self, max_entries: int = NETWORK_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._networks: "OrderedDict[str, LoadedNetwork]" = OrderedDict()
+
+    def networks(self) -> List[LoadedNetwork]:
+        return list(self._networks.values())
+
+    def get(self, network_id: str) -> Optional[LoadedNetwork]:
+        return self._networks.get(network_id)
+
+    def cache_paths(self) -> set:
+        """メモリにあるネットワークのキャッシュファイル（ディスクキャッシュの削除対象から外す）"""
+        return {network.cache_path for network in self._networks.values() if network.cache_path}
+
+    def find(self, center_lat: float, center_lon: float, distance_m: int, record: bool = True) -> Optional[LoadedNetwork]:
+        """
+        指定された範囲をすべて含むネットワークのうち取得範囲が最も小さいものを返す。
+        record の場合は使われたものとして記録する（ヒット回数・最後に使われた日時・LRU の順序）。
+        """
+        candidates = [
+            network for network in self._networks.values() if network.covers(center_lat, center_lon, distance_m)
+        ]
+        if not candidates:
+            return None
+        network = min(candidates, key=lambda candidate: candidate.distance_m)
+        if record:
+            network.hits += 1
+            network.last_access = time.time()
+            self._networks.move_to_end(network.id)
+        return network
+
+    def add(self, network: LoadedNetwork) -> List[LoadedNetwork]:
+        """
+        ネットワークを追加し（同じ識別子のものは置き換え、固定の状態を引き継ぐ）、
+        固定していないものが上限を超えた分を古いものから破棄する。破棄したネットワークを返す。
+        """
+        previous = self._networks.pop(network.id, None)
+        if previous is not None:
+            network.pinned = network.pinned or previous.pinned
+            network.hits = previous.hits
+        self._networks[network.id] = network
+        return self._trim()
+
+    def set_pinned(self, network_id: str, pinned: bool) -> Optional[LoadedNetwork]:
+        """ネットワークを固定する・固定を外す（固定を外して上限を超えた場合は古いものから破棄する）"""
+        network = self._networks.get(network_id)
+        if network is not None:
+            network.pinned = pinned
+            self._trim()
+        return network
+
+    def remove(self, network_id: str) -> Optional[LoadedNetwork]:
+        return self._networks.pop(network_id, None)
+
+    def _trim(self) -> List[LoadedNetwork]:
+        """固定していないネットワークが上限を超えた分を古いものから破棄する（最後に追加・使用したものは残す）"""
+        unpinned = [candidate for candidate in self._networks.values() if not candidate.pinned]
+        excess = len(unpinned) - max(self.max_entries, 1)
+        evicted = [self._networks.pop(candidate.id) for candidate in unpinned[:max(excess, 0)]]
+        for candidate in evicted:
+            print(f"メモリ上のネットワークを破棄しました: {candidate.id}")
+        return evicted
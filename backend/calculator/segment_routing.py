@@ -0,0 +1,227 @@
+"""
+区間ごとの経路探索の並列実行
+
+形状の各頂点を先に道路ネットワークのノードにスナップしておけば、各区間（頂点 i のノード → 頂点 i+1 のノード）の
+経路探索は互いに独立している。重み関数が Python の関数で GIL を手放さないため、スレッドではなく
+ワーカープロセスで並列に探索する。
+
+ワーカープロセスは forkserver で一度だけ起動し、終了するまで使い続ける（リクエストを処理中のスレッドがある
+API サーバーのプロセスを fork しない）。経路計算のネットワーク（LoadedNetwork）は、ネットワークごとに1回だけ
+一時ファイルに書き出し、各ワーカーは最初に使う時に読み込んで保持する（区間ごとにネットワークを pickle して送らない）。
+コストのパラメータは探索のたびに渡す。一時ファイルは実行中の探索が使っている間は削除せず、
+それ以外は新しいものから SEGMENT_ROUTING_WORKER_NETWORKS 件だけ残す（ワーカーが保持する件数も同じ）。
+forkserver を使えない環境（Windows）では並列化しない。
+
+ワーカー数は環境変数 SEGMENT_ROUTING_WORKERS で指定する（0 または 1 で並列化しない、既定は 0）。
+
+区間の探索結果を再利用するためのキャッシュ（SegmentCache）もここで定義する
+（目標距離に合わせる反復と、描画の編集セッションで使う）。
+"""
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import TYPE_CHECKING, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .network_cache import LoadedNetwork
+
+if TYPE_CHECKING:
+    from .gps_art_generator import GPSArtGenerator
+
+SEGMENT_ROUTING_WORKERS = int(os.environ.get("SEGMENT_ROUTING_WORKERS", "0"))
+SEGMENT_ROUTING_WORKER_NETWORKS = int(os.environ.get("SEGMENT_ROUTING_WORKER_NETWORKS", "2"))
+
+# SegmentCache で区間の座標を比べる単位（メートル）。浮動小数点の計算順による誤差を同じ区間とみなす
+SEGMENT_KEY_PRECISION_M = 0.01
+
+# (区間のキー, 始点ノード, 終点ノード, 区間の始点の座標, 区間の終点の座標)
+# キーは結果の対応付けにだけ使う（複数の形状をまとめて探索する場合は (形状の番号, 区間の番号)）
+SegmentTask = Tuple[Hashable, object, object, object, object]
+
+# ワーカープロセスで読み込んだネットワーク（一時ファイルのパス → LoadedNetwork、最近使ったものほど後ろ）
+_worker_networks: "OrderedDict[str, LoadedNetwork]" = OrderedDict()
+
+
+def parallel_available() -> bool:
+    return "forkserver" in multiprocessing.get_all_start_methods()
+
+
+def _load_worker_network(path: str) -> LoadedNetwork:
+    network = _worker_networks.get(path)
+    if network is None:
+        with open(path, "rb") as f:
+            anchor_point, distance_m, road_network = pickle.load(f)
+        # 経路探索は投影後のグラフだけを使う
+        network = _worker_networks[path] = LoadedNetwork(anchor_point, distance_m, None, road_network)
+        while len(_worker_networks) > max(SEGMENT_ROUTING_WORKER_NETWORKS, 1):
+            _worker_networks.popitem(last=False)
+    else:
+        _worker_networks.move_to_end(path)
+    return network
+
+
+def _route_in_worker(network_path: str, parameters: tuple, task: SegmentTask) -> Tuple[Hashable, Optional[List], float]:
+    from .gps_art_generator import GPSArtGenerator
+
+    index, start_node, target_node, segment_start, segment_end = task
+    network = _load_worker_network(network_path)
+    start = time.perf_counter()
+    router = GPSArtGenerator.segment_router(*parameters)
+    path = router._dijkstra_segment(network, start_node, target_node, segment_start, segment_end)
+    return index, path, time.perf_counter() - start
+
+
+class SegmentRoutingPool:
+    """経路計算のネットワークを一時ファイルで受け取る、起動したまま使い続けるワーカープロセスのプール"""
+
+    def __init__(self, workers: int = SEGMENT_ROUTING_WORKERS, max_networks: int = SEGMENT_ROUTING_WORKER_NETWORKS):
+        self.workers = workers
+        self.max_networks = max_networks
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._snapshot_dir: Optional[str] = None
+        # ネットワークの version → 一時ファイルのパス（最近使ったものほど後ろ）
+        self._snapshots: "OrderedDict[int, str]" = OrderedDict()
+        # ネットワークの version → そのネットワークを使って実行中の探索の数
+        self._in_use: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 1 and parallel_available()
+
+    def route(self, generator: "GPSArtGenerator", network: LoadedNetwork,
+              tasks: Iterable[SegmentTask]) -> Dict[Hashable, Tuple[Optional[List], float]]:
+        """
+        network 上の各区間の経路をワーカープロセスで並列に探索し、{区間のキー: (経路 または None, 探索時間[秒])} を返す。
+        経路が見つからなかった区間は None。
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return {}
+        # 全区間を投入するまでロックを保持する（他のスレッドの shutdown で止めたプールに投入しない。
+        # shutdown は投入済みの区間の探索が終わるまで待つ）
+        with self._lock:
+            executor = self._start_executor()
+            network_path = self._acquire(network)
+            results = executor.map(partial(_route_in_worker, network_path, generator._routing_parameters()), tasks)
+        try:
+            return {index: (path, seconds) for index, path, seconds in results}
+        except BrokenProcessPool:
+            # ワーカーが異常終了したプールは使えないため、次の探索で起動し直す
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            with self._lock:
+                self._release(network.version)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._executor = None
+            if self._snapshot_dir is not None:
+                shutil.rmtree(self._snapshot_dir, ignore_errors=True)
+            self._snapshot_dir = None
+            self._snapshots.clear()
+            self._in_use.clear()
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        """ワーカープロセスのプール（まだなければ起動する）。呼び出し元で _lock を取得している必要がある"""
+        if self._executor is None:
+            print(f"区間の経路探索のワーカープロセスを起動します（{self.workers} プロセス）。")
+            context = multiprocessing.get_context("forkserver")
+            # forkserver で経路探索のモジュールを読み込んでおき、ワーカーの起動を速くする（forkserver の起動前のみ有効）
+            context.set_forkserver_preload([f"{__package__}.gps_art_generator"])
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._executor
+
+    def _acquire(self, network: LoadedNetwork) -> str:
+        """
+        network を書き出した一時ファイルのパス（なければ書き出す）。探索が終わったら _release を呼ぶこと。
+        呼び出し元で _lock を取得している必要がある。
+        """
+        path = self._snapshots.get(network.version)
+        if path is None:
+            if self._snapshot_dir is None:
+                self._snapshot_dir = tempfile.mkdtemp(prefix="gpsart-segment-routing-")
+            path = os.path.join(self._snapshot_dir, f"network-{network.version}.pkl")
+            with open(path, "wb") as f:
+                pickle.dump((network.anchor_point, network.distance_m, network.road_network), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            self._snapshots[network.version] = path
+        else:
+            self._snapshots.move_to_end(network.version)
+        self._in_use[network.version] = self._in_use.get(network.version, 0) + 1
+        self._trim()
+        return path
+
+    def _release(self, version: int):
+        """呼び出し元で _lock を取得している必要がある"""
+        count = self._in_use.pop(version, 0) - 1
+        if count > 0:
+            self._in_use[version] = count
+        self._trim()
+
+    def _trim(self):
+        """使われていない一時ファイルを、新しいものから max_networks 件を残して削除する"""
+        for version in list(self._snapshots)[:-max(self.max_networks, 1)]:
+            if version not in self._in_use:
+                path = self._snapshots.pop(version)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+class SegmentCache:
+    """
+    区間の探索結果（経路 または None）のキャッシュ。
+
+    match_geometry=False の場合は始点と終点のノードだけで区間を同一とみなす（目標距離に合わせる反復用。
+    区間の座標が少し違っても以前の経路を使う近似）。True の場合は区間の始点と終点の座標
+    （SEGMENT_KEY_PRECISION_M 単位）も一致する場合だけ再利用するため、探索し直した場合と同じ結果になる。
+    探索したネットワークが変わった場合（bind で別の version を指定した場合）は空にする。
+    """
+
+    def __init__(self, match_geometry: bool = False):
+        self.match_geometry = match_geometry
+        self.network_version = None
+        self._paths: Dict[tuple, Optional[List]] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, network_version: int):
+        """探索するネットワークの version を設定する（以前と異なる場合は空にする）"""
+        with self._lock:
+            if network_version != self.network_version:
+                self._paths.clear()
+                self.network_version = network_version
+
+    def key(self, start_node, target_node, segment_start, segment_end) -> tuple:
+        if not self.match_geometry:
+            return (start_node, target_node)
+        coords = np.round(np.concatenate((segment_start, segment_end)) / SEGMENT_KEY_PRECISION_M).astype(np.int64)
+        return (start_node, target_node, *coords.tolist())
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._paths
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def get(self, key: tuple) -> Optional[List]:
+        return self._paths.get(key)
+
+    def put(self, key: tuple, path: Optional[List]):
+        with self._lock:
+            self._paths[key] = path
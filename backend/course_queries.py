@@ -0,0 +1,186 @@
+"""
+コースの検索クエリ
+
+エンドポイントやベンチマークから共通で使う、コース一覧の絞り込み処理をまとめる。
+コースの作成・更新・削除は、存在確認を含めて1つのSQL文で行う関数を用意している。
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, delete, insert, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import models, spatial
+from .calculator import geometry
+from .geometry_codec import PointArray
+
+NEARBY_INITIAL_RADIUS_KM = 1.0
+
+# 一覧ではサムネイル用の preview_points だけを返すため、全体の経路と手書き経路は読み込まない
+SUMMARY_LOAD_OPTIONS = (defer(models.Course.route_points), defer(models.Course.drawing_points))
+
+
+async def fill_missing_previews(db: AsyncSession, courses: List[models.Course]):
+    """
+    preview_points が未設定のコース（マイグレーション前に保存されたものなど）について、
+    route_points を読み込んでその場で簡略化した経路を設定する（DBには書き込まない）。
+    """
+    for course in courses:
+        if course.preview_points is None:
+            await db.refresh(course, ["route_points"])
+            set_committed_value(course, "preview_points", models.course_preview_points(course.route_points))
+
+
+def course_insert_rows(user_uuid: uuid.UUID, items, imported_at: datetime) -> List[dict]:
+    """
+    一括インポートするコース（schemas.CourseImportItem）を INSERT する行の dict にする。
+    一括 INSERT では ORM のイベントが発生しないため、始点・preview_points もここで求める。
+    """
+    rows = []
+    for item in items:
+        route_points = PointArray.from_points(item.route_points)
+        rows.append({
+            "id": uuid.uuid4(),
+            "user_id": user_uuid,
+            "total_distance_km": float(item.total_distance_km),
+            "is_favorite": bool(item.is_favorite),
+            "created_at": item.created_at or imported_at,
+            "route_points": route_points,
+            "drawing_points": PointArray.from_points(item.drawing_points),
+            **models.course_derived_columns(route_points),
+        })
+    return rows
+
+
+async def bump_courses_version(db: AsyncSession, user_uuid: uuid.UUID) -> bool:
+    """
+    ユーザーの courses_version を1増やす（ユーザーが存在しない場合は False を返す）。
+    コースを変更するトランザクションの中で呼び、一覧・詳細の ETag とレスポンスキャッシュを無効にする。
+    """
+    result = await db.execute(
+        update(models.User)
+        .where(models.User.id == user_uuid)
+        .values(courses_version=models.User.courses_version + 1, courses_updated_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def insert_course(db: AsyncSession, user_uuid: uuid.UUID, values: dict) -> bool:
+    """
+    ユーザーが存在する場合のみコースを INSERT する（ユーザーが存在しない場合は False を返す）。
+    INSERT INTO courses (...) SELECT ... FROM users WHERE users.id = :user_id の1文で、
+    ユーザーの存在確認と INSERT を同時に行う。
+    values は Course の属性名をキーとする列の値（始点・preview_points はここで求める）。
+    """
+    values = {**values, "user_id": user_uuid, **models.course_derived_columns(values["route_points"])}
+    columns = models.Course.__table__.c
+    statement = insert(models.Course.__table__).from_select(
+        [columns[key] for key in values],
+        select(*[literal(value, columns[key].type) for key, value in values.items()])
+        .where(models.User.id == user_uuid),
+    )
+    result = await db.execute(statement)
+    return result.rowcount == 1
+
+
+async def toggle_favorite(db: AsyncSession, user_uuid: uuid.UUID, course_uuid: uuid.UUID) -> Optional[bool]:
+    """
+    ユーザーのコースのお気に入りフラグを反転し、反転後の値を返す（コースが存在しない場合は None）。
+    UPDATE ... RETURNING に対応したDBでは1文、対応していないDBでは UPDATE と SELECT の2文で行う。
+    """
+    condition = and_(models.Course.id == course_uuid, models.Course.user_id == user_uuid)
+    statement = (
+        update(models.Course)
+        .where(condition)
+        .values(is_favorite=~models.Course.is_favorite)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        return (await db.execute(statement.returning(models.Course.is_favorite))).scalar_one_or_none()
+    if (await db.execute(statement)).rowcount == 0:
+        return None
+    return await db.scalar(select(models.Course.is_favorite).where(condition))
+
+
+async def delete_course(db: AsyncSession, user_uuid: uuid.UUID, course_uuid: uuid.UUID) -> bool:
+    """ユーザーのコースを1文で削除する（コースが存在しない場合は False を返す）。"""
+    result = await db.execute(
+        delete(models.Course)
+        .where(models.Course.id == course_uuid, models.Course.user_id == user_uuid)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def preview_route_points(course: models.Course) -> PointArray:
+    """一覧に返すコースの経路（簡略化した preview_points）を返す。"""
+    preview_points = course.preview_points
+    if preview_points is None:
+        # マイグレーション前に保存されたコースは、その場で簡略化する
+        # (非同期セッションでは先に fill_missing_previews で設定しておく)
+        preview_points = models.course_preview_points(course.route_points)
+    return preview_points
+
+
+async def find_nearby_courses(
+    db: AsyncSession,
+    user_uuid: uuid.UUID,
+    lat: float,
+    lng: float,
+    radius_km: float,
+    k: int,
+) -> List[Tuple[float, models.Course]]:
+    """
+    (lat, lng) から始点が近い順に、半径 radius_km 以内のコースを最大 k 件返す。
+
+    始点の格子セル (start_cell) のインデックスで候補を絞り込み、検索半径を
+    NEARBY_INITIAL_RADIUS_KM から倍々に広げながら、k 件見つかった時点で打ち切る。
+
+    Returns:
+        (始点までの距離km, コース) のリスト（距離の昇順）
+    """
+    search_radius_km = min(NEARBY_INITIAL_RADIUS_KM, radius_km)
+    while True:
+        # user_id の条件を各範囲に含めることで、SQLite でも範囲ごとにインデックス検索になる（MULTI-INDEX OR）
+        cell_conditions = [
+            and_(models.Course.user_id == user_uuid, models.Course.start_cell.between(low, high))
+            for low, high in spatial.cell_ranges(lat, lng, search_radius_km)
+        ]
+        candidates = (
+            await db.execute(
+                select(models.Course.id, models.Course.start_lat, models.Course.start_lng)
+                .where(or_(*cell_conditions))
+            )
+        ).all()
+        distances = geometry.haversine_km(
+            lat, lng, [c.start_lat for c in candidates], [c.start_lng for c in candidates]
+        ).tolist()
+        # セルは円より広い範囲を覆うため、検索半径内のコースだけを確定とする
+        found = sorted(
+            (distance, candidate.id)
+            for distance, candidate in zip(distances, candidates)
+            if distance <= search_radius_km
+        )
+        if len(found) >= k or search_radius_km >= radius_km:
+            break
+        search_radius_km = min(search_radius_km * 2, radius_km)
+
+    nearest = found[:k]
+    if not nearest:
+        return []
+
+    # 返却するコースだけを読み込む（一覧と同様に全体の経路は読み込まない）
+    courses = (
+        await db.scalars(
+            select(models.Course)
+            .options(*SUMMARY_LOAD_OPTIONS)
+            .where(models.Course.id.in_([course_id for _, course_id in nearest]))
+        )
+    ).all()
+    await fill_missing_previews(db, courses)
+    courses_by_id = {course.id: course for course in courses}
+    return [(distance_km, courses_by_id[course_id]) for distance_km, course_id in nearest]
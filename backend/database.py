@@ -1,35 +1,88 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from . import metrics
+
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./test.db")
 
+# 非同期ドライバに対応するドライバ名（DATABASE_URL は同期ドライバの URL のまま指定する）
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def to_async_url(url: str) -> str:
+    """DATABASE_URL を非同期ドライバ（aiosqlite / asyncpg）の URL に変換する"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+
+def pool_args(url: str) -> dict:
+    """
+    接続プールの設定（SQLite 以外）。環境変数で変更できる。
+    - DB_POOL_SIZE: 常に保持する接続数
+    - DB_MAX_OVERFLOW: 混雑時に追加で開く接続数
+    - DB_POOL_TIMEOUT: 空き接続を待つ最大秒数
+    - DB_POOL_RECYCLE: 接続を作り直すまでの秒数
+    """
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+
 # The connect_args are only for SQLite.
 engine_args = {"connect_args": {"check_same_thread": False}} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, **engine_args)
+engine = create_engine(DATABASE_URL, **engine_args, **pool_args(DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# APIのエンドポイントで使う非同期エンジン
+# (マイグレーションや手書きデータの書き込みスレッドなど、バックグラウンドの処理は同期エンジンを使う)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_args(ASYNC_DATABASE_URL))
+
+# コミット後に属性を再読み込みしない（非同期セッションでは暗黙の読み込みができないため）
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+# すべてのエンジン（非同期エンジンの内部の同期エンジンを含む）で実行したSQL文をリクエストごとに数える
+event.listen(Engine, "before_cursor_execute", metrics.count_statement)
+
 
 # FastAPIのDependsで利用するDBセッション取得用の関数
 #
 # FastAPIのエンドポイントで以下のように利用することで、DBセッションを取得できます。
 #
 # from fastapi import Depends
-# from sqlalchemy.orm import Session
-# from .database import get_db
+# from sqlalchemy.ext.asyncio import AsyncSession
+# from .database import get_async_db
 #
 # @app.get("/items/")
-# def read_items(db: Session = Depends(get_db)):
-#     # ここでdbセッションを利用してDB操作を行う
+# async def read_items(db: AsyncSession = Depends(get_async_db)):
+#     # ここでdbセッションを利用してDB操作を行う（クエリは await する）
 #     ...
 #
+# 同期のセッションが必要なスクリプトなどでは get_db を利用します。
+#
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,126 @@
+"""
+座標列のコンパクトなバイナリエンコーディング
+
+コースの経路や手書きの座標列を、JSONの `[{"lat": .., "lng": ..}, ...]` の代わりに
+固定小数点の差分(delta)を int32 で詰めたバイト列として保存する。
+
+フォーマット（リトルエンディアン）:
+    ヘッダー 9バイト: マジック b"GP", バージョン(uint8), フラグ(uint8), 小数桁数(uint8), 点数(uint32)
+    本体: round(値 * 10**小数桁数) の前の点との差分を (点数, 2) の int32 で並べたもの
+          （先頭の点は 0 からの差分 = 絶対値）
+    フラグの bit0 が立っている場合、本体は zlib で圧縮されている（小さくなる場合のみ圧縮する）
+    フラグの bit1 が立っている場合、差分は int64 で並べている（経度180度線をまたぐ経路や大きなディスプレイ座標
+    など、差分が int32 に収まらない場合のみ）
+"""
+import struct
+import zlib
+from collections.abc import Sequence
+
+import numpy as np
+
+MAGIC = b"GP"
+VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_INT64 = 0x02
+HEADER = struct.Struct("<2sBBBI")
+
+# 緯度経度は 1e-7 度（約1cm）、ディスプレイ座標は 1e-3 ピクセル単位で保存する
+LATLNG_DECIMALS = 7
+DISPLAY_DECIMALS = 3
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+# 固定小数点にした値の上限（差分が int64 に収まる範囲）
+MAX_FIXED = 2 ** 62
+
+
+def encode_points(points, decimals: int, compress: bool = True) -> bytes:
+    """(N, 2) の座標配列をバイト列にエンコードする。"""
+    array = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    scaled = np.rint(array * (10 ** decimals))
+    if not np.all(np.abs(scaled) < MAX_FIXED):
+        raise ValueError("座標に無限大・NaN、または大きすぎる値が含まれています。")
+    fixed = scaled.astype(np.int64)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+
+    flags = 0
+    if deltas.size and (deltas.min() < INT32_MIN or deltas.max() > INT32_MAX):
+        body = deltas.astype("<i8").tobytes()
+        flags |= FLAG_INT64
+    else:
+        body = deltas.astype("<i4").tobytes()
+    if compress and body:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, decimals, len(array)) + body
+
+
+def decode_points(blob: bytes) -> np.ndarray:
+    """バイト列を (N, 2) の float64 配列にデコードする。"""
+    magic, version, flags, decimals, count = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("座標データのフォーマットが不正です。")
+    body = bytes(blob[HEADER.size:])
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    deltas = np.frombuffer(body, dtype="<i8" if flags & FLAG_INT64 else "<i4").reshape(count, 2)
+    return np.cumsum(deltas, axis=0, dtype=np.int64) / float(10 ** decimals)
+
+
+class PointArray(Sequence):
+    """
+    ndarray を保持し、`[{"lat": .., "lng": ..}, ...]` と同じように扱える読み取り専用の座標列
+
+    `array` で (N, 2) の ndarray を直接取り出せる。要素へのアクセスや反復では dict を返すため、
+    JSONで保存していた頃の `route_points[0]["lat"]` のようなコードもそのまま動く。
+    """
+    __slots__ = ("array", "keys")
+    __hash__ = None
+
+    def __init__(self, array, keys=("lat", "lng")):
+        self.array = np.asarray(array, dtype=np.float64).reshape(-1, 2)
+        self.keys = tuple(keys)
+
+    @classmethod
+    def from_points(cls, points, keys=("lat", "lng")) -> "PointArray":
+        """PointArray / ndarray / dict のリスト / 座標ペアのリストから PointArray を作る。"""
+        if isinstance(points, PointArray):
+            return points
+        if isinstance(points, np.ndarray):
+            return cls(points, keys)
+        points = list(points)
+        if points and isinstance(points[0], dict):
+            return cls([(p[keys[0]], p[keys[1]]) for p in points], keys)
+        if points and hasattr(points[0], keys[0]):
+            return cls([(getattr(p, keys[0]), getattr(p, keys[1])) for p in points], keys)
+        return cls(points, keys)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PointArray(self.array[index], self.keys)
+        a, b = self.array[index].tolist()
+        return {self.keys[0]: a, self.keys[1]: b}
+
+    def __iter__(self):
+        key_a, key_b = self.keys
+        for a, b in self.array.tolist():
+            yield {key_a: a, key_b: b}
+
+    def to_list(self) -> list:
+        """`[{"lat": .., "lng": ..}, ...]` 形式のリストに変換する。"""
+        key_a, key_b = self.keys
+        return [{key_a: a, key_b: b} for a, b in self.array.tolist()]
+
+    def __eq__(self, other):
+        if isinstance(other, PointArray):
+            return self.keys == other.keys and np.array_equal(self.array, other.array)
+        if isinstance(other, (list, tuple)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"PointArray({len(self)} points, keys={self.keys})"
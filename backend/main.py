@@ -1,14 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from datetime import datetime, timezone, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, func, insert, select
+import math
+import numpy as np
+import os
 import uuid
+import functools
+from contextlib import asynccontextmanager
 from fastapi import Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import Optional
-from .database import engine, get_db
-from . import models, schemas
-from geopy.distance import geodesic
-from .calculator.gps_art_generator import GPSArtGenerator
+from .database import engine, get_async_db, SessionLocal
+from . import (
+    models, schemas, metrics, admin, profiling, migrations, course_queries, serialization, write_behind,
+    response_cache, routing,
+)
+from .calculator import geometry
 
 def calculate_distance_km(
     lat1: Optional[float],
@@ -23,15 +34,32 @@ def calculate_distance_km(
     if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
         return None
     
-    return geodesic((lat1, lon1), (lat2, lon2)).km
+    return float(geometry.haversine_km(lat1, lon1, lat2, lon2))
+
+# 起動時にDBテーブルの作成と既存DBのマイグレーションを行うか（テストなどDBを別に用意する場合は 0）
+DB_AUTO_MIGRATE = os.environ.get("DB_AUTO_MIGRATE", "1") == "1"
+
+def init_database():
+    """DBテーブルの作成と既存DBのマイグレーション"""
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
 
-# DBテーブルの作成
-models.Base.metadata.create_all(bind=engine)
+# 手書きデータの書き込みキュー（/routes/calculate と /routes/calculate-batch から利用）
+handwriting_writer = write_behind.HandwritingWriter(SessionLocal)
 
-# GPSArtGeneratorのインスタンスを生成
-art_generator = GPSArtGenerator()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # import 時ではなく起動時に行う（経路計算の初期化は routing.get_generator で最初に必要になったときに行う）
+    if DB_AUTO_MIGRATE:
+        await run_in_threadpool(init_database)
+    routing.start_warmup()
+    handwriting_writer.start()
+    yield
+    # 終了時にキューに残っている手書きデータを書き込む
+    await run_in_threadpool(handwriting_writer.stop)
+    await run_in_threadpool(routing.shutdown)
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORSミドルウェアの設定
 app.add_middleware(
@@ -40,7 +68,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Next-Cursor"],
 )
+# 座標列を含む大きなレスポンスを圧縮する（Accept-Encoding: gzip のクライアントのみ）
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+@app.middleware("http")
+async def record_server_timing(request: Request, call_next):
+    """
+    リクエストごとに処理段階の所要時間を計測し、Server-Timing ヘッダーとして返す。
+    """
+    token = metrics.start_request_timing()
+    statement_token = metrics.start_statement_count()
+    metrics.http_requests_in_flight.inc()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.http_requests_in_flight.dec()
+        timings = metrics.finish_request_timing(token)
+        statements = metrics.finish_statement_count(statement_token)
+    route = request.scope.get("route")
+    metrics.db_statements_per_request.observe(statements, route=route.path if route else "unmatched")
+    server_timing = metrics.format_server_timing(timings) if timings else ""
+    if statements:
+        # SQL文の数は所要時間のない項目として返す（ブラウザの開発者ツールで確認できる）
+        server_timing += (", " if server_timing else "") + f'db;desc="{statements} statements"'
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """
+    Prometheus 形式でメトリクスを返す。
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
 
 @app.get("/api/message")
 def read_message():
@@ -49,7 +111,7 @@ def read_message():
     return {"message": f"Hello! {now}"}
 
 @app.post("/users", response_model=schemas.UserResponse, status_code=201)
-def create_user(db: Session = Depends(get_db)):
+async def create_user(db: AsyncSession = Depends(get_async_db)):
     """
     新しいユーザーを作成し、UUIDを返す
     """
@@ -59,17 +121,16 @@ def create_user(db: Session = Depends(get_db)):
     # ユーザーをDBに作成
     new_user = models.User(id=new_user_id)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
     return schemas.UserResponse(user_id=str(new_user.id))
 
 @app.get("/users", response_model=list[schemas.UserDetail])
-def get_all_users(db: Session = Depends(get_db)):
+async def get_all_users(db: AsyncSession = Depends(get_async_db)):
     """
     全ユーザーを取得（テスト用、いずれ削除予定）
     """
-    users = db.query(models.User).all()
+    users = (await db.scalars(select(models.User))).all()
     return [
         schemas.UserDetail(
             user_id=str(user.id),
@@ -92,14 +153,15 @@ def calculate_route_notice(payload: schemas.NoticeRequest, background_tasks: Bac
         """バックグラウンドで実行される道路網の読み込み処理"""
         print("バックグラウンドタスク: 道路ネットワークの事前読み込みを開始します。")
         try:
-            # 実際に計算で使われるものと同じパラメータで読み込みを行う
-            art_generator.network_distance = 4000
-            
-            # _load_road_networkを直接呼び出す
+            art_generator = routing.get_generator()
+
+            # 形状はまだ分からないため、目標距離から取得範囲を見積もって読み込む
+            # （計算時に必要な範囲がこれに含まれていれば、読み込んだネットワークを再利用する）
             art_generator._load_road_network(
                 center_lat=float(round(payload.start_location.lat, 3)),
                 center_lon=float(round(payload.start_location.lng, 3)),
-                force_reload=False # 既にキャッシュがあれば再利用
+                force_reload=False, # 既にキャッシュがあれば再利用
+                distance_m=art_generator._estimate_network_distance(payload.target_distance_km),
             )
             print("バックグラウンドタスク: 道路ネットワークの事前読み込みが完了しました。")
         except Exception as e:
@@ -110,8 +172,12 @@ def calculate_route_notice(payload: schemas.NoticeRequest, background_tasks: Bac
     return {"message": "Accepted: Road network preloading has started in the background."}
 
 
-@app.post("/routes/calculate", response_model=schemas.RouteCalculateResponse)
-def calculate_route(payload: schemas.RouteCalculateRequest, db: Session = Depends(get_db)):
+@app.post(
+    "/routes/calculate",
+    response_model=schemas.RouteCalculateResponse,
+    responses=serialization.COMPACT_RESPONSES,
+)
+def calculate_route(payload: schemas.RouteCalculateRequest, request: Request):
     """
     手書きの描画データ、開始地点、目標距離から最適なGPSアートコースを生成。
 
@@ -123,146 +189,511 @@ def calculate_route(payload: schemas.RouteCalculateRequest, db: Session = Depend
             - `drawing_display_points`: 手書き図形のディスプレイ座標リスト (`[{x, y}, ...]`)
             - `start_location`: 開始地点の緯度経度 (`{lat, lng}`)
             - `target_distance_km`: 目標距離 (km)
+            - `fit_distance`: true の場合、形状を拡大・縮小して探索し直し、コースの全長を目標距離に合わせる
+            - `edit_session`: true の場合、描画の編集セッションを始め、レスポンスの `edit_session_id` で発行したIDを返す
+            - `edit_session_id`: 発行された編集セッションのID。同じIDで描画を編集して再計算すると、最初の計算の
+              回転角度と縮尺を使い、変わった区間だけを探索し直す（開始地点・目標距離を変えた場合は最初から計算する）。
+              破棄されたセッションのIDの場合は新しいセッションを始め、新しいIDを返す
 
     Returns:
         schemas.RouteCalculateResponse: 計算結果。
             - `total_distance_km`: 実際に生成されたコースの総距離 (km)
             - `route_points`: コースを構成する緯度経度のリスト (`[{lat, lng}, ...]`)
             - `drawing_points`: 手書き経路の緯度経度のリスト
+            - `edit_session_id`: 編集セッションを使った場合のセッションID
+
+    管理者は `X-Profile: sample|cprofile` ヘッダー（または `?profile=`）でこのリクエストの
+    プロファイルを取得できる（`X-Admin-Token` が必要）。結果は PROFILE_DIR に保存され、
+    `X-Profile-Output: inline`（または `?profile_output=inline`）の場合はレスポンスとして返す。
+    cprofile モードのプロファイルは1件ずつ行い、他のリクエストのプロファイル中は 409 を返す。
+
+    `Accept: application/vnd.gpsart.compact+json` の場合、座標列を `[[lat, lng], ...]` で返す。
     """
+    profile_mode = request.headers.get("X-Profile") or request.query_params.get("profile")
+    if profile_mode is not None:
+        if not admin.is_admin_token(request.headers.get(admin.ADMIN_TOKEN_HEADER)):
+            raise HTTPException(status_code=403, detail="Admin token required for profiling.")
+        if profile_mode not in profiling.PROFILE_MODES:
+            raise HTTPException(status_code=400, detail=f"profile must be one of {profiling.PROFILE_MODES}")
+
     drawing_display_points = [point.dict() for point in payload.drawing_display_points]
 
-    # 手書きデータをDBに保存
-    handwriting_record = models.Handwriting(
-        drawing_points=drawing_display_points
-    )
-    db.add(handwriting_record)
-    db.commit()
+    # 手書きデータの保存はキューに積むだけにし、DBへの書き込みはバックグラウンドで行う
+    handwriting_writer.submit(drawing_display_points)
     
+    calculate = functools.partial(
+        routing.get_generator().calculate_route,
+        drawing_display_points=drawing_display_points,
+        start_location=payload.start_location.dict(),
+        target_distance_km=payload.target_distance_km
+    )
+    if payload.fit_distance:
+        calculate = functools.partial(calculate, fit_distance=True)
+    if payload.edit_session_id is not None:
+        calculate = functools.partial(calculate, edit_session_id=payload.edit_session_id)
+    elif payload.edit_session:
+        calculate = functools.partial(calculate, start_edit_session=True)
     try:
-        result = art_generator.calculate_route(
-            drawing_display_points=drawing_display_points,
-            start_location=payload.start_location.dict(),
-            target_distance_km=payload.target_distance_km
+        if profile_mode is None:
+            result = calculate()
+        else:
+            with profiling.profile(profile_mode) as profile:
+                result = calculate()
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if profile_mode is not None:
+        profile_output = request.headers.get("X-Profile-Output") or request.query_params.get("profile_output")
+        if profile_output == "inline":
+            return Response(
+                content=profile.content,
+                media_type=profile.media_type,
+                headers={"Content-Disposition": f'attachment; filename="calculate.{profile.extension}"'},
+            )
+        profile_path = profiling.save_profile(profile, "calculate")
+        print(f"プロファイルを保存しました: {profile_path} ({profile.duration_s:.2f}秒)")
+
+    # シリアライズ時間も計測するため、レスポンスのJSON化はここで行う
+    # (点ごとに pydantic モデルを作らず、座標列をそのまま JSON にする)
+    headers = {"X-Profile-Path": profile_path} if profile_mode is not None else None
+    compact = serialization.wants_compact(request)
+    with metrics.timed_stage("serialization"):
+        body = {
+            "total_distance_km": result["total_distance_km"],
+            "route_points": serialization.points_payload(result["route_points"], compact),
+            "drawing_points": serialization.points_payload(result["drawing_points"], compact),
+        }
+        if result.get("edit_session_id") is not None:
+            body["edit_session_id"] = result["edit_session_id"]
+        return serialization.json_response(body, compact, headers=headers)
+
+@app.delete("/routes/edit-sessions/{edit_session_id}", status_code=204)
+def end_edit_session(edit_session_id: str):
+    """
+    描画の編集セッションを終了し、保存している区間の探索結果を破棄する（描画画面を閉じたときなど）。
+    セッションIDはサーバーが発行した推測できない値のため、IDを知っているクライアントだけが終了できる。
+    セッションがない場合も 204 を返す（一定時間使われなかったセッションは自動で破棄する）。
+    """
+    if routing.is_ready():
+        routing.get_generator().end_edit_session(edit_session_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+# /routes/calculate-batch で1リクエストに含められる項目数とボディのバイト数の上限
+ROUTE_BATCH_MAX_ITEMS = int(os.environ.get("ROUTE_BATCH_MAX_ITEMS", "20"))
+ROUTE_BATCH_MAX_BYTES = int(os.environ.get("ROUTE_BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+
+async def request_body_size(request: Request) -> int:
+    """リクエストボディのバイト数（Content-Length がない場合は読み込んだボディの長さ）"""
+    content_length = request.headers.get("content-length")
+    return int(content_length) if content_length and content_length.isdigit() else len(await request.body())
+
+async def limit_route_batch_size(request: Request):
+    """
+    まとめて計算するリクエストのボディが ROUTE_BATCH_MAX_BYTES を超える場合は 413 を返す。
+    依存関係はボディの検証より前に実行されるため、全項目の座標を Pydantic モデルに変換せずに拒否できる。
+    """
+    if await request_body_size(request) > ROUTE_BATCH_MAX_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"Request body too large. At most {ROUTE_BATCH_MAX_BYTES} bytes per request."
         )
+
+@app.post(
+    "/routes/calculate-batch",
+    response_model=schemas.RouteBatchCalculateResponse,
+    responses=serialization.COMPACT_RESPONSES,
+    dependencies=[Depends(limit_route_batch_size)],
+)
+def calculate_routes_batch(payload: schemas.RouteBatchCalculateRequest, request: Request):
+    """
+    同じ開始地点から、複数の手書きの描画データと目標距離のコースをまとめて計算する。
+
+    道路ネットワークの読み込み、ノードの検索用インデックス、座標変換は全項目で共有し、
+    並列探索が有効な場合（SEGMENT_ROUTING_WORKERS）は全項目の区間をまとめてワーカープロセスで探索する。
+
+    - results は items と同じ順。各項目は /routes/calculate と同じ項目と error（計算できなかった項目は error 以外が null）
+    - 道路ネットワークを読み込めない場合は全項目に共通のため 400
+    - ボディが ROUTE_BATCH_MAX_BYTES を超える場合は、項目を検証する前に 413
+    - 項目数が ROUTE_BATCH_MAX_ITEMS を超える場合は 413
+    - fit_distance=true の場合、各コースの全長を目標距離に合わせる（/routes/calculate と同じ）
+    - `Accept: application/vnd.gpsart.compact+json` の場合、座標列を `[[lat, lng], ...]` で返す
+    """
+    if len(payload.items) > ROUTE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items. At most {ROUTE_BATCH_MAX_ITEMS} per request.")
+
+    items = []
+    for item in payload.items:
+        drawing_display_points = [point.dict() for point in item.drawing_display_points]
+        handwriting_writer.submit(drawing_display_points)
+        items.append({"drawing_display_points": drawing_display_points, "target_distance_km": item.target_distance_km})
+
+    try:
+        results = routing.get_generator().calculate_routes(
+            items, payload.start_location.dict(), fit_distance=payload.fit_distance
+        ) if items else []
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return schemas.RouteCalculateResponse(
-        total_distance_km=result["total_distance_km"],
-        route_points=[schemas.LatLng(**point) for point in result["route_points"]],
-        drawing_points=[schemas.LatLng(**point) for point in result["drawing_points"]],
-    )
+    compact = serialization.wants_compact(request)
+    with metrics.timed_stage("serialization"):
+        return serialization.json_response(
+            {
+                "results": [
+                    {
+                        "total_distance_km": result.get("total_distance_km"),
+                        "route_points": serialization.points_payload(result.get("route_points"), compact),
+                        "drawing_points": serialization.points_payload(result.get("drawing_points"), compact),
+                        "error": result.get("error"),
+                    }
+                    for result in results
+                ]
+            },
+            compact,
+        )
 
 @app.get("/handwritings", response_model=list[schemas.Handwriting])
-def get_handwritings(since: Optional[datetime] = None, db: Session = Depends(get_db)):
+async def get_handwritings(
+    since: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
-    指定された日時以降の手書きデータを取得する。
+    指定された日時以降の手書きデータを新しい順に取得する。
+    ページング: limit を指定すると最大 limit 件を返し、続きがある場合は
+      X-Next-Cursor ヘッダーに次ページ用の cursor（最後の手書きデータのID）を設定する
     """
-    query = db.query(models.Handwriting)
+    try:
+        cursor_uuid = uuid.UUID(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor format. Must be UUID.")
+
+    statement = select(models.Handwriting)
     if since:
-        query = query.filter(models.Handwriting.created_at >= since)
-    
-    handwritings = query.order_by(models.Handwriting.created_at.desc()).all()
+        statement = statement.where(models.Handwriting.created_at >= since)
+
+    # キーセットページング: (created_at, id) の降順で cursor の手書きデータより後ろだけを取得する
+    if cursor_uuid is not None:
+        anchor_created_at = (
+            select(models.Handwriting.created_at)
+            .where(models.Handwriting.id == cursor_uuid)
+            .scalar_subquery()
+        )
+        statement = statement.where(or_(
+            models.Handwriting.created_at < anchor_created_at,
+            and_(models.Handwriting.created_at == anchor_created_at, models.Handwriting.id < cursor_uuid),
+        ))
+
+    statement = statement.order_by(models.Handwriting.created_at.desc(), models.Handwriting.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    handwritings = (await db.scalars(statement)).all()
+
+    headers = {}
+    if limit is not None and len(handwritings) > limit:
+        handwritings = handwritings[:limit]
+        headers["X-Next-Cursor"] = str(handwritings[-1].id)
+
+    return serialization.json_response([serialization.handwriting(hw) for hw in handwritings], headers=headers)
+
+HANDWRITING_EXPORT_CHUNK_SIZE = 1000
+
+@app.get(
+    "/handwritings/export",
+    response_class=StreamingResponse,
+    responses=serialization.NDJSON_RESPONSES,
+)
+async def export_handwritings(since: Optional[datetime] = None, db: AsyncSession = Depends(get_async_db)):
+    """
+    指定された日時以降の手書きデータを古い順に NDJSON（1行に1件の JSON）で出力する。
+    カーソルから HANDWRITING_EXPORT_CHUNK_SIZE 件ずつ読み込んでは書き出すため、
+    件数が増えてもメモリ使用量は一定。
+    """
+    statement = select(models.Handwriting.id, models.Handwriting.created_at, models.Handwriting.drawing_points)
+    if since:
+        statement = statement.where(models.Handwriting.created_at >= since)
+    # yield_per を指定すると、PostgreSQL ではサーバーサイドカーソルで読み込む
+    statement = (
+        statement.order_by(models.Handwriting.created_at.asc(), models.Handwriting.id.asc())
+        .execution_options(yield_per=HANDWRITING_EXPORT_CHUNK_SIZE)
+    )
 
-    # DBから取得したdatetimeがタイムゾーン情報を持たない場合(naive)でもUTCとして扱うようにする
-    # これにより、フロントエンド側で正しくJSTに変換できるようになる
-    for hw in handwritings:
-        if hw.created_at.tzinfo is None:
-            hw.created_at = hw.created_at.replace(tzinfo=timezone.utc)
+    async def generate():
+        result = await db.stream(statement)
+        async for rows in result.partitions():
+            yield serialization.ndjson_lines(rows, serialization.handwriting)
 
-    return handwritings
+    return StreamingResponse(generate(), media_type=serialization.NDJSON_MEDIA_TYPE)
 
 
-@app.get("/users/{user_id}/courses", response_model=list[schemas.CourseSummary])
-def list_user_courses(
+COURSE_SORT_OPTIONS = (
+    "created_at_desc", "created_at_asc",
+    "distance_asc", "distance_desc",
+    "total_distance_asc", "total_distance_desc"
+)
+
+def course_sort_key(sort_by: str, current_lat: Optional[float], current_lng: Optional[float]):
+    """
+    sort_by に対応する ORDER BY 用の式と降順かどうかを返す。
+    距離順は始点との正距円筒近似による距離の2乗で並べる（近距離では大円距離と同じ順序になる）。
+    現在地が指定されていない、または始点がないコースの距離は 0 として扱う。
+    """
+    descending = sort_by.endswith("_desc")
+    if sort_by.startswith("created_at"):
+        return models.Course.created_at, descending
+    if sort_by.startswith("total_distance"):
+        return models.Course.total_distance_km, descending
+    if current_lat is None or current_lng is None:
+        return None, descending
+
+    lng_scale = math.cos(math.radians(current_lat))
+    d_lat = models.Course.start_lat - current_lat
+    d_lng = (models.Course.start_lng - current_lng) * lng_scale
+    return func.coalesce(d_lat * d_lat + d_lng * d_lng, 0.0), descending
+
+
+@app.get(
+    "/users/{user_id}/courses",
+    response_model=list[schemas.CourseSummary],
+    responses=serialization.COMPACT_RESPONSES,
+)
+async def list_user_courses(
     user_id: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_lat: Optional[float] = None,
     current_lng: Optional[float] = None,
     sort_by: str = "distance_asc",
     favorites_only: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
 ):
     """
     指定ユーザーが保存したコース一覧を返す。
+    route_points はサムネイル用に簡略化した経路（最大 models.PREVIEW_MAX_POINTS 点）を返し、
+    全体の経路は詳細 (GET /users/{user_id}/courses/{course_id}) で返す。
     drawing_points は一覧では返さないため null を返却。
     ソート: 
       - created_at_desc(新しい順) | created_at_asc(古い順)
       - distance_asc(近い順) | distance_desc(遠い順)
       - total_distance_asc(短い順) | total_distance_desc(長い順)
     フィルター: favorites_only=true でお気に入りのコースのみを返す
+    ページング: limit を指定すると最大 limit 件を返し、続きがある場合は
+      X-Next-Cursor ヘッダーに次ページ用の cursor（最後のコースのID）を設定する
+      （cursor のコースが削除されたなどで見つからない場合は 400）
+    `Accept: application/vnd.gpsart.compact+json` の場合、route_points を `[[lat, lng], ...]` で返す
+    条件付きGET: ETag / Last-Modified を返し、ユーザーのコースが変わっていなければ 304 を返す
     """
-    
-    valid_sort_options = (
-        "created_at_desc", "created_at_asc",
-        "distance_asc", "distance_desc",
-        "total_distance_asc", "total_distance_desc"
-    )
-
-    if sort_by not in valid_sort_options:
-        raise HTTPException(status_code=400, detail=f"sort_by must be one of {valid_sort_options}")
+    if sort_by not in COURSE_SORT_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {COURSE_SORT_OPTIONS}")
 
     # user_id はパスパラメータで文字列として受け取るため、UUID に変換してクエリする
     try:
         user_uuid = uuid.UUID(user_id)
+        cursor_uuid = uuid.UUID(cursor) if cursor is not None else None
     except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid user_id format. Must be UUID.")
+        raise HTTPException(status_code=400, detail="Invalid user_id or cursor format. Must be UUID.")
 
     # ユーザー存在確認
-    user = db.query(models.User).filter(models.User.id == user_uuid).first()
+    user = await db.get(models.User, user_uuid)
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
 
+    # コースが変わっていなければ、コースを読み込まずに 304 またはキャッシュしたレスポンスを返す
+    cache_key, validators, cached = response_cache.cached_response(request, user)
+    if cached is not None:
+        return cached
+
     # コースをクエリ (お気に入りフィルターを適用)
-    query = db.query(models.Course).filter(models.Course.user_id == user_uuid)
+    conditions = [models.Course.user_id == user_uuid]
     if favorites_only:
-        query = query.filter(models.Course.is_favorite.is_(True))
-    courses = query.all()
-    response_courses = []
-    for course in courses:
-        distance_to_start_km = 0.0
-        if current_lat is not None and current_lng is not None and course.route_points:
-            start_point = course.route_points[0]
-            distance_to_start_km = calculate_distance_km(current_lat, current_lng, start_point.get("lat"), start_point.get("lng"))
-        response_courses.append(
-            schemas.CourseSummary(
-                id=str(course.id),
-                total_distance_km=course.total_distance_km,
-                distance_to_start_km=distance_to_start_km,
-                is_favorite=course.is_favorite,
-                created_at=course.created_at,
-                route_points=course.route_points,
-                drawing_points=None,
+        conditions.append(models.Course.is_favorite.is_(True))
+    statement = select(models.Course).options(*course_queries.SUMMARY_LOAD_OPTIONS).where(*conditions)
+
+    # ソートはDB側で行い、同じ値のコースは作成順（created_at, id の昇順）に並べる
+    # （現在地を指定しない距離順では全コースの距離が同じになるため、作成順で返る。
+    #   作成日時順では created_at と同じ向きに id で順序を固定する）
+    sort_key, descending = course_sort_key(sort_by, current_lat, current_lng)
+    if sort_key is models.Course.created_at:
+        order_columns = [(models.Course.created_at, descending), (models.Course.id, descending)]
+    else:
+        order_columns = [(models.Course.created_at, False), (models.Course.id, False)]
+        if sort_key is not None:
+            order_columns.insert(0, (sort_key, descending))
+
+    # キーセットページング: 並び順の列の組で cursor のコースより後ろのコースだけを取得する
+    if cursor_uuid is not None:
+        def after(column, anchor, desc):
+            return column < anchor if desc else column > anchor
+
+        # cursor のコースが削除されたなどで見つからない場合は、比較がすべて偽になり空のページを返してしまうため 400 にする
+        cursor_exists = await db.scalar(
+            select(models.Course.id).where(models.Course.id == cursor_uuid, *conditions)
+        )
+        if cursor_exists is None:
+            raise HTTPException(status_code=400, detail="Cursor course not found. Restart from the first page.")
+        # 並び順の値はDBの値と直接比較する（SQLite では日時を文字列で比較するため、読み込んだ値を渡すと形式がずれる）
+        anchors = [
+            select(column).where(models.Course.id == cursor_uuid, *conditions).scalar_subquery()
+            for column, _ in order_columns[:-1]
+        ] + [cursor_uuid]
+        statement = statement.where(or_(*[
+            and_(*[column == anchor for (column, _), anchor in zip(order_columns[:i], anchors)],
+                 after(column, anchors[i], desc))
+            for i, (column, desc) in enumerate(order_columns)
+        ]))
+
+    statement = statement.order_by(*[column.desc() if desc else column.asc() for column, desc in order_columns])
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    courses = (await db.scalars(statement)).all()
+
+    headers = {}
+    if limit is not None and len(courses) > limit:
+        courses = courses[:limit]
+        headers["X-Next-Cursor"] = str(courses[-1].id)
+    await course_queries.fill_missing_previews(db, courses)
+
+    # 返却するページのコースについてのみ、現在地から始点までの距離をまとめて計算する
+    # (始点がないコースは NaN で計算し、0 として返す)
+    distances_to_start = [0.0] * len(courses)
+    if current_lat is not None and current_lng is not None and courses:
+        start_points = np.array(
+            [(course.start_lat, course.start_lng) for course in courses], dtype=np.float64
+        )
+        distances = geometry.haversine_km(current_lat, current_lng, start_points[:, 0], start_points[:, 1])
+        distances_to_start = np.nan_to_num(distances, nan=0.0).tolist()
+
+    compact = serialization.wants_compact(request)
+    return response_cache.store(cache_key, validators, serialization.json_response(
+        [
+            serialization.course_summary(
+                course, distance_to_start_km, course_queries.preview_route_points(course), None, compact
+            )
+            for course, distance_to_start_km in zip(courses, distances_to_start)
+        ],
+        compact,
+        headers=headers,
+    ))
+
+NEARBY_MAX_RADIUS_KM = 50.0
+
+@app.get(
+    "/users/{user_id}/courses/nearby",
+    response_model=list[schemas.CourseSummary],
+    responses=serialization.COMPACT_RESPONSES,
+)
+async def list_nearby_courses(
+    user_id: str,
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(10.0, gt=0, le=NEARBY_MAX_RADIUS_KM),
+    k: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    現在地 (lat, lng) から始点が近い順に、半径 radius_km 以内のコースを最大 k 件返す。
+    始点の格子セル (start_cell) のインデックスで候補を絞り込み、検索半径を広げながら
+    k 件見つかった時点で打ち切るため、テーブル全体は走査しない。
+    route_points・drawing_points は一覧と同様に、簡略化した経路と null を返却。
+    """
+    try:
+        user_uuid = uuid.UUID(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user_id format. Must be UUID.")
+
+    user = await db.get(models.User, user_uuid)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+
+    nearby_courses = await course_queries.find_nearby_courses(db, user_uuid, lat, lng, radius_km, k)
+
+    compact = serialization.wants_compact(request)
+    return serialization.json_response(
+        [
+            serialization.course_summary(
+                course, distance_km, course_queries.preview_route_points(course), None, compact
             )
+            for distance_km, course in nearby_courses
+        ],
+        compact,
+    )
+
+COURSE_EXPORT_CHUNK_SIZE = 200
+
+@app.get(
+    "/users/{user_id}/courses/export",
+    response_class=StreamingResponse,
+    responses=serialization.COURSE_EXPORT_RESPONSES,
+)
+async def export_user_courses(
+    user_id: str,
+    export_format: str = Query("ndjson", alias="format"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    指定ユーザーのコースを古い順にすべて出力する。
+    形式 (format): ndjson（既定。1行に1件で、一括インポートの courses の要素と同じ形） | geojson | gpx
+    カーソルから COURSE_EXPORT_CHUNK_SIZE 件ずつ読み込んでは書き出すため、
+    コースの件数が増えてもメモリ使用量は一定。
+    """
+    if export_format not in serialization.COURSE_EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"format must be one of {tuple(serialization.COURSE_EXPORT_FORMATS)}"
+        )
+    try:
+        user_uuid = uuid.UUID(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user_id format. Must be UUID.")
+
+    user = await db.get(models.User, user_uuid)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+
+    statement = (
+        select(
+            models.Course.id,
+            models.Course.total_distance_km,
+            models.Course.is_favorite,
+            models.Course.created_at,
+            models.Course.route_points,
+            models.Course.drawing_points,
         )
+        .where(models.Course.user_id == user_uuid)
+        .order_by(models.Course.created_at.asc(), models.Course.id.asc())
+        .execution_options(yield_per=COURSE_EXPORT_CHUNK_SIZE)
+    )
+
+    async def generate():
+        result = await db.stream(statement)
+        async for chunk in serialization.course_export(result.partitions(), export_format):
+            yield chunk
 
+    media_type, extension = serialization.COURSE_EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="courses-{user_id}.{extension}"'},
+    )
 
-    # ソート処理
-    if sort_by == "created_at_desc":
-        response_courses.sort(key=lambda x: x.created_at, reverse=True)
-    elif sort_by == "created_at_asc":
-        response_courses.sort(key=lambda x: x.created_at, reverse=False)
-    elif sort_by == "distance_asc":
-        response_courses.sort(key=lambda x: x.distance_to_start_km, reverse=False)
-    elif sort_by == "distance_desc":
-        response_courses.sort(key=lambda x: x.distance_to_start_km, reverse=True)
-    elif sort_by == "total_distance_asc":
-        response_courses.sort(key=lambda x: x.total_distance_km, reverse=False)
-    elif sort_by == "total_distance_desc":
-        response_courses.sort(key=lambda x: x.total_distance_km, reverse=True)
-
-    return response_courses
-
-@app.get("/users/{user_id}/courses/{course_id}", response_model=schemas.CourseSummary)
-def get_user_course(
+@app.get(
+    "/users/{user_id}/courses/{course_id}",
+    response_model=schemas.CourseSummary,
+    responses=serialization.COMPACT_RESPONSES,
+)
+async def get_user_course(
     user_id: str,
     course_id: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_lat: Optional[float] = None,
     current_lng: Optional[float] = None,
 ):
     """
     特定のコース1件の詳細を返す。
+    条件付きGET: ETag / Last-Modified を返し、ユーザーのコースが変わっていなければ 304 を返す
     """
     # user_id / course_id を UUID に変換してクエリする
     try:
@@ -271,7 +702,18 @@ def get_user_course(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid id format. Must be UUID.")
 
-    course = db.query(models.Course).filter(models.Course.user_id == user_uuid, models.Course.id == course_uuid).first()
+    user = await db.get(models.User, user_uuid)
+    if not user:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    # コースが変わっていなければ、コースを読み込まずに 304 またはキャッシュしたレスポンスを返す
+    cache_key, validators, cached = response_cache.cached_response(request, user)
+    if cached is not None:
+        return cached
+
+    course = await db.scalar(
+        select(models.Course).where(models.Course.user_id == user_uuid, models.Course.id == course_uuid)
+    )
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
@@ -283,26 +725,24 @@ def get_user_course(
         start_point = course.route_points[0]
         distance_to_start_km = calculate_distance_km(current_lat, current_lng, start_point.get("lat"), start_point.get("lng"))
        
-    return schemas.CourseSummary(
-        id=str(course.id),
-        total_distance_km=course.total_distance_km,
-        distance_to_start_km=distance_to_start_km,
-        is_favorite=course.is_favorite,
-        created_at=course.created_at,
-        route_points=course.route_points,
-        drawing_points=course.drawing_points,
-    )
+    compact = serialization.wants_compact(request)
+    return response_cache.store(cache_key, validators, serialization.json_response(
+        serialization.course_summary(
+            course, distance_to_start_km, course.route_points, course.drawing_points, compact
+        ),
+        compact,
+    ))
 
 @app.post("/users/{user_id}/courses", status_code=201)
-def create_course_for_user(
+async def create_course_for_user(
     user_id: str,
     payload: schemas.CourseCreateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     コースをDBに保存し、201 Created を返す。
     - user_id は UUID 形式を検証
-    - ユーザーが存在しない場合は 404
+    - ユーザーが存在しない場合は 404（ユーザーの courses_version を増やす UPDATE で存在も確認する）
     - 保存後、Location ヘッダーに作成したコースIDを設定
     - レスポンスボディはなし
     """
@@ -312,11 +752,6 @@ def create_course_for_user(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid user_id format. Must be UUID.")
 
-    # ユーザー存在確認
-    user = db.query(models.User).filter(models.User.id == user_uuid).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
-
     # ポイントをJSONへ整形
     def to_point_dict(p) -> dict:
         return {"lat": float(p.lat), "lng": float(p.lng)}
@@ -327,28 +762,94 @@ def create_course_for_user(
 
     is_favorite = bool(getattr(payload, "is_favorite", False))
 
+    # ユーザーの存在確認を兼ねて courses_version を増やす
+    if not await course_queries.bump_courses_version(db, user_uuid):
+        raise HTTPException(status_code=404, detail="User not found.")
+
     # コース保存
-    new_course = models.Course(
-        user_id=user_uuid,
-        total_distance_km=float(payload.total_distance_km),
-        is_favorite=is_favorite,
-        route_points=route_points,
-        drawing_points=drawing_points,
-    )
-    db.add(new_course)
-    db.commit()
-    db.refresh(new_course)
+    course_id = uuid.uuid4()
+    created = await course_queries.insert_course(db, user_uuid, {
+        "id": course_id,
+        "total_distance_km": float(payload.total_distance_km),
+        "is_favorite": is_favorite,
+        "route_points": route_points,
+        "drawing_points": drawing_points,
+    })
+    if not created:
+        raise HTTPException(status_code=404, detail="User not found.")
+    await db.commit()
 
     return Response(
         status_code=status.HTTP_201_CREATED,
-        headers={"Location": f"/users/{user_id}/courses/{str(new_course.id)}"}
+        headers={"Location": f"/users/{user_id}/courses/{str(course_id)}"}
     )
 
+# 一括インポートで1つのトランザクションで INSERT するコースの件数と、1リクエストで受け付ける最大件数・最大バイト数
+COURSE_IMPORT_BATCH_SIZE = 500
+COURSE_IMPORT_MAX_COURSES = 10000
+COURSE_IMPORT_MAX_BYTES = int(os.environ.get("COURSE_IMPORT_MAX_BYTES", str(64 * 1024 * 1024)))
+
+async def limit_course_import_size(request: Request):
+    """
+    一括インポートのリクエストボディが COURSE_IMPORT_MAX_BYTES を超える場合は 413 を返す。
+    依存関係はボディの検証 (Pydantic モデルへの変換) より前に実行されるため、大きすぎるリクエストを変換せずに拒否できる。
+    """
+    if await request_body_size(request) > COURSE_IMPORT_MAX_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"Request body too large. At most {COURSE_IMPORT_MAX_BYTES} bytes per request."
+        )
+
+@app.post(
+    "/users/{user_id}/courses/bulk",
+    response_model=schemas.CourseBulkCreateResponse,
+    status_code=201,
+    dependencies=[Depends(limit_course_import_size)],
+)
+async def bulk_create_courses_for_user(
+    user_id: str,
+    payload: schemas.CourseBulkCreateRequest,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    複数のコースをまとめて保存し、201 Created と作成したコースIDの一覧（courses と同じ順）を返す。
+    - user_id の検証はリクエストごとに1回だけ行う
+    - COURSE_IMPORT_BATCH_SIZE 件ごとに1つのトランザクションで INSERT する
+      (途中のバッチで失敗した場合、それまでのバッチは保存されたまま 500 を返す)
+    - ボディが COURSE_IMPORT_MAX_BYTES を超える場合は、コースを検証する前に 413
+    - 件数が COURSE_IMPORT_MAX_COURSES を超える場合は 413
+    - created_at を省略したコースはインポートした時刻、id は常に新しく採番する
+    """
+    try:
+        user_uuid = uuid.UUID(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user_id format. Must be UUID.")
+
+    if len(payload.courses) > COURSE_IMPORT_MAX_COURSES:
+        raise HTTPException(
+            status_code=413, detail=f"Too many courses. At most {COURSE_IMPORT_MAX_COURSES} per request."
+        )
+
+    # 経路の簡略化などCPUを使う処理はイベントループの外で行う
+    rows = await run_in_threadpool(
+        course_queries.course_insert_rows, user_uuid, payload.courses, datetime.now(timezone.utc)
+    )
+    # バッチごとに courses_version を増やし、途中までの内容が ETag やキャッシュに残らないようにする
+    # (最初のバッチの UPDATE でユーザーの存在も確認する)
+    for offset in range(0, max(len(rows), 1), COURSE_IMPORT_BATCH_SIZE):
+        if not await course_queries.bump_courses_version(db, user_uuid):
+            raise HTTPException(status_code=404, detail="User not found.")
+        batch = rows[offset:offset + COURSE_IMPORT_BATCH_SIZE]
+        if batch:
+            await db.execute(insert(models.Course), batch)
+        await db.commit()
+
+    return schemas.CourseBulkCreateResponse(created=len(rows), course_ids=[str(row["id"]) for row in rows])
+
 @app.delete("/users/{user_id}/courses/{course_id}", status_code=204)
-def delete_user_course(
+async def delete_user_course(
     user_id: str,
     course_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     指定ユーザーのコースを削除し、204 No Content を返す。
@@ -362,29 +863,19 @@ def delete_user_course(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid id format. Must be UUID.")
 
-    # コース存在＆所有者確認
-    course = (
-        db.query(models.Course)
-        .filter(
-            models.Course.id == course_uuid,
-            models.Course.user_id == user_uuid,
-        )
-        .first()
-    )
-    if not course:
+    # 所有者を条件に含めて削除（コースが存在しない、または他のユーザーのものなら何も削除されない）
+    if not await course_queries.delete_course(db, user_uuid, course_uuid):
         raise HTTPException(status_code=404, detail="Course not found.")
-
-    # 削除
-    db.delete(course)
-    db.commit()
+    await course_queries.bump_courses_version(db, user_uuid)
+    await db.commit()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.post("/users/{user_id}/courses/{course_id}/toggle_favorite", response_model=schemas.ToggleFavoriteResponse)
-def toggle_course_favorite(
+async def toggle_course_favorite(
     user_id: str,
     course_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     指定ユーザーのコースのお気に入りフラグをトグルして返す。
@@ -398,21 +889,99 @@ def toggle_course_favorite(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid id format. Must be UUID.")
 
-    # コース存在＆所有者確認
-    course = (
-        db.query(models.Course)
-        .filter(
-            models.Course.id == course_uuid,
-            models.Course.user_id == user_uuid,
-        )
-        .first()
-    )
-    if not course:
+    # 所有者を条件に含めてトグルし、反転後の値を受け取る
+    is_favorite = await course_queries.toggle_favorite(db, user_uuid, course_uuid)
+    if is_favorite is None:
         raise HTTPException(status_code=404, detail="Course not found.")
+    await course_queries.bump_courses_version(db, user_uuid)
+    await db.commit()
 
-    # トグルして保存
-    course.is_favorite = not bool(course.is_favorite)
-    db.commit()
-    db.refresh(course)
+    return schemas.ToggleFavoriteResponse(id=str(course_uuid), is_favorite=is_favorite)
 
-    return schemas.ToggleFavoriteResponse(id=str(course.id), is_favorite=course.is_favorite)
+
+# ------------------------------------------------------------
+# Admin: Road network cache
+# ------------------------------------------------------------
+@app.get(
+    "/admin/networks",
+    response_model=schemas.NetworkCacheStatus,
+    dependencies=[Depends(admin.require_admin)],
+)
+def read_network_cache_status():
+    """
+    メモリとディスクにある道路ネットワークの一覧（ノード・エッジ数、サイズ、ヒット回数、最後に使われた日時、
+    取得にかかった時間、固定の有無）と、ディスクキャッシュの統計を返す。`X-Admin-Token` が必要。
+    """
+    return routing.network_cache_status()
+
+
+@app.post(
+    "/admin/networks/pin",
+    response_model=schemas.NetworkCacheEntry,
+    dependencies=[Depends(admin.require_admin)],
+)
+def pin_network(region: schemas.NetworkRegion):
+    """
+    指定された範囲のネットワークを読み込み（キャッシュがなければ取得し）、メモリに固定する。
+    固定したネットワークはメモリの件数の上限を超えても破棄しない。
+    """
+    try:
+        network_id = routing.pin_network(region.lat, region.lng, region.distance_m)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return next(network for network in routing.network_cache_status()["networks"] if network["id"] == network_id)
+
+
+@app.delete(
+    "/admin/networks/{network_id}/pin",
+    status_code=204,
+    dependencies=[Depends(admin.require_admin)],
+)
+def unpin_network(network_id: str):
+    """ネットワークの固定を外す。メモリにない場合は 404"""
+    if not routing.unpin_network(network_id):
+        raise HTTPException(status_code=404, detail="Network not found in memory.")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.delete(
+    "/admin/networks/{network_id}",
+    response_model=schemas.NetworkEvictResponse,
+    dependencies=[Depends(admin.require_admin)],
+)
+def evict_network(network_id: str, from_disk: bool = False):
+    """
+    ネットワークをメモリから破棄する。`from_disk=true` の場合はキャッシュファイルも削除する。
+    メモリにもディスクにもない場合は 404
+    """
+    removed = routing.evict_network(network_id, from_disk)
+    if not (removed["memory"] or removed["disk"]):
+        raise HTTPException(status_code=404, detail="Network not found.")
+    return removed
+
+
+@app.post(
+    "/admin/networks/rebuild",
+    status_code=202,
+    dependencies=[Depends(admin.require_admin)],
+)
+def rebuild_network(region: schemas.NetworkRegion, background_tasks: BackgroundTasks):
+    """キャッシュを使わずに指定された範囲のネットワークを取得し直す（バックグラウンドで実行し、すぐに 202 を返す）"""
+    background_tasks.add_task(routing.rebuild_network, region.lat, region.lng, region.distance_m)
+    return {"message": "Accepted: Road network rebuild has started in the background."}
+
+
+@app.post(
+    "/admin/warmup",
+    status_code=202,
+    dependencies=[Depends(admin.require_admin)],
+)
+def warm_up_networks(payload: schemas.NetworkWarmupRequest, background_tasks: BackgroundTasks):
+    """
+    プロセスを再起動せずに経路計算を初期化し、指定された領域のネットワークを読み込む
+    （`pin` の場合はメモリに固定する）。バックグラウンドで実行し、すぐに 202 を返す。
+    """
+    background_tasks.add_task(
+        routing.warm_up_networks, [region.dict() for region in payload.regions], payload.pin
+    )
+    return {"message": "Accepted: Warm-up has started in the background."}
@@ -0,0 +1,309 @@
+"""
+アプリケーションのメトリクスを収集・公開するモジュール
+
+コース計算の各段階（キャッシュ検索、道路網の取得、投影、回転探索、セグメント探索、
+DB書き込み、シリアライズ）の所要時間を計測し、以下の2つの形で公開します。
+
+- リクエスト単位: `Server-Timing` レスポンスヘッダー
+- プロセス全体: `/metrics` エンドポイント（Prometheus テキスト形式）
+
+また、リクエストごとに実行したSQL文の数を数え、同じ2つの形で公開します。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 秒単位のヒストグラムバケット（Dijkstra や道路網の取得は数十秒かかることがある）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [f'{name}="{_escape_label_value(value)}"' for name, value in pairs]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} である必要があります。")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._label_values(labels), 0.0)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """増減する現在値（処理中のリクエスト数など）"""
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """観測値の分布を累積バケットで集計するヒストグラム"""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # ラベル値ごとに [各バケットの件数..., 合計値, 件数] を保持
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = state
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._label_values(labels))
+        return int(state[-1]) if state else 0
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            for i, upper in enumerate(self.buckets):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(upper)))
+                yield f"{self.name}_bucket{labels} {_format_value(state[i])}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {_format_value(state[-1])}"
+
+
+class MetricsRegistry:
+    """メトリクスを登録し、Prometheus のテキスト形式で出力するレジストリ"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if any(m.name == metric.name for m in self._metrics):
+            raise ValueError(f"メトリクス {metric.name} は既に登録されています。")
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = MetricsRegistry()
+
+stage_duration_seconds = registry.histogram(
+    "gps_art_stage_duration_seconds",
+    "コース計算の処理段階ごとの所要時間（秒）",
+    labelnames=("stage",),
+)
+network_cache_requests_total = registry.counter(
+    "gps_art_network_cache_requests_total",
+    "道路ネットワークキャッシュの参照回数（result=hit|waited|miss、waited は他のプロセスの取得を待って読み込んだ場合）",
+    labelnames=("result",),
+)
+network_cache_bytes = registry.gauge(
+    "gps_art_network_cache_bytes",
+    "道路ネットワークのディスクキャッシュの合計サイズ（バイト）",
+)
+network_cache_entries = registry.gauge(
+    "gps_art_network_cache_entries",
+    "道路ネットワークのディスクキャッシュのファイル数",
+)
+network_cache_evictions_total = registry.counter(
+    "gps_art_network_cache_evictions_total",
+    "上限を超えたため削除した道路ネットワークのキャッシュファイルの数",
+)
+segment_cache_requests_total = registry.counter(
+    "gps_art_segment_cache_requests_total",
+    "区間の探索結果のキャッシュ（描画の編集セッション・目標距離に合わせる反復）の参照回数（result=hit|miss）",
+    labelnames=("result",),
+)
+http_requests_in_flight = registry.gauge(
+    "gps_art_http_requests_in_flight",
+    "現在処理中のHTTPリクエスト数",
+)
+handwriting_queue_depth = registry.gauge(
+    "gps_art_handwriting_queue_depth",
+    "書き込み待ちの手書きデータの件数",
+)
+handwriting_records_total = registry.counter(
+    "gps_art_handwriting_records_total",
+    "手書きデータの書き込み件数（result=enqueued|written|dropped|failed）",
+    labelnames=("result",),
+)
+response_cache_requests_total = registry.counter(
+    "gps_art_response_cache_requests_total",
+    "コース一覧・詳細のレスポンスキャッシュの参照回数（result=hit|miss|not_modified）",
+    labelnames=("result",),
+)
+db_statements_per_request = registry.histogram(
+    "gps_art_db_statements_per_request",
+    "1リクエストで実行したSQL文の数（route=エンドポイントのパス）",
+    labelnames=("route",),
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 34),
+)
+
+
+# ------------------------------------------------------------
+# リクエスト単位の段階別計測
+# ------------------------------------------------------------
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing():
+    """現在のコンテキストでリクエスト単位の計測を開始し、終了用のトークンを返します。"""
+    return _request_timings.set([])
+
+
+def finish_request_timing(token) -> List[Tuple[str, float]]:
+    """計測を終了し、記録された (段階名, 秒) のリストを返します。"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def record_stage(stage: str, seconds: float):
+    """段階の所要時間をヒストグラムと（計測中であれば）現在のリクエストに記録します。"""
+    stage_duration_seconds.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """with ブロックの所要時間を段階 `stage` として記録します。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+# ------------------------------------------------------------
+# リクエスト単位のSQL文の計数
+# ------------------------------------------------------------
+# 値は [実行したSQL文の数]（子タスクやスレッドにコンテキストがコピーされても同じリストを数える）
+_request_statements: ContextVar[Optional[List[int]]] = ContextVar("request_statements", default=None)
+
+
+def start_statement_count():
+    """現在のコンテキストでSQL文の計数を開始し、終了用のトークンを返します。"""
+    return _request_statements.set([0])
+
+
+def finish_statement_count(token) -> int:
+    """計数を終了し、実行されたSQL文の数を返します。"""
+    counts = _request_statements.get() or [0]
+    _request_statements.reset(token)
+    return counts[0]
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    """
+    SQLAlchemy の before_cursor_execute イベントのリスナー。
+    計数中であれば現在のリクエストのSQL文の数を1増やします（executemany も1文として数えます）。
+    """
+    counts = _request_statements.get()
+    if counts is not None:
+        counts[0] += 1
+
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    """
+    記録された段階別の所要時間を `Server-Timing` ヘッダーの値に整形します。
+    同じ段階が複数回記録された場合（セグメントごとの経路探索など）は合計し、回数を desc に付与します。
+    """
+    totals: Dict[str, List[float]] = {}
+    for stage, seconds in timings:
+        entry = totals.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    metrics = []
+    for stage, (seconds, count) in totals.items():
+        metric = f"{stage};dur={seconds * 1000:.1f}"
+        if count > 1:
+            metric += f';desc="{count} calls"'
+        metrics.append(metric)
+    return ", ".join(metrics)
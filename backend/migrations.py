@@ -0,0 +1,234 @@
+"""
+既存データベースのスキーマ更新・データ移行
+
+`Base.metadata.create_all` は既存のテーブルに列やインデックスを追加しないため、
+起動時に `upgrade()` を呼び出して不足分を補う。各ステップは何度実行しても安全（冪等）。
+
+ALTER TABLE で追加した列は NULL を許す列になる。モデルで nullable=False の座標列は、移行後に NULL が
+残っていないことを確認し（残っている場合は RuntimeError で中断する）、PostgreSQL では NOT NULL 制約を付ける。
+SQLite は既存の列に制約を追加できないため、アップグレードしたDBでは NULL を許す列のままになる。
+
+手動で実行する場合（リポジトリのルートで）:
+    python -m backend.migrations
+"""
+import json
+
+from sqlalchemy import inspect, or_, text
+from sqlalchemy.engine import Engine
+
+from . import models
+
+GEOMETRY_BATCH_SIZE = 1000
+
+# JSON列 → バイナリ列の対応 (テーブル名, JSON列名, 新しい列の key)
+LEGACY_GEOMETRY_COLUMNS = (
+    ("courses", "route_points", "route_points"),
+    ("courses", "drawing_points", "drawing_points"),
+    ("handwritings", "drawing_points", "drawing_points"),
+)
+
+
+def _column_names(engine: Engine, table_name: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+
+def _add_missing_columns(engine: Engine, table, column_keys):
+    """モデルに定義されていてテーブルに存在しない列を ALTER TABLE で追加する。"""
+    existing = _column_names(engine, table.name)
+    added = []
+    with engine.begin() as conn:
+        for key in column_keys:
+            column = table.c[key]
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            default = f" DEFAULT {column.server_default.arg.text}" if column.server_default is not None else ""
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}"))
+            added.append(column.name)
+    if added:
+        print(f"マイグレーション: {table.name} に列 {added} を追加しました。")
+    return added
+
+
+def _create_missing_indexes(engine: Engine, table):
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def migrate_json_geometry(engine: Engine) -> dict:
+    """
+    JSONで保存されていた座標列をバイナリ形式の列に移し、古いJSON列を削除する。
+
+    Returns:
+        "テーブル.列" ごとの {"rows": 件数, "json_bytes": 移行前のバイト数, "packed_bytes": 移行後のバイト数}
+    """
+    report = {}
+    tables = {table.name: table for table in models.Base.metadata.sorted_tables}
+    for table_name, legacy_name, key in LEGACY_GEOMETRY_COLUMNS:
+        if not inspect(engine).has_table(table_name) or legacy_name not in _column_names(engine, table_name):
+            continue
+        column = tables[table_name].c[key]
+
+        stats = {"rows": 0, "json_bytes": 0, "packed_bytes": 0}
+        select_batch = text(
+            f"SELECT id, {legacy_name} FROM {table_name} WHERE {column.name} IS NULL LIMIT :limit"
+        )
+        update_row = text(f"UPDATE {table_name} SET {column.name} = :packed WHERE id = :id")
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(select_batch, {"limit": GEOMETRY_BATCH_SIZE}).fetchall()
+                if not rows:
+                    break
+                params = []
+                for row_id, raw_points in rows:
+                    # SQLite では JSON 文字列、PostgreSQL ではデコード済みの値が返る
+                    if isinstance(raw_points, (bytes, str)):
+                        json_bytes = len(raw_points)
+                        points = json.loads(raw_points) or []
+                    else:
+                        points = raw_points or []
+                        json_bytes = len(json.dumps(points))
+                    packed = column.type.process_bind_param(points, engine.dialect)
+                    params.append({"id": row_id, "packed": packed})
+                    stats["rows"] += 1
+                    stats["json_bytes"] += json_bytes
+                    stats["packed_bytes"] += len(packed)
+                conn.execute(update_row, params)
+
+        # 移行中に旧バージョンのアプリが追加した行などで NULL が残る場合は、JSON列を残したまま中断する
+        _require_not_null(engine, table_name, column.name)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table_name} DROP COLUMN {legacy_name}"))
+        report[f"{table_name}.{legacy_name}"] = stats
+        _print_geometry_report(f"{table_name}.{legacy_name}", stats)
+    return report
+
+
+def _require_not_null(engine: Engine, table_name: str, column_name: str):
+    """列に NULL の行が残っている場合は RuntimeError を送出する。"""
+    with engine.connect() as conn:
+        missing = conn.execute(text(f"SELECT COUNT(*) FROM {table_name} WHERE {column_name} IS NULL")).scalar()
+    if missing:
+        raise RuntimeError(f"マイグレーション: {table_name}.{column_name} に NULL の行が {missing} 件残っています。")
+
+
+def enforce_geometry_not_null(engine: Engine):
+    """
+    nullable=False の座標列に NULL が残っていないことを確認し、PostgreSQL では NOT NULL 制約を付ける
+    （新規に作成したDBと同じスキーマにする）。SQLite では確認のみ。
+    """
+    for table in (models.Course.__table__, models.Handwriting.__table__):
+        if not inspect(engine).has_table(table.name):
+            continue
+        for column in table.columns:
+            if column.nullable or not isinstance(column.type, models.PackedPoints):
+                continue
+            _require_not_null(engine, table.name, column.name)
+            if engine.dialect.name != "sqlite":
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET NOT NULL"))
+
+
+def _print_geometry_report(name: str, stats: dict):
+    saved = stats["json_bytes"] - stats["packed_bytes"]
+    ratio = stats["packed_bytes"] / stats["json_bytes"] if stats["json_bytes"] else 0.0
+    print(
+        f"マイグレーション: {name} をバイナリ形式に移行しました "
+        f"({stats['rows']} 件, {stats['json_bytes']:,} → {stats['packed_bytes']:,} バイト, "
+        f"{saved:,} バイト削減, 移行後のサイズ {ratio:.1%})"
+    )
+
+
+def backfill_course_start_points(engine: Engine) -> int:
+    """
+    始点の列（start_lat / start_lng / start_cell）が未設定のコースに route_points の始点を設定する。
+    GEOMETRY_BATCH_SIZE 件ずつ、ID の順に1つのトランザクションで更新する
+    （経路が空で始点を設定できないコースは未設定のまま残るため、ID で位置を進める）。
+    """
+    courses = models.Course.__table__
+    updated = 0
+    last_id = None
+    while True:
+        with engine.begin() as conn:
+            statement = (
+                courses.select()
+                .with_only_columns(courses.c.id, courses.c.route_points)
+                .where(or_(courses.c.start_lat.is_(None), courses.c.start_cell.is_(None)))
+                .order_by(courses.c.id)
+                .limit(GEOMETRY_BATCH_SIZE)
+            )
+            if last_id is not None:
+                statement = statement.where(courses.c.id > last_id)
+            rows = conn.execute(statement).fetchall()
+            if not rows:
+                break
+            for course_id, route_points in rows:
+                values = models.course_start_columns(route_points)
+                if values["start_lat"] is None:
+                    continue
+                conn.execute(courses.update().where(courses.c.id == course_id).values(**values))
+                updated += 1
+            last_id = rows[-1][0]
+    if updated:
+        print(f"マイグレーション: {updated} 件のコースに始点座標を設定しました。")
+    return updated
+
+
+def backfill_course_previews(engine: Engine) -> int:
+    """サムネイル用の経路（preview_points）が未設定のコースに、簡略化した route_points を設定する。"""
+    courses = models.Course.__table__
+    updated = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                courses.select()
+                .with_only_columns(courses.c.id, courses.c.route_points)
+                .where(courses.c.preview_points.is_(None))
+                .limit(GEOMETRY_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            for course_id, route_points in rows:
+                conn.execute(
+                    courses.update()
+                    .where(courses.c.id == course_id)
+                    .values(preview_points=models.course_preview_points(route_points))
+                )
+            updated += len(rows)
+    if updated:
+        print(f"マイグレーション: {updated} 件のコースにサムネイル用の経路を設定しました。")
+    return updated
+
+
+def upgrade(engine: Engine):
+    """すべてのマイグレーションを順に適用する。"""
+    users = models.User.__table__
+    courses = models.Course.__table__
+    handwritings = models.Handwriting.__table__
+    if inspect(engine).has_table(users.name):
+        _add_missing_columns(engine, users, ["courses_version", "courses_updated_at"])
+    if inspect(engine).has_table(courses.name):
+        _add_missing_columns(
+            engine,
+            courses,
+            ["route_points", "drawing_points", "preview_points", "start_lat", "start_lng", "start_cell"],
+        )
+    if inspect(engine).has_table(handwritings.name):
+        _add_missing_columns(engine, handwritings, ["drawing_points"])
+    migrate_json_geometry(engine)
+    enforce_geometry_not_null(engine)
+
+    if inspect(engine).has_table(handwritings.name):
+        _create_missing_indexes(engine, handwritings)
+
+    if inspect(engine).has_table(courses.name):
+        _create_missing_indexes(engine, courses)
+        backfill_course_start_points(engine)
+        backfill_course_previews(engine)
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    upgrade(engine)
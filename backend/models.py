@@ -6,10 +6,17 @@ from sqlalchemy import (
     DateTime,
     Float,
     Boolean,
-    JSON,
-    func
+    Integer,
+    Index,
+    LargeBinary,
+    func,
+    text
 )
+from sqlalchemy import event, inspect
 from .database import Base
+from . import spatial
+from .calculator import geometry
+from .geometry_codec import PointArray, encode_points, decode_points, LATLNG_DECIMALS, DISPLAY_DECIMALS
 from sqlalchemy.types import TypeDecorator, CHAR
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 
@@ -45,10 +52,36 @@ class UUID(TypeDecorator):
         
         return value
 
+class PackedPoints(TypeDecorator):
+    """
+    座標列を geometry_codec のバイナリ形式で保存する型
+    読み込み時は PointArray（ndarray を保持する座標列）を返す。
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, keys=("lat", "lng"), decimals=LATLNG_DECIMALS):
+        super().__init__()
+        self.keys = tuple(keys)
+        self.decimals = decimals
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        return encode_points(PointArray.from_points(value, self.keys).array, self.decimals)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        return PointArray(decode_points(value), self.keys)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(UUID, primary_key=True, default=uuid.uuid4)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # コースの作成・削除・お気に入りの変更のたびに増やす版数と、その日時（一覧・詳細の ETag / Last-Modified）
+    courses_version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    courses_updated_at = Column(DateTime(timezone=True), nullable=True)
 
 class Course(Base):
     __tablename__ = "courses"
@@ -57,11 +90,68 @@ class Course(Base):
     total_distance_km = Column(Float, nullable=False)
     is_favorite = Column(Boolean, nullable=False, default=False)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
-    route_points = Column(JSON, nullable=False)
-    drawing_points = Column(JSON, nullable=False)
+    route_points = Column("route_geom", PackedPoints(), key="route_points", nullable=False)
+    drawing_points = Column("drawing_geom", PackedPoints(), key="drawing_points", nullable=False)
+    # 一覧のサムネイル用に route_points を簡略化した経路（course_preview_points）
+    preview_points = Column("preview_geom", PackedPoints(), key="preview_points", nullable=True)
+    # 一覧のソート・距離計算用に route_points の始点を保持する（route_points が空の場合は NULL）
+    start_lat = Column(Float, nullable=True)
+    start_lng = Column(Float, nullable=True)
+    # 近傍検索用の始点の格子セルID（spatial.cell_id）
+    start_cell = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_courses_user_id_created_at", "user_id", "created_at"),
+        Index("ix_courses_user_id_total_distance_km", "user_id", "total_distance_km"),
+        Index("ix_courses_user_id_start_cell", "user_id", "start_cell"),
+    )
+
+def course_start_columns(route_points) -> dict:
+    """route_points から start_lat / start_lng / start_cell 列の値を求める"""
+    if not route_points:
+        return {"start_lat": None, "start_lng": None, "start_cell": None}
+    start_point = route_points[0]
+    start_lat, start_lng = start_point.get("lat"), start_point.get("lng")
+    return {"start_lat": start_lat, "start_lng": start_lng, "start_cell": spatial.cell_id(start_lat, start_lng)}
+
+# 一覧のサムネイル用の経路の最大点数と、それ以上分割しない誤差（度、約1m）
+PREVIEW_MAX_POINTS = 64
+PREVIEW_TOLERANCE_DEG = 1e-5
+
+def course_preview_points(route_points) -> PointArray:
+    """route_points を最大 PREVIEW_MAX_POINTS 点に簡略化した経路を求める"""
+    route = PointArray.from_points(route_points or [])
+    return PointArray(geometry.simplify(route.array, PREVIEW_MAX_POINTS, PREVIEW_TOLERANCE_DEG), route.keys)
+
+def course_derived_columns(route_points) -> dict:
+    """
+    route_points から求める列（始点・preview_points）の値を求める
+    (ORM のイベントが発生しない一括 INSERT では、この値を行に含める)
+    """
+    return {**course_start_columns(route_points), "preview_points": course_preview_points(route_points)}
+
+def _set_course_derived_columns(course):
+    for key, value in course_derived_columns(course.route_points).items():
+        setattr(course, key, value)
+
+@event.listens_for(Course, "before_insert")
+def _set_course_derived_columns_on_insert(mapper, connection, course):
+    _set_course_derived_columns(course)
+
+@event.listens_for(Course, "before_update")
+def _set_course_derived_columns_on_update(mapper, connection, course):
+    if inspect(course).attrs.route_points.history.has_changes():
+        _set_course_derived_columns(course)
 
 class Handwriting(Base):
     __tablename__ = 'handwritings'
     id = Column(UUID, primary_key=True, default=uuid.uuid4)
-    drawing_points = Column(JSON, nullable=False)
+    drawing_points = Column(
+        "drawing_geom", PackedPoints(keys=("x", "y"), decimals=DISPLAY_DECIMALS), key="drawing_points", nullable=False
+    )
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # 一覧のキーセットページング・エクスポート用
+        Index("ix_handwritings_created_at_id", "created_at", "id"),
+    )
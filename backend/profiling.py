@@ -0,0 +1,148 @@
+"""
+リクエスト単位のプロファイリングを行うモジュール
+
+特定の描画だけが遅い場合に、そのリクエストの処理だけをプロファイルするために使う。
+以下の2つのモードをサポートする。
+
+- sample: 一定間隔で呼び出しスタックを採取するサンプリング方式。
+  出力は flamegraph.pl / speedscope で読み込める collapsed stack 形式（テキスト）。
+- cprofile: cProfile による決定的プロファイル。
+  出力は pstats 形式（snakeviz などで読み込める）。
+  Python 3.12 以降は cProfile をプロセスで同時に1つしか有効にできず、有効な間は他のスレッドの処理も
+  記録されるため、cprofile モードのプロファイルは1件ずつ行う（実行中は ProfilerBusy）。
+"""
+import cProfile
+import io
+import marshal
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+PROFILE_MODES = ("sample", "cprofile")
+DEFAULT_SAMPLE_INTERVAL = 0.005  # サンプリング間隔（秒）
+
+# cprofile モードのプロファイルを1件ずつにするためのロック
+_cprofile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """他のリクエストの cprofile モードのプロファイル（または他のプロファイラ）が実行中"""
+
+
+def get_profile_dir() -> str:
+    """プロファイルの保存先ディレクトリを返す（環境変数 PROFILE_DIR で変更可能）。"""
+    return os.environ.get("PROFILE_DIR", "backend/profiles")
+
+
+class ProfileResult:
+    """プロファイル結果（ファイルの内容と形式）"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.content = b""
+        self.duration_s = 0.0
+
+    @property
+    def media_type(self) -> str:
+        return "text/plain; charset=utf-8" if self.mode == "sample" else "application/octet-stream"
+
+    @property
+    def extension(self) -> str:
+        return "folded" if self.mode == "sample" else "prof"
+
+
+class StackSampler:
+    """
+    指定スレッドの呼び出しスタックを一定間隔で採取するサンプリングプロファイラ
+    """
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """collapsed stack 形式（1行に「スタック 回数」）で返す。"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+@contextmanager
+def profile(mode: str, sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+    """
+    with ブロック内の処理を現在のスレッドでプロファイルする。
+    ブロックを抜けると、yield した ProfileResult に結果が格納される。
+    cprofile モードで他のプロファイルが実行中の場合は ProfilerBusy を送出する。
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"profile mode must be one of {PROFILE_MODES}")
+
+    result = ProfileResult(mode)
+    start = time.perf_counter()
+    if mode == "sample":
+        sampler = StackSampler(threading.get_ident(), sample_interval)
+        sampler.start()
+        try:
+            yield result
+        finally:
+            sampler.stop()
+            result.content = sampler.folded().encode("utf-8")
+            result.duration_s = time.perf_counter() - start
+    else:
+        if not _cprofile_lock.acquire(blocking=False):
+            raise ProfilerBusy("Another cprofile profiling is in progress.")
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Python 3.12 以降で、プロセス内の他のプロファイラが有効な場合
+                raise ProfilerBusy(str(e)) from e
+            try:
+                yield result
+            finally:
+                profiler.disable()
+                profiler.create_stats()
+                buffer = io.BytesIO()
+                marshal.dump(profiler.stats, buffer)
+                result.content = buffer.getvalue()
+                result.duration_s = time.perf_counter() - start
+        finally:
+            _cprofile_lock.release()
+
+
+def save_profile(result: ProfileResult, name: str, profile_dir: Optional[str] = None) -> str:
+    """プロファイル結果をファイルに保存し、そのパスを返す。"""
+    profile_dir = profile_dir or get_profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    filename = f"{name}_{timestamp}_{uuid.uuid4().hex[:8]}.{result.extension}"
+    filepath = os.path.join(profile_dir, filename)
+    with open(filepath, "wb") as f:
+        f.write(result.content)
+    return filepath
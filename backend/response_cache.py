@@ -0,0 +1,143 @@
+"""
+コース一覧・詳細のレスポンスの条件付きGETとプロセス内キャッシュ
+
+コースの一覧・詳細の内容は、ユーザーの courses_version（コースの作成・削除・お気に入りの変更のたびに増える）
+とリクエスト（パス・クエリ・Accept）が同じであれば変わらない。そこで
+
+- ETag を (リクエスト, 版数) から作り、If-None-Match（または If-Modified-Since）が一致すれば
+  コースを読み込まずに 304 Not Modified を返す
+  （Last-Modified は秒単位のため、最終更新と同じ秒のうちは付けない。同じ秒に続けて更新された場合に、
+    If-Modified-Since だけを送るクライアントへ古い内容の 304 を返さないようにする）
+- JSON にしたレスポンスを (リクエスト, 版数) をキーに LRU でキャッシュし、同じ版数の間は使い回す
+
+版数はDBに保存しているため、複数のプロセスで動かしても ETag は一致し、キャッシュが古い内容を返すこともない。
+キャッシュの件数は環境変数 RESPONSE_CACHE_SIZE で変更できる（0 でキャッシュしない）。
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+
+from . import metrics, serialization
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))
+
+# キャッシュに保存しないヘッダー（レスポンスを作り直すときに設定される）
+_GENERATED_HEADERS = {"content-length", "content-type"}
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    headers: dict
+
+
+class ResponseCache:
+    """シリアライズ済みレスポンスの LRU キャッシュ"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: CachedResponse):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = ResponseCache()
+
+
+def cache_key(request: Request, user) -> tuple:
+    """レスポンスの内容を決めるもの（パス・クエリ・compact 形式か・ユーザーの版数）"""
+    query = "&".join(sorted(f"{name}={value}" for name, value in request.query_params.multi_items()))
+    return request.url.path, query, serialization.wants_compact(request), user.courses_version or 0
+
+
+def validator_headers(key: tuple, user, now: Optional[datetime] = None) -> dict:
+    """ETag / Last-Modified など、条件付きGETのためのヘッダー（now は現在時刻。省略時は現在のUTC時刻）"""
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+    # gzip で圧縮してもしなくても同じ内容なので弱い ETag にする
+    # no-cache: ブラウザはキャッシュを保存するが、使う前に毎回 If-None-Match で確認する
+    headers = {"ETag": f'W/"{digest}"', "Cache-Control": "private, no-cache", "Vary": "Accept"}
+    updated_at = serialization.as_utc(user.courses_updated_at)
+    # 最終更新の秒が過ぎてから付ける（その秒の更新はすべて反映済みになり、以降の更新は Last-Modified が変わる）
+    now = now or datetime.now(timezone.utc)
+    if updated_at is not None and int(updated_at.timestamp()) < int(now.timestamp()):
+        headers["Last-Modified"] = format_datetime(updated_at.replace(microsecond=0), usegmt=True)
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match の弱い比較（W/ を無視して比較する）"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    """リクエストの条件（If-None-Match を優先し、なければ If-Modified-Since）を満たしていれば True"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or "Last-Modified" not in headers:
+        return False
+    try:
+        return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+def cached_response(request: Request, user) -> Tuple[tuple, dict, Optional[Response]]:
+    """
+    条件付きGETとキャッシュを確認する。
+    (キャッシュのキー, 付けるヘッダー, 304 またはキャッシュしたレスポンス) を返し、
+    レスポンスを作る必要がある場合の3つ目は None。
+    """
+    key = cache_key(request, user)
+    headers = validator_headers(key, user)
+    if is_not_modified(request, headers):
+        metrics.response_cache_requests_total.inc(result="not_modified")
+        return key, headers, Response(status_code=304, headers=headers)
+    entry = cache.get(key)
+    if entry is None:
+        metrics.response_cache_requests_total.inc(result="miss")
+        return key, headers, None
+    metrics.response_cache_requests_total.inc(result="hit")
+    return key, headers, Response(content=entry.body, media_type=entry.media_type, headers={**entry.headers, **headers})
+
+
+def store(key: tuple, headers: dict, response: Response) -> Response:
+    """作ったレスポンスにヘッダーを付け、キャッシュに保存して返す"""
+    # X-Next-Cursor などエンドポイントが付けたヘッダーだけを保存する（ETag などは取り出すときに付け直す）
+    skipped = _GENERATED_HEADERS | {name.lower() for name in headers}
+    extra_headers = {name: value for name, value in response.headers.items() if name not in skipped}
+    cache.put(key, CachedResponse(body=response.body, media_type=response.media_type, headers=extra_headers))
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,203 @@
+"""
+経路計算（GPSArtGenerator）の遅延初期化とウォームアップ
+
+GPSArtGenerator のモジュールは osmnx / geopandas / networkx / scipy / shapely などを読み込むため、
+import だけで1秒以上かかる。DBだけを使うエンドポイントやテストがその時間を待たなくて済むよう、
+最初に経路計算が必要になったときに import・初期化する（get_generator）。
+
+環境変数 ROUTING_WARMUP=1（既定）の場合、起動時にバックグラウンドのスレッドで先に初期化しておき、
+最初の経路計算のリクエストが初期化を待たないようにする。
+
+道路ネットワークのキャッシュ（メモリ・ディスク）の状態の取得と操作（管理API用）もここで行う。
+経路計算を初期化していない場合も、ディスクキャッシュの一覧と削除は osmnx などを読み込まずに行える。
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from . import metrics
+
+if TYPE_CHECKING:
+    from .calculator.gps_art_generator import GPSArtGenerator
+    from .calculator.network_cache import NetworkDiskCache
+
+ROUTING_WARMUP = os.environ.get("ROUTING_WARMUP", "1") == "1"
+
+_generator: Optional["GPSArtGenerator"] = None
+_lock = threading.Lock()
+
+
+def get_generator() -> "GPSArtGenerator":
+    """
+    GPSArtGenerator のインスタンスを返す（初回のみ import と初期化を行う）。
+    初期化には時間がかかるため、イベントループではなくスレッドプールから呼ぶこと。
+    """
+    global _generator
+    if _generator is None:
+        with _lock:
+            if _generator is None:
+                with metrics.timed_stage("routing_init"):
+                    from .calculator.gps_art_generator import GPSArtGenerator
+                    _generator = GPSArtGenerator()
+    return _generator
+
+
+def is_ready() -> bool:
+    """経路計算の初期化が済んでいるか"""
+    return _generator is not None
+
+
+def _warm_up():
+    start = time.perf_counter()
+    try:
+        get_generator()
+    except Exception as e:
+        # 失敗しても起動は止めず、最初のリクエストで再度初期化する
+        print(f"経路計算のウォームアップに失敗しました: {e}")
+        return
+    print(f"経路計算のウォームアップが完了しました ({time.perf_counter() - start:.2f}秒)。")
+
+
+def start_warmup(enabled: bool = ROUTING_WARMUP) -> Optional[threading.Thread]:
+    """enabled の場合、バックグラウンドのスレッドで経路計算を初期化する"""
+    if not enabled or is_ready():
+        return None
+    thread = threading.Thread(target=_warm_up, name="routing-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def shutdown():
+    """経路計算が使うワーカープロセスを終了する（初期化していなければ何もしない）"""
+    if _generator is not None:
+        _generator.segment_routing.shutdown()
+
+
+# ------------------------------------------------------------
+# 道路ネットワークのキャッシュの管理
+# ------------------------------------------------------------
+def _disk_cache() -> "NetworkDiskCache":
+    if _generator is not None:
+        return _generator.network_cache
+    from .calculator.network_cache import NETWORK_CACHE_DIR, NetworkDiskCache
+    return NetworkDiskCache(NETWORK_CACHE_DIR)
+
+
+def _timestamp(seconds: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(seconds, timezone.utc) if seconds is not None else None
+
+
+def network_cache_status() -> dict:
+    """
+    メモリとディスクにある道路ネットワークの一覧（識別子ごとにまとめる）と、ディスクキャッシュの統計。
+    最後に使われた日時が新しい順に並べる。
+    """
+    from .calculator.network_cache import FILE_SUFFIX, NETWORK_MEMORY_MAX_ENTRIES
+
+    disk = _disk_cache()
+    networks: Dict[str, dict] = {}
+    for entry in disk.entries():
+        metadata = disk.metadata(entry.path)
+        network_id = os.path.basename(entry.path)[:-len(FILE_SUFFIX)]
+        networks[network_id] = {
+            "id": network_id,
+            "lat": entry.lat,
+            "lng": entry.lon,
+            "distance_m": entry.distance_m,
+            "in_memory": False,
+            "on_disk": True,
+            "active": False,
+            "pinned": False,
+            "node_count": metadata.get("node_count"),
+            "edge_count": metadata.get("edge_count"),
+            "size_bytes": entry.size_bytes,
+            "build_seconds": metadata.get("build_seconds"),
+            "memory_hits": 0,
+            "disk_hits": disk.hits_by_path.get(entry.path, 0),
+            "last_access": entry.last_access,
+            "loaded_at": None,
+        }
+
+    memory = _generator.memory_network_summaries() if _generator is not None else []
+    for summary in memory:
+        network = networks.setdefault(summary["id"], {
+            "id": summary["id"], "on_disk": False, "size_bytes": None, "disk_hits": 0, "last_access": None,
+        })
+        network.update(
+            lat=summary["lat"],
+            lng=summary["lng"],
+            distance_m=summary["distance_m"],
+            in_memory=True,
+            active=summary["active"],
+            pinned=summary["pinned"],
+            node_count=summary["node_count"],
+            edge_count=summary["edge_count"],
+            build_seconds=summary["build_seconds"] if summary["build_seconds"] is not None else network.get("build_seconds"),
+            memory_hits=summary["memory_hits"],
+            last_access=max(summary["last_access"], network["last_access"] or 0),
+            loaded_at=summary["loaded_at"],
+        )
+
+    ordered = sorted(networks.values(), key=lambda network: network["last_access"] or 0, reverse=True)
+    for network in ordered:
+        network["last_access"] = _timestamp(network["last_access"])
+        network["loaded_at"] = _timestamp(network["loaded_at"])
+    return {
+        "routing_ready": is_ready(),
+        "memory_max_entries": _generator.memory_networks.max_entries if _generator else NETWORK_MEMORY_MAX_ENTRIES,
+        "disk": disk.stats(),
+        "networks": ordered,
+    }
+
+
+def pin_network(lat: float, lng: float, distance_m: Optional[int] = None) -> str:
+    """指定された範囲のネットワークを読み込んでメモリに固定し、識別子を返す（経路計算を初期化する）"""
+    return get_generator().pin_network(lat, lng, distance_m)
+
+
+def unpin_network(network_id: str) -> bool:
+    if _generator is None:
+        return False
+    return _generator.unpin_network(network_id)
+
+
+def evict_network(network_id: str, from_disk: bool = False) -> Dict[str, bool]:
+    """ネットワークをメモリから破棄し、from_disk の場合はキャッシュファイルも削除する"""
+    if _generator is not None:
+        return _generator.evict_network(network_id, from_disk)
+    removed = {"memory": False, "disk": False}
+    disk = _disk_cache()
+    path = disk.path_for_id(network_id)
+    if from_disk and path is not None and os.path.exists(path):
+        disk.remove(path)
+        removed["disk"] = True
+    return removed
+
+
+def rebuild_network(lat: float, lng: float, distance_m: Optional[int] = None):
+    """キャッシュを使わずにネットワークを取得し直す（時間がかかるためバックグラウンドで呼ぶ）"""
+    start = time.perf_counter()
+    try:
+        get_generator().rebuild_network(lat, lng, distance_m)
+    except Exception as e:
+        print(f"道路ネットワークの再取得に失敗しました ({lat}, {lng}): {e}")
+        return
+    print(f"道路ネットワークを再取得しました ({lat}, {lng}, {time.perf_counter() - start:.2f}秒)。")
+
+
+def warm_up_networks(regions: Iterable[dict], pin: bool = False):
+    """
+    経路計算を初期化し、各領域 {"lat", "lng", "distance_m"} のネットワークを読み込む（pin の場合は固定する）。
+    失敗した領域は読み飛ばす（時間がかかるためバックグラウンドで呼ぶ）。
+    """
+    _warm_up()
+    for region in regions:
+        try:
+            if pin:
+                pin_network(region["lat"], region["lng"], region.get("distance_m"))
+            else:
+                get_generator()._load_road_network(region["lat"], region["lng"], distance_m=region.get("distance_m"))
+        except Exception as e:
+            print(f"道路ネットワークのウォームアップに失敗しました ({region['lat']}, {region['lng']}): {e}")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 import uuid
@@ -16,26 +16,60 @@ class UserDetail(BaseModel):
 # ------------------------------------------------------------
 # Routes: Calculate API Schemas
 # ------------------------------------------------------------
+# 無限大・NaN や範囲外の座標は保存できないため 422 にする
 class DisplayPoint(BaseModel):
-    x: float
-    y: float
+    x: float = Field(allow_inf_nan=False)
+    y: float = Field(allow_inf_nan=False)
 
 
 class LatLng(BaseModel):
-    lat: float
-    lng: float
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
 
 
 class RouteCalculateRequest(BaseModel):
     drawing_display_points: list[DisplayPoint]
     start_location: LatLng
     target_distance_km: float
+    # コースの全長を目標距離に合わせる（形状を拡大・縮小して探索し直すため計算に時間がかかる）
+    fit_distance: bool = False
+    # 描画の編集セッションを始める（レスポンスの edit_session_id で再計算する）
+    edit_session: bool = False
+    # サーバーが発行した描画の編集セッションのID。同じセッションの再計算では
+    # 最初の計算の回転角度と縮尺を使い、変わった区間だけを探索する
+    edit_session_id: Optional[str] = Field(None, min_length=1, max_length=128)
 
 
 class RouteCalculateResponse(BaseModel):
     total_distance_km: float
     route_points: list[LatLng]
     drawing_points: list[LatLng]
+    # 編集セッションを使った場合のセッションID（知らないIDを指定した場合は新しく発行したID）
+    edit_session_id: Optional[str] = None
+
+
+# 同じ開始地点から複数のコースをまとめて計算する（/routes/calculate-batch）
+class RouteBatchItem(BaseModel):
+    drawing_display_points: list[DisplayPoint]
+    target_distance_km: float
+
+
+class RouteBatchCalculateRequest(BaseModel):
+    start_location: LatLng
+    items: list[RouteBatchItem]
+    fit_distance: bool = False
+
+
+# 計算できなかった項目は error のみを返す
+class RouteBatchResult(BaseModel):
+    total_distance_km: Optional[float] = None
+    route_points: Optional[list[LatLng]] = None
+    drawing_points: Optional[list[LatLng]] = None
+    error: Optional[str] = None
+
+
+class RouteBatchCalculateResponse(BaseModel):
+    results: list[RouteBatchResult]
 
 
 class NoticeRequest(BaseModel):
@@ -48,6 +82,7 @@ class CourseSummary(BaseModel):
     distance_to_start_km: float
     is_favorite: bool
     created_at: datetime
+    # 一覧ではサムネイル用に簡略化した経路、詳細では全体の経路
     route_points: list[LatLng]
     # 一覧では返さないため null 固定
     drawing_points: Optional[list[LatLng]] = None
@@ -57,6 +92,19 @@ class CourseCreateRequest(BaseModel):
     route_points: list[LatLng]
     drawing_points: list[LatLng]
 
+# 一括インポートの1件（エクスポートした NDJSON の1行と同じ形。id は無視して新しく採番する）
+class CourseImportItem(CourseCreateRequest):
+    is_favorite: bool = False
+    # 省略した場合はインポートした時刻
+    created_at: Optional[datetime] = None
+
+class CourseBulkCreateRequest(BaseModel):
+    courses: list[CourseImportItem]
+
+class CourseBulkCreateResponse(BaseModel):
+    created: int
+    course_ids: list[str]
+
     # 1件の「お気に入り状態」だけ返すシンプルなレスポンス
 class ToggleFavoriteResponse(BaseModel):
     id: str
@@ -75,3 +123,52 @@ class Handwriting(HandwritingBase):
 
     class Config:
         from_attributes = True
+
+
+# ------------------------------------------------------------
+# Admin: Road network cache
+# ------------------------------------------------------------
+class NetworkRegion(BaseModel):
+    lat: float
+    lng: float
+    # 中心点から東西南北の取得範囲（メートル）。省略時は GPSArtGenerator.network_distance
+    distance_m: Optional[int] = None
+
+
+class NetworkWarmupRequest(BaseModel):
+    regions: list[NetworkRegion] = []
+    # 読み込んだネットワークをメモリに固定するか
+    pin: bool = False
+
+
+class NetworkCacheEntry(BaseModel):
+    id: str
+    lat: float
+    lng: float
+    distance_m: int
+    in_memory: bool
+    on_disk: bool
+    active: bool
+    pinned: bool
+    node_count: Optional[int] = None
+    edge_count: Optional[int] = None
+    # キャッシュファイルのサイズ（メモリにのみある場合は None）
+    size_bytes: Optional[int] = None
+    build_seconds: Optional[float] = None
+    # このプロセスでのメモリ・ディスクキャッシュのヒット回数
+    memory_hits: int = 0
+    disk_hits: int = 0
+    last_access: Optional[datetime] = None
+    loaded_at: Optional[datetime] = None
+
+
+class NetworkCacheStatus(BaseModel):
+    routing_ready: bool
+    memory_max_entries: int
+    disk: dict
+    networks: list[NetworkCacheEntry]
+
+
+class NetworkEvictResponse(BaseModel):
+    memory: bool
+    disk: bool
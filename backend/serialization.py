@@ -0,0 +1,186 @@
+"""
+座標列を含むレスポンスの高速なJSONシリアライズ
+
+経路の点ごとに pydantic モデルを作って検証・再シリアライズする代わりに、
+dict / list をそのまま pydantic_core.to_json で JSON バイト列にする。
+レスポンスの形は各エンドポイントの response_model（OpenAPI のスキーマ）と同じ。
+
+クライアントが Accept ヘッダーに COMPACT_MEDIA_TYPE を指定した場合は、
+座標列を `[{"lat": .., "lng": ..}, ...]` の代わりに `[[lat, lng], ...]` で返す。
+
+コースのエクスポートは NDJSON / GeoJSON / GPX の形式で、行のまとまりごとに書き出す。
+"""
+from datetime import timezone
+from typing import AsyncIterator, Optional
+from xml.sax.saxutils import escape
+
+from fastapi import Request, Response
+from pydantic_core import to_json
+
+from .geometry_codec import PointArray
+
+COMPACT_MEDIA_TYPE = "application/vnd.gpsart.compact+json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+GPX_MEDIA_TYPE = "application/gpx+xml"
+
+# コースのエクスポート形式ごとの (Content-Type, ファイルの拡張子)
+COURSE_EXPORT_FORMATS = {
+    "ndjson": (NDJSON_MEDIA_TYPE, "ndjson"),
+    "geojson": (GEOJSON_MEDIA_TYPE, "geojson"),
+    "gpx": (GPX_MEDIA_TYPE, "gpx"),
+}
+
+# OpenAPI に compact 形式のレスポンスがあることを示す（スキーマは application/json と同じで座標列のみ配列）
+COMPACT_RESPONSES = {
+    200: {
+        "description": f"Accept: {COMPACT_MEDIA_TYPE} の場合、座標列を [[lat, lng], ...] で返す",
+        "content": {COMPACT_MEDIA_TYPE: {}},
+    }
+}
+
+NDJSON_RESPONSES = {
+    200: {
+        "description": "1行に1件の JSON (NDJSON)",
+        "content": {NDJSON_MEDIA_TYPE: {}},
+    }
+}
+
+COURSE_EXPORT_RESPONSES = {
+    200: {
+        "description": "format に指定した形式のコース一覧（NDJSON は一括インポートの courses の要素と同じ形）",
+        "content": {media_type: {} for media_type, _ in COURSE_EXPORT_FORMATS.values()},
+    }
+}
+
+
+def wants_compact(request: Request) -> bool:
+    """クライアントが compact 形式を要求しているか"""
+    return COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def points_payload(points, compact: bool) -> Optional[list]:
+    """
+    座標列（PointArray または `[{"lat": .., "lng": ..}, ...]`）を JSON に変換できる値にする。
+    compact の場合は `[[lat, lng], ...]` にする。
+    """
+    if points is None:
+        return None
+    if isinstance(points, PointArray):
+        return points.array.tolist() if compact else points.to_list()
+    if compact:
+        return [[point["lat"], point["lng"]] for point in points]
+    return points
+
+
+def course_summary(course, distance_to_start_km: float, route_points, drawing_points, compact: bool) -> dict:
+    """schemas.CourseSummary と同じ形の dict を作る"""
+    return {
+        "id": str(course.id),
+        "total_distance_km": course.total_distance_km,
+        "distance_to_start_km": distance_to_start_km,
+        "is_favorite": course.is_favorite,
+        "created_at": course.created_at,
+        "route_points": points_payload(route_points, compact),
+        "drawing_points": points_payload(drawing_points, compact),
+    }
+
+
+def as_utc(created_at):
+    """
+    DBから取得したdatetimeがタイムゾーン情報を持たない場合(naive)でもUTCとして扱うようにする
+    これにより、フロントエンド側で正しくJSTに変換できるようになる
+    """
+    if created_at is not None and created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at
+
+
+def handwriting(row) -> dict:
+    """schemas.Handwriting と同じ形の dict を作る"""
+    return {
+        "drawing_points": points_payload(row.drawing_points, False),
+        "id": row.id,
+        "created_at": as_utc(row.created_at),
+    }
+
+
+def course_record(row) -> dict:
+    """エクスポートする NDJSON の1行（schemas.CourseImportItem と同じ形に id を加えたもの）を作る"""
+    return {
+        "id": str(row.id),
+        "total_distance_km": row.total_distance_km,
+        "is_favorite": row.is_favorite,
+        "created_at": as_utc(row.created_at),
+        "route_points": points_payload(row.route_points, False),
+        "drawing_points": points_payload(row.drawing_points, False),
+    }
+
+
+def course_feature(row) -> dict:
+    """コースの経路を GeoJSON の LineString の Feature にする（座標は [経度, 緯度] の順）"""
+    return {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": row.route_points.array[:, ::-1].tolist()},
+        "properties": {
+            "id": str(row.id),
+            "total_distance_km": row.total_distance_km,
+            "is_favorite": row.is_favorite,
+            "created_at": as_utc(row.created_at),
+        },
+    }
+
+
+def gpx_track(row) -> bytes:
+    """コースの経路を GPX の trk 要素にする"""
+    points = "".join(f'<trkpt lat="{lat}" lon="{lng}"/>' for lat, lng in row.route_points.array.tolist())
+    created_at = as_utc(row.created_at)
+    description = f"{row.total_distance_km:.2f} km" + (f", {created_at.isoformat()}" if created_at else "")
+    return (
+        f"<trk><name>{row.id}</name><desc>{escape(description)}</desc>"
+        f"<trkseg>{points}</trkseg></trk>\n"
+    ).encode()
+
+
+async def course_export(partitions: AsyncIterator[list], export_format: str) -> AsyncIterator[bytes]:
+    """
+    行のまとまり（partitions）を順に export_format の形式のバイト列にする。
+    GeoJSON と GPX は先頭と末尾を別に書き出すため、全件をメモリに載せずに1つの文書にできる。
+    """
+    if export_format == "ndjson":
+        async for rows in partitions:
+            yield ndjson_lines(rows, course_record)
+    elif export_format == "geojson":
+        yield b'{"type":"FeatureCollection","features":[\n'
+        separator = b""
+        async for rows in partitions:
+            if rows:
+                yield separator + b",\n".join(to_json(course_feature(row)) for row in rows)
+                separator = b",\n"
+        yield b"\n]}\n"
+    elif export_format == "gpx":
+        yield (
+            b'<?xml version="1.0" encoding="UTF-8"?>\n'
+            b'<gpx version="1.1" creator="gps-art" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        )
+        async for rows in partitions:
+            yield b"".join(gpx_track(row) for row in rows)
+        yield b"</gpx>\n"
+    else:
+        raise ValueError(f"未対応のエクスポート形式です: {export_format}")
+
+
+def ndjson_lines(rows, to_dict) -> bytes:
+    """rows を1行1件の JSON (NDJSON) のバイト列にする"""
+    return b"".join(to_json(to_dict(row)) + b"\n" for row in rows)
+
+
+def json_response(content, compact: bool = False, headers: Optional[dict] = None) -> Response:
+    """content を JSON バイト列にしたレスポンスを返す"""
+    response = Response(
+        content=to_json(content),
+        media_type=COMPACT_MEDIA_TYPE if compact else "application/json",
+        headers=headers,
+    )
+    response.headers["Vary"] = "Accept"
+    return response
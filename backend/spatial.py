@@ -0,0 +1,49 @@
+"""
+コースの始点を近傍検索するための格子(グリッド)インデックス
+
+緯度経度を CELL_SIZE_DEG 度四方のセルに分割し、セルを整数IDで表す。
+セルIDは「緯度方向の行番号 * LNG_CELLS + 経度方向の列番号」のため、同じ行のセルは連続した値になる。
+半径 r の円を覆うセルは行ごとの範囲 (BETWEEN) で表せるので、(user_id, start_cell) の
+インデックスを使った範囲検索だけで候補を絞り込め、テーブル全体を走査せずに済む。
+"""
+import math
+from typing import List, Optional, Tuple
+
+from .calculator.geometry import EARTH_MEAN_RADIUS_KM
+
+CELL_SIZE_DEG = 0.01  # 約1.1km（緯度方向）
+LNG_CELLS = int(round(360 / CELL_SIZE_DEG))
+# 候補の距離は geometry.haversine_km で判定するため、セルの範囲も同じ地球半径から求める
+# （異なる値を使うと円の端の近くのセルが範囲から漏れる）
+KM_PER_DEG_LAT = EARTH_MEAN_RADIUS_KM * math.pi / 180
+
+
+def cell_id(lat: Optional[float], lng: Optional[float]) -> Optional[int]:
+    """緯度経度が属するセルのIDを返す。座標がない場合はNone。"""
+    if lat is None or lng is None:
+        return None
+    row = int(math.floor((lat + 90) / CELL_SIZE_DEG))
+    col = int(math.floor((lng + 180) / CELL_SIZE_DEG)) % LNG_CELLS
+    return row * LNG_CELLS + col
+
+
+def cell_ranges(lat: float, lng: float, radius_km: float) -> List[Tuple[int, int]]:
+    """
+    (lat, lng) を中心とする半径 radius_km の円を覆うセルIDの範囲 [(最小, 最大), ...] を返す。
+    行ごとに1つの範囲になる（経度180度線をまたぐ範囲は考慮しない）。
+    """
+    lat_span = radius_km / KM_PER_DEG_LAT
+    min_lat = max(lat - lat_span, -90.0)
+    max_lat = min(lat + lat_span, 90.0 - CELL_SIZE_DEG)
+
+    # 円の中で経度方向の幅が最大になるのは極に近い側の端
+    widest_lat = min(max(abs(min_lat), abs(max_lat)), 89.0)
+    lng_span = radius_km / (KM_PER_DEG_LAT * math.cos(math.radians(widest_lat)))
+    min_lng = max(lng - lng_span, -180.0)
+    max_lng = min(lng + lng_span, 180.0 - CELL_SIZE_DEG)
+
+    min_row = int(math.floor((min_lat + 90) / CELL_SIZE_DEG))
+    max_row = int(math.floor((max_lat + 90) / CELL_SIZE_DEG))
+    min_col = int(math.floor((min_lng + 180) / CELL_SIZE_DEG))
+    max_col = int(math.floor((max_lng + 180) / CELL_SIZE_DEG))
+    return [(row * LNG_CELLS + min_col, row * LNG_CELLS + max_col) for row in range(min_row, max_row + 1)]
@@ -1,33 +1,49 @@
 # backend/tests/conftest.py
 import sys
 import os
+import shutil
+import tempfile
 import pytest
 
 # プロジェクトルートをsys.pathに追加
 # conftest.pyが backend/tests/ にあるので、2階層上がる
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
+# テストでは経路計算のウォームアップとアプリ起動時のマイグレーションを行わない（テスト用のDBは下で作成する）
+os.environ.setdefault("ROUTING_WARMUP", "0")
+os.environ.setdefault("DB_AUTO_MIGRATE", "0")
+# テスト用のDBと道路ネットワークのディスクキャッシュは一時ディレクトリに作る（テスト終了後に削除する）
+TEST_DB_DIR = tempfile.mkdtemp(prefix="gpsart-test-")
+os.environ.setdefault("NETWORK_CACHE_DIR", os.path.join(TEST_DB_DIR, "network-cache"))
+
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 # backend パッケージ内のモジュールをインポート
 # (pytest をプロジェクトルートから実行すれば 'backend.' で見つかるはず)
-from backend.database import Base, get_db
-from backend.main import app
+from backend.database import Base, get_async_db, get_db, to_async_url
+from backend.main import app, handwriting_writer
+from backend import response_cache
 
-# テスト用のインメモリSQLiteデータベースURL
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# テスト用の一時ファイルのSQLiteデータベースURL
+# (APIの非同期エンジンとテストの同期エンジンから同じDBを見るため、インメモリではなくファイルにする)
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(TEST_DB_DIR, 'test.db')}"
 
 # テスト用エンジンを作成
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool, # テスト用にStaticPoolを使用
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# APIのエンドポイント用の非同期エンジン
+# (TestClient はリクエストごとにイベントループが変わりうるため、接続をプールしない)
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # テスト用のDBセッションを提供する関数
 def override_get_db():
     try:
@@ -36,16 +52,24 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 # アプリケーションの依存関係をテスト用にオーバーライド
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+# 手書きデータの書き込みキューもテスト用のDBに書き込む
+handwriting_writer.session_factory = TestingSessionLocal
 
 @pytest.fixture(scope="session", autouse=True)
 def create_test_database():
     # テスト開始前にテーブルを作成
     Base.metadata.create_all(bind=engine)
     yield
-    # テスト終了後にテーブルを削除 (必要に応じて)
-    # Base.metadata.drop_all(bind=engine)
+    # テスト終了後に一時ファイルのDBを削除
+    engine.dispose()
+    shutil.rmtree(TEST_DB_DIR, ignore_errors=True)
 
 @pytest.fixture(scope="function")
 def client(create_test_database):
@@ -59,21 +83,77 @@ def client(create_test_database):
 def db_session(create_test_database):
     """
     各テスト関数で利用するDBセッションフィクスチャ
-    テストごとにデータをクリアする (シンプルなロールバック)
+    アプリ側のセッションからもデータが見えるよう実際にコミットし、
+    テスト終了後に全テーブルのデータを削除する
     """
-    # Create a new connection for each test
-    connection = engine.connect()
-    # Begin a transaction
-    transaction = connection.begin()
-    # Create a session bound to this connection
-    session = TestingSessionLocal(bind=connection)
+    session = TestingSessionLocal()
 
     # Yield the session to the test function
     yield session
 
     # Clean up after the test function completes
     session.close()
-    # Rollback the transaction to discard changes
-    transaction.rollback()
-    # Close the connection
-    connection.close()
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    # DBを直接変更したため、レスポンスキャッシュも空にする
+    response_cache.cache.clear()
+
+
+# ------------------------------------------------------------
+# 経路計算: 負荷試験用の格子状の道路ネットワーク（backend/benchmarks/load_test.py）を使う
+# （osmnx などの読み込みに時間がかかるため、経路計算のテストでだけフィクスチャの中でインポートする）
+# ------------------------------------------------------------
+@pytest.fixture
+def fixture_network_distance_m():
+    """generator に読み込む道路ネットワークの範囲（メートル）。テストモジュールで上書きできる"""
+    return 3000
+
+@pytest.fixture
+def empty_generator(tmp_path):
+    """
+    道路ネットワークを読み込んでいない GPSArtGenerator
+    （ネットワークのキャッシュファイルはテストごとの一時ディレクトリに書き込む）
+    """
+    from backend.calculator.gps_art_generator import GPSArtGenerator
+    from backend.calculator.network_cache import NetworkDiskCache
+
+    generator = GPSArtGenerator()
+    generator.network_cache = NetworkDiskCache(str(tmp_path))
+    yield generator
+    generator.segment_routing.shutdown()
+
+@pytest.fixture
+def generator(empty_generator, fixture_network_distance_m):
+    """格子状の道路ネットワークを読み込んだ GPSArtGenerator"""
+    from backend.benchmarks.load_test import install_fixture_network
+
+    install_fixture_network(empty_generator, distance_m=fixture_network_distance_m)
+    return empty_generator
+
+@pytest.fixture
+def start_location():
+    """格子状の道路ネットワークの中心（コースの開始地点）"""
+    from backend.benchmarks.load_test import FIXTURE_LAT, FIXTURE_LNG
+
+    return {"lat": FIXTURE_LAT, "lng": FIXTURE_LNG}
+
+@pytest.fixture
+def drawings():
+    """手書きの図形（円、ハート、星）のディスプレイ座標"""
+    from backend.benchmarks.load_test import drawing_shapes
+
+    return drawing_shapes()
+
+@pytest.fixture
+def count_calls(monkeypatch):
+    """
+    オブジェクトのメソッドの呼び出しを記録する関数を返す。
+    count_calls(obj, name) は呼び出しごとに引数を追加するリストを返す（メソッドはそのまま実行する）
+    """
+    def count(obj, name):
+        calls = []
+        method = getattr(obj, name)
+        monkeypatch.setattr(obj, name, lambda *args, **kwargs: calls.append(args) or method(*args, **kwargs))
+        return calls
+    return count
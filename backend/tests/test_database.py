@@ -0,0 +1,22 @@
+from backend.database import pool_args, to_async_url
+
+
+def test_to_async_url():
+    # 同期ドライバの DATABASE_URL を非同期ドライバの URL に変換できることを検証する
+    assert to_async_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    assert (
+        to_async_url("postgresql://user:secret@db:5432/gpsart")
+        == "postgresql+asyncpg://user:secret@db:5432/gpsart"
+    )
+    assert to_async_url("postgresql+psycopg2://db/gpsart") == "postgresql+asyncpg://db/gpsart"
+
+
+def test_pool_args(monkeypatch):
+    # SQLite 以外では接続プールの設定を環境変数から読み込むことを検証する
+    assert pool_args("sqlite:///./test.db") == {}
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "0")
+    args = pool_args("postgresql+asyncpg://db/gpsart")
+    assert args["pool_size"] == 20
+    assert args["max_overflow"] == 0
+    assert args["pool_pre_ping"] is True
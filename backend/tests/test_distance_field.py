@@ -0,0 +1,58 @@
+import networkx as nx
+import numpy as np
+import pytest
+from shapely.geometry import LineString
+
+from backend.calculator import distance_field, geometry
+
+
+def road_network(edges, geometries=None):
+    """(x1, y1, x2, y2) の直線の道路からなる投影済みのネットワーク"""
+    graph = nx.MultiDiGraph()
+    for i, (x1, y1, x2, y2) in enumerate(edges):
+        graph.add_node(2 * i, x=x1, y=y1)
+        graph.add_node(2 * i + 1, x=x2, y=y2)
+        data = {}
+        if geometries and i in geometries:
+            data["geometry"] = LineString(geometries[i])
+        graph.add_edge(2 * i, 2 * i + 1, **data)
+    return graph
+
+
+def test_lookup_measures_distance_to_edges_not_nodes():
+    # ノードから離れたエッジ上の点も道路として扱い、道路からの距離を双線形補間で求めることを検証する
+    field = distance_field.build(road_network([(0, 0, 1000, 0), (0, 300, 0, 300)]), resolution=10)
+    distances = field.lookup([(500, 0), (500, 40), (250, 125), (500, 300)])
+    np.testing.assert_allclose(distances, [0, 40, 125, 300], atol=field.resolution)
+    # 格子の外の点は格子からはみ出した距離を加える
+    assert field.lookup([(500, -200)])[0] == pytest.approx(200, abs=field.resolution)
+
+
+def test_build_follows_curved_edge_geometry():
+    # エッジの geometry（折れ線）に沿ってラスタ化することを検証する
+    graph = road_network([(0, 0, 1000, 0)], geometries={0: [(0, 0), (500, 500), (1000, 0)]})
+    field = distance_field.build(graph, resolution=10)
+    assert field.lookup([(500, 500)])[0] == pytest.approx(0, abs=field.resolution)
+    assert field.lookup([(500, 0)])[0] > 300
+
+
+def test_build_limits_grid_size():
+    # 広い範囲では1辺のセル数が上限を超えないよう格子の間隔を広げることを検証する
+    field = distance_field.build(road_network([(0, 0, 100_000, 50_000)]), resolution=10, max_cells_per_side=500)
+    assert max(field.values.shape) <= 500
+    assert field.resolution == pytest.approx(100_000 / 499)
+
+
+def test_fit_errors_finds_rotation_aligned_with_roads():
+    # 道路に沿った L 字を90度回転させた形状について、元に戻す角度の誤差が最小になることを検証する
+    field = distance_field.build(road_network([(0, 0, 1000, 0), (1000, 0, 1000, 600)]), resolution=10)
+    l_shape = geometry.resample([(0, 0), (1000, 0), (1000, 600)], 50)
+    shape = geometry.rotate(l_shape, 90)
+    angles = np.arange(0, 360, 1.0)
+
+    errors = distance_field.fit_errors(field, shape, angles)
+    assert errors.shape == (360,)
+    assert angles[np.argmin(errors)] == 270
+    # 1角度ずつ geometry.rotate と lookup で計算した誤差と一致する
+    expected = [np.sum(field.lookup(geometry.rotate(shape, angle)).astype(np.float64) ** 4) for angle in (0, 45, 270)]
+    np.testing.assert_allclose(errors[[0, 45, 270]], expected, rtol=1e-6)
@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import routing
+from backend.benchmarks.load_test import install_fixture_network
+from backend.calculator import geometry
+
+
+@pytest.mark.parametrize("shape_index, target_km", [(0, 2.0), (2, 5.0)])
+def test_fit_distance_brings_route_within_tolerance(generator, start_location, drawings, shape_index, target_km):
+    # 固定の倍率では目標距離から外れるコースが、fit_distance では許容誤差以内になることを検証する
+    drawing = drawings[shape_index]
+    plain = generator.calculate_route(drawing, start_location, target_km)
+    fitted = generator.calculate_route(drawing, start_location, target_km, fit_distance=True)
+
+    assert abs(plain["total_distance_km"] - target_km) / target_km > generator.distance_tolerance
+    assert abs(fitted["total_distance_km"] - target_km) / target_km <= generator.distance_tolerance
+    # 返す形状も拡大・縮小した形状
+    assert fitted["drawing_points"][0] == plain["drawing_points"][0]
+    assert fitted["drawing_points"] != plain["drawing_points"]
+
+
+def test_fit_distance_reuses_network_and_unchanged_segments(generator, start_location, drawings, count_calls):
+    # 反復の間でネットワークを読み込み直さず、始点と終点のノードが同じ区間は探索し直さないことを検証する
+    circle = drawings[0]
+    segments = count_calls(generator, "_route_segment")
+    generator.calculate_route(circle, start_location, 5.0)
+    single_run_segments = len(segments)
+
+    segments.clear()
+    loads = count_calls(generator, "_load_road_network")
+    iterations = count_calls(generator, "_find_routes_for_shapes")
+    generator.calculate_route(circle, start_location, 5.0, fit_distance=True)
+
+    assert len(loads) == 1
+    assert len(iterations) >= 2
+    assert len(segments) < len(iterations) * single_run_segments
+
+
+def test_fit_distance_measures_route_on_the_network_it_switched_to(generator, start_location, drawings, count_calls):
+    # 反復の途中で広い範囲のネットワークに切り替えた場合も、コースの全長と座標をそのコースを探索した
+    # ネットワークで求めることを検証する（格子のノードIDはネットワークの範囲ごとに異なる位置を指す）
+    install_fixture_network(generator, distance_m=700)
+    heart = drawings[1]
+    loads = count_calls(generator, "_load_road_network")
+    result = generator.calculate_route(heart, start_location, 2.0, fit_distance=True)
+
+    assert len(loads) == 2
+    points = result["route_points"]
+    steps_km = [
+        geometry.haversine_km(a["lat"], a["lng"], [b["lat"]], [b["lng"]])[0] for a, b in zip(points[:-1], points[1:])
+    ]
+    # 隣り合う点は格子の隣り合うノード（100m 間隔）
+    assert max(steps_km) < 0.11
+    assert sum(steps_km) == pytest.approx(result["total_distance_km"], abs=0.1)
+    # まとめて計算する場合も、項目ごとにそのコースのネットワークで求める
+    assert generator.calculate_routes(
+        [{"drawing_display_points": heart, "target_distance_km": 2.0}] * 2, start_location, fit_distance=True
+    ) == [result, result]
+
+
+def test_next_length_adjustment(generator):
+    # 1回目は長さの比、2回目以降は割線法で倍率を求め、既に試した倍率になる場合は終了することを検証する
+    assert generator._next_length_adjustment([(0.7, 4000)], 5000) == pytest.approx(0.875)
+    assert generator._next_length_adjustment([(0.7, 4000), (0.875, 6000)], 5000) == pytest.approx(0.7875)
+    # 倍率を上げても長くならない場合は長さの比で求める
+    assert generator._next_length_adjustment([(0.7, 4000), (0.8, 3800)], 5000) == pytest.approx(0.8 * 5000 / 3800)
+    # 上限で打ち切り、同じ倍率を試すことになる場合は None
+    assert generator._next_length_adjustment([(1.4, 100)], 5000) == generator.max_length_adjustment
+    assert generator._next_length_adjustment([(1.4, 100), (1.5, 100)], 5000) is None
+
+
+def test_calculate_endpoint_passes_fit_distance(client: TestClient, monkeypatch):
+    # fit_distance を指定した場合だけ経路計算に渡すことを検証する
+    calls = []
+
+    def fake_calculate_route(drawing_display_points, start_location, target_distance_km, **kwargs):
+        calls.append(kwargs)
+        return {"total_distance_km": target_distance_km, "route_points": [], "drawing_points": []}
+
+    monkeypatch.setattr(routing, "get_generator", lambda: SimpleNamespace(calculate_route=fake_calculate_route))
+    payload = {
+        "drawing_display_points": [{"x": 0, "y": 0}, {"x": 10, "y": 10}],
+        "start_location": {"lat": 35.0, "lng": 139.0},
+        "target_distance_km": 3.0,
+    }
+    assert client.post("/routes/calculate", json=payload).status_code == 200
+    assert client.post("/routes/calculate", json={**payload, "fit_distance": True}).status_code == 200
+    assert calls == [{}, {"fit_distance": True}]
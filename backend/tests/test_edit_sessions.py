@@ -0,0 +1,129 @@
+import copy
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from backend import routing
+from backend.benchmarks.load_test import install_fixture_network
+from backend.calculator.edit_sessions import EditSessionStore
+
+
+def edit_heart(heart):
+    heart = copy.deepcopy(heart)
+    for point in heart[20:28]:
+        point["x"] += 15
+    return heart
+
+
+def test_resubmitted_drawing_reuses_all_segments(generator, start_location, drawings, count_calls):
+    # 同じセッションで同じ描画を再計算した場合、角度の探索も区間の探索もせずに同じ結果を返すことを検証する
+    heart = drawings[1]
+    first = generator.calculate_route(heart, start_location, 4.0, start_edit_session=True)
+    session_id = first["edit_session_id"]
+
+    segments = count_calls(generator, "_route_segment")
+    rotations = count_calls(generator, "_find_best_rotation")
+    assert generator.calculate_route(heart, start_location, 4.0, edit_session_id=session_id) == first
+    assert (len(segments), len(rotations)) == (0, 0)
+
+
+def test_edited_drawing_reroutes_only_changed_segments(generator, start_location, drawings, count_calls):
+    # 描画の一部を編集した場合は変わった区間だけを探索し、結果はすべて探索し直した場合と同じことを検証する
+    heart = drawings[1]
+    segments = count_calls(generator, "_route_segment")
+    first = generator.calculate_route(heart, start_location, 4.0, start_edit_session=True)
+    session_id = first["edit_session_id"]
+    first_segments = len(segments)
+
+    segments.clear()
+    edited = generator.calculate_route(edit_heart(heart), start_location, 4.0, edit_session_id=session_id)
+    assert 0 < len(segments) < first_segments
+    # 回転角度と縮尺は固定したまま（始点は同じで、描画の変わっていない部分は同じ座標）
+    assert edited["drawing_points"][0] == first["drawing_points"][0]
+    assert edited["drawing_points"][-1] == first["drawing_points"][-1]
+
+    # 区間の探索結果を空にして同じ配置で探索し直しても同じ結果になる
+    _, session = generator.edit_sessions.session_for(session_id, (start_location["lat"], start_location["lng"]), 4.0)
+    session.segments.bind(None)
+    assert generator.calculate_route(edit_heart(heart), start_location, 4.0, edit_session_id=session_id) == edited
+
+
+def test_session_keeps_its_network_when_another_is_loaded(generator, start_location, drawings, count_calls):
+    # 他のリクエストが同じ範囲を含む別のネットワークを読み込んでも、セッションは前回のネットワークで計算し、
+    # 区間の探索結果を使い続けることを検証する
+    heart = drawings[1]
+    first = generator.calculate_route(heart, start_location, 4.0, start_edit_session=True)
+    # 範囲の小さいネットワークほど優先して使われる
+    other = install_fixture_network(generator, distance_m=2000)
+    generator.calculate_route(heart, start_location, 4.0)
+    assert generator.get_road_network() is other.road_network
+
+    segments = count_calls(generator, "_route_segment")
+    loads = count_calls(generator, "_load_road_network")
+    assert generator.calculate_route(heart, start_location, 4.0, edit_session_id=first["edit_session_id"]) == first
+    assert (len(segments), len(loads)) == (0, 0)
+
+
+def test_changed_target_distance_starts_new_session(generator, start_location, drawings, count_calls):
+    # 目標距離を変えた場合は、回転角度と縮尺を決め直すことを検証する
+    heart = drawings[1]
+    session_id = generator.calculate_route(heart, start_location, 4.0, start_edit_session=True)["edit_session_id"]
+
+    rotations = count_calls(generator, "_find_best_rotation")
+    result = generator.calculate_route(heart, start_location, 2.0, edit_session_id=session_id)
+    assert len(rotations) == 1
+    assert result == {**generator.calculate_route(heart, start_location, 2.0), "edit_session_id": session_id}
+
+
+def test_edit_session_store_issues_ids_and_limits_entries_and_age(monkeypatch):
+    # セッションIDはストアが発行し、件数の上限を超えた場合と一定時間使われなかった場合にセッションを破棄することを検証する
+    now = [1000.0]
+    monkeypatch.setattr("backend.calculator.edit_sessions.time.time", lambda: now[0])
+    store = EditSessionStore(max_entries=2, ttl_seconds=60)
+    a, first = store.session_for(None, (35.0, 139.0), 3.0)
+    b, _ = store.session_for(None, (35.0, 139.0), 3.0)
+    assert a != b and len(a) >= 20
+    assert store.session_for(a, (35.0, 139.0), 3.0) == (a, first)
+    store.session_for(None, (35.0, 139.0), 3.0)
+    assert len(store) == 2
+    assert store.session_for(a, (35.0, 139.0), 3.0) == (a, first)
+    # クライアントが決めたIDは使わず、新しいIDを発行する
+    made_up, _ = store.session_for("draw-1", (35.0, 139.0), 3.0)
+    assert made_up != "draw-1"
+
+    now[0] += 61
+    renewed, session = store.session_for(a, (35.0, 139.0), 3.0)
+    assert renewed != a and session is not first
+    assert len(store) == 1
+    assert store.remove(renewed) and not store.remove(renewed)
+
+
+def test_calculate_endpoint_passes_edit_session(client: TestClient, monkeypatch):
+    # 編集セッションの開始・IDを経路計算に渡して発行されたIDを返し、セッションの終了は 204 を返すことを検証する
+    calls = []
+
+    def fake_calculate_route(drawing_display_points, start_location, target_distance_km, **kwargs):
+        calls.append(kwargs)
+        result = {"total_distance_km": target_distance_km, "route_points": [], "drawing_points": []}
+        if kwargs:
+            result["edit_session_id"] = kwargs.get("edit_session_id", "issued")
+        return result
+
+    ended = []
+    fake = SimpleNamespace(calculate_route=fake_calculate_route, end_edit_session=ended.append)
+    monkeypatch.setattr(routing, "get_generator", lambda: fake)
+    monkeypatch.setattr(routing, "is_ready", lambda: True)
+    payload = {
+        "drawing_display_points": [{"x": 0, "y": 0}, {"x": 10, "y": 10}],
+        "start_location": {"lat": 35.0, "lng": 139.0},
+        "target_distance_km": 3.0,
+    }
+    assert "edit_session_id" not in client.post("/routes/calculate", json=payload).json()
+    assert client.post("/routes/calculate", json={**payload, "edit_session": True}).json()["edit_session_id"] == "issued"
+    response = client.post("/routes/calculate", json={**payload, "edit_session_id": "issued"})
+    assert response.json()["edit_session_id"] == "issued"
+    assert calls == [{}, {"start_edit_session": True}, {"edit_session_id": "issued"}]
+    assert client.post("/routes/calculate", json={**payload, "edit_session_id": "x" * 129}).status_code == 422
+
+    assert client.delete("/routes/edit-sessions/issued").status_code == 204
+    assert ended == ["issued"]
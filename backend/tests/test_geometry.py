@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from backend.calculator import geometry
+
+
+def test_path_length_and_cumulative_lengths():
+    # パスの全長と累積距離が区間長の合計になることを検証する
+    points = [(0, 0), (3, 4), (3, 4), (6, 8)]
+    assert geometry.path_length(points) == pytest.approx(10.0)
+    np.testing.assert_allclose(geometry.cumulative_lengths(points), [0, 5, 5, 10])
+    assert geometry.path_length([(1, 1)]) == 0.0
+
+
+def test_resample_is_evenly_spaced_along_path():
+    # リサンプリング結果が弧長に沿って等間隔で、始点と終点を含むことを検証する
+    points = np.array([(0, 0), (10, 0), (10, 10)])
+    resampled = geometry.resample(points, 5)
+    np.testing.assert_allclose(resampled, [(0, 0), (5, 0), (10, 0), (10, 5), (10, 10)])
+    assert resampled.shape == (5, 2)
+
+
+def test_resample_degenerate_paths():
+    # 長さ0のパスや1点のみの指定でも始点を返すことを検証する
+    np.testing.assert_allclose(geometry.resample([(2, 3), (2, 3)], 3), [(2, 3)] * 3)
+    np.testing.assert_allclose(geometry.resample([(0, 0), (4, 0)], 1), [(0, 0)])
+
+
+def test_scale_to_geo_matches_target_length():
+    # スケーリング後のパスが始点をアンカーに合わせ、目標の長さ（メートル）になることを検証する
+    anchor_lat, anchor_lon = 43.0, 141.0
+    lonlat = geometry.scale_to_geo([(0, 0), (100, 0), (100, 100)], anchor_lat, anchor_lon, 2000)
+
+    np.testing.assert_allclose(lonlat[0], (anchor_lon, anchor_lat))
+    m_per_deg_lon = geometry.M_PER_DEG_LAT * np.cos(np.radians(anchor_lat))
+    meters = np.column_stack((
+        (lonlat[:, 0] - anchor_lon) * m_per_deg_lon,
+        (lonlat[:, 1] - anchor_lat) * geometry.M_PER_DEG_LAT,
+    ))
+    assert geometry.path_length(meters) == pytest.approx(2000)
+    # ディスプレイ座標の y 下向きは南向きになる
+    assert lonlat[2, 1] < anchor_lat
+
+
+def test_rotate_around_first_point():
+    # 始点を中心に回転し、行列積1回で全点が変換されることを検証する
+    rotated = geometry.rotate([(1, 1), (2, 1), (1, 3)], 90)
+    np.testing.assert_allclose(rotated, [(1, 1), (1, 2), (-1, 1)], atol=1e-12)
+
+
+def test_simplify_keeps_corners_and_respects_max_points():
+    # 直線上の点は間引かれ、角と始点・終点が残ることを検証する
+    line = np.column_stack((np.linspace(0, 10, 101), np.zeros(101)))
+    square = np.vstack((line, line[1:, ::-1] + (10, 0)))
+    simplified = geometry.simplify(square, max_points=10, tolerance=1e-9)
+    np.testing.assert_allclose(simplified, [(0, 0), (10, 0), (10, 10)])
+
+    rng = np.random.default_rng(0)
+    walk = np.cumsum(rng.normal(size=(1000, 2)), axis=0)
+    simplified = geometry.simplify(walk, max_points=50)
+    assert len(simplified) == 50
+    np.testing.assert_allclose(simplified[[0, -1]], walk[[0, -1]])
+
+
+def test_max_radius_is_rotation_invariant():
+    # アンカーから最も遠い点までの距離が形状の向きによらないことを検証する
+    anchor_lat, anchor_lon = 35.0, 139.0
+    shape = [(0, 0), (100, 0), (100, 100), (0, 100), (0, 0)]
+    radii = [
+        geometry.max_radius_m(
+            geometry.scale_to_geo(geometry.rotate(shape, angle), anchor_lat, anchor_lon, 4000),
+            anchor_lat, anchor_lon,
+        )
+        for angle in (0, 45, 130)
+    ]
+    assert radii == pytest.approx([1000 * np.sqrt(2)] * 3, rel=1e-2)
+    assert geometry.max_radius_m([], anchor_lat, anchor_lon) == 0.0
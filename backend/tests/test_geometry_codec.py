@@ -0,0 +1,140 @@
+import json
+import uuid
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from backend import migrations, models
+from backend.geometry_codec import (
+    DISPLAY_DECIMALS,
+    LATLNG_DECIMALS,
+    PointArray,
+    decode_points,
+    encode_points,
+)
+
+
+def test_encode_decode_roundtrip_is_exact_to_stored_precision():
+    # 保存桁数で丸めた値がそのまま復元されることを検証する
+    rng = np.random.default_rng(0)
+    points = np.cumsum(rng.normal(0, 1e-4, (500, 2)), axis=0) + [35.0, 139.0]
+    decoded = decode_points(encode_points(points, LATLNG_DECIMALS))
+    np.testing.assert_array_equal(decoded, np.round(points, LATLNG_DECIMALS))
+
+    display = [[12.3456, 78.9], [13.0, 80.5]]
+    assert decode_points(encode_points(display, DISPLAY_DECIMALS)).tolist() == [[12.346, 78.9], [13.0, 80.5]]
+    assert decode_points(encode_points([], LATLNG_DECIMALS)).shape == (0, 2)
+
+
+def test_large_deltas_are_stored_as_int64():
+    # 経度180度線をまたぐ経路など、差分が int32 に収まらない座標列も保存・復元できることを検証する
+    route = [{"lat": 51.0, "lng": 179.9}, {"lat": 51.0, "lng": -179.9}, {"lat": 51.0, "lng": 179.95}]
+    column_type = models.Course.__table__.c.route_points.type
+    packed = column_type.process_bind_param(route, None)
+    assert column_type.process_result_value(packed, None) == route
+
+    display = [[0.0, 0.0], [5_000_000.0, -5_000_000.0]]
+    assert decode_points(encode_points(display, DISPLAY_DECIMALS)).tolist() == display
+    # int32 に収まる座標列は int32 のまま
+    assert len(encode_points([[35.0, 139.0]], LATLNG_DECIMALS, compress=False)) == 9 + 8
+
+    for invalid in ([[float("nan"), 0.0]], [[0.0, float("inf")]], [[1e300, 0.0]]):
+        with pytest.raises(ValueError):
+            encode_points(invalid, LATLNG_DECIMALS)
+
+
+def test_packed_route_is_much_smaller_than_json():
+    # 連続した経路のバイナリ表現がJSONより十分小さいことを検証する
+    rng = np.random.default_rng(1)
+    points = np.cumsum(rng.normal(0, 5e-5, (1000, 2)), axis=0) + [35.0, 139.0]
+    as_json = json.dumps([{"lat": lat, "lng": lng} for lat, lng in points.tolist()])
+    assert len(encode_points(points, LATLNG_DECIMALS)) < len(as_json) / 4
+
+
+def test_point_array_behaves_like_list_of_dicts():
+    points = PointArray.from_points([{"lat": 35.1, "lng": 139.1}, {"lat": 35.2, "lng": 139.2}])
+    assert len(points) == 2
+    assert points[0] == {"lat": 35.1, "lng": 139.1}
+    assert points == [{"lat": 35.1, "lng": 139.1}, {"lat": 35.2, "lng": 139.2}]
+    assert points.array.shape == (2, 2)
+    assert not PointArray.from_points([])
+
+
+def test_migrate_json_geometry_converts_legacy_tables(tmp_path):
+    # JSON列を持つ旧スキーマのDBがバイナリ列に移行されることを検証する
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    user_id, course_id, handwriting_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    route = [{"lat": 35.0 + i * 1e-4, "lng": 139.0} for i in range(50)]
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id CHAR(32) PRIMARY KEY, created_at DATETIME)"))
+        conn.execute(text(
+            "CREATE TABLE courses (id CHAR(32) PRIMARY KEY, user_id CHAR(32) NOT NULL, "
+            "total_distance_km FLOAT NOT NULL, is_favorite BOOLEAN NOT NULL, created_at DATETIME, "
+            "route_points JSON NOT NULL, drawing_points JSON NOT NULL)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE handwritings (id CHAR(32) PRIMARY KEY, drawing_points JSON NOT NULL, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO users (id) VALUES (:id)"), {"id": user_id.hex})
+        conn.execute(
+            text("INSERT INTO courses VALUES (:id, :user_id, 5.0, 0, '2024-01-01 00:00:00', :route, '[]')"),
+            {"id": course_id.hex, "user_id": user_id.hex, "route": json.dumps(route)},
+        )
+        conn.execute(
+            text("INSERT INTO handwritings VALUES (:id, :points, '2024-01-01 00:00:00')"),
+            {"id": handwriting_id.hex, "points": json.dumps([{"x": 1.5, "y": 2.25}])},
+        )
+
+    migrations.upgrade(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("courses")}
+    assert "route_points" not in columns and "route_geom" in columns
+    with engine.connect() as conn:
+        course = conn.execute(models.Course.__table__.select()).one()
+        handwriting = conn.execute(models.Handwriting.__table__.select()).one()
+    assert course.route_points == route
+    assert course.drawing_points == []
+    assert course.start_cell is not None
+    assert handwriting.drawing_points == [{"x": 1.5, "y": 2.25}]
+
+    # 2回目の実行では何も変更しない
+    assert migrations.migrate_json_geometry(engine) == {}
+    engine.dispose()
+
+
+def test_upgrade_fails_when_geometry_column_has_nulls(tmp_path):
+    # 移行後の座標列に NULL が残っている場合は、マイグレーションを失敗させることを検証する
+    # （ALTER TABLE で追加した列は NULL を許すため、モデルの nullable=False を移行時に確認する）
+    engine = create_engine(f"sqlite:///{tmp_path / 'partial.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE handwritings (id CHAR(32) PRIMARY KEY, drawing_geom BLOB, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO handwritings (id) VALUES (:id)"), {"id": uuid.uuid4().hex})
+
+    with pytest.raises(RuntimeError, match="handwritings.drawing_geom"):
+        migrations.upgrade(engine)
+    engine.dispose()
+
+
+def test_backfill_course_start_points_in_batches(tmp_path, monkeypatch):
+    # 始点の列を GEOMETRY_BATCH_SIZE 件ずつ設定し、経路が空のコースがあっても終了することを検証する
+    monkeypatch.setattr(migrations, "GEOMETRY_BATCH_SIZE", 2)
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    courses = models.Course.__table__
+    user_id = uuid.uuid4()
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert().values(id=user_id))
+        conn.execute(courses.insert(), [
+            {"id": uuid.uuid4(), "user_id": user_id, "total_distance_km": 1.0, "is_favorite": False,
+             "route_points": [{"lat": 35.0 + i * 0.01, "lng": 139.0}] if i != 2 else [], "drawing_points": []}
+            for i in range(5)
+        ])
+
+    assert migrations.backfill_course_start_points(engine) == 4
+    with engine.connect() as conn:
+        rows = conn.execute(courses.select().where(courses.c.start_cell.is_(None))).fetchall()
+    assert [row.route_points for row in rows] == [[]]
+    engine.dispose()
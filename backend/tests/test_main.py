@@ -1,10 +1,14 @@
+from datetime import datetime, timezone
+import json
+from xml.etree import ElementTree
+
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 import pytest
 import uuid
 
-from backend import models
-from backend import schemas
+from backend import main, models
+from backend import schemas, serialization
 
 
 def test_create_user(client: TestClient):
@@ -52,6 +56,24 @@ def test_create_course_for_user(client: TestClient, db_session: Session):
     assert len(db_course.route_points) == 2
     assert db_course.route_points[0]['lat'] == 35.1
 
+def test_create_course_rejects_invalid_coordinates(client: TestClient, db_session: Session):
+    # 範囲外の緯度経度は422を返し、経度180度線をまたぐ経路は保存できることを検証する
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+
+    course_data = {
+        "total_distance_km": 5.0,
+        "route_points": [{"lat": 91.0, "lng": 139.1}],
+        "drawing_points": [],
+    }
+    assert client.post(f"/users/{user.id}/courses", json=course_data).status_code == 422
+
+    course_data["route_points"] = [{"lat": 51.0, "lng": 179.9}, {"lat": 51.0, "lng": -179.9}]
+    response = client.post(f"/users/{user.id}/courses", json=course_data)
+    assert response.status_code == 201
+    assert client.get(response.headers["location"]).json()["route_points"] == course_data["route_points"]
+
 def test_create_course_user_not_found(client: TestClient):
     # 存在しないユーザーIDでコース作成を試みると404が返ることを検証する
     non_existent_user_id = str(uuid.uuid4())
@@ -295,3 +317,338 @@ def test_list_user_courses_favorites_only_default(client: TestClient, setup_user
     assert response.status_code == 200
     data = response.json()
     assert len(data) == 2  # デフォルトでは全てのコースが返る
+
+@pytest.fixture
+def setup_user_with_many_courses(db_session: Session):
+    """始点と距離が異なる5件のコースを持つユーザーを作成"""
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+
+    courses = []
+    for i in range(5):
+        course = models.Course(
+            user_id=user.id,
+            total_distance_km=float(10 - i),
+            is_favorite=False,
+            # i が大きいほど (35.0, 139.0) から遠い
+            route_points=[{"lat": 35.0 + 0.01 * i, "lng": 139.0}],
+            drawing_points=[],
+        )
+        db_session.add(course)
+        courses.append(course)
+    db_session.commit()
+    for course in courses:
+        db_session.refresh(course)
+    return user, courses
+
+def test_list_user_courses_sort_by_distance(client: TestClient, setup_user_with_many_courses):
+    # distance_asc / distance_desc で現在地から始点までの距離順に並び、距離が返ることを検証する
+    user, courses = setup_user_with_many_courses
+    expected_ids = [str(course.id) for course in courses]
+
+    response = client.get(f"/users/{user.id}/courses?current_lat=35.0&current_lng=139.0&sort_by=distance_asc")
+    assert response.status_code == 200
+    data = response.json()
+    assert [c["id"] for c in data] == expected_ids
+    assert data[0]["distance_to_start_km"] == pytest.approx(0.0)
+    assert data[1]["distance_to_start_km"] == pytest.approx(1.11, abs=0.01)
+
+    response = client.get(f"/users/{user.id}/courses?current_lat=35.0&current_lng=139.0&sort_by=distance_desc")
+    assert [c["id"] for c in response.json()] == expected_ids[::-1]
+
+def test_list_user_courses_sort_by_total_distance(client: TestClient, setup_user_with_many_courses):
+    # total_distance_asc でコースの総距離が短い順に並ぶことを検証する
+    user, courses = setup_user_with_many_courses
+
+    response = client.get(f"/users/{user.id}/courses?sort_by=total_distance_asc")
+    assert response.status_code == 200
+    assert [c["total_distance_km"] for c in response.json()] == [6.0, 7.0, 8.0, 9.0, 10.0]
+
+def test_list_user_courses_invalid_sort(client: TestClient, setup_user_with_many_courses):
+    # 不正な sort_by を指定すると400が返ることを検証する
+    user, _ = setup_user_with_many_courses
+    response = client.get(f"/users/{user.id}/courses?sort_by=unknown")
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("sort_by", ["distance_asc", "total_distance_desc", "created_at_desc"])
+def test_list_user_courses_pagination(client: TestClient, setup_user_with_many_courses, sort_by):
+    # limit と X-Next-Cursor で全件を重複・欠落なく、一括取得時と同じ順序で取得できることを検証する
+    user, _ = setup_user_with_many_courses
+    base_url = f"/users/{user.id}/courses?current_lat=35.0&current_lng=139.0&sort_by={sort_by}"
+    all_ids = [c["id"] for c in client.get(base_url).json()]
+
+    paged_ids = []
+    cursor = None
+    for _ in range(5):
+        url = f"{base_url}&limit=2" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        paged_ids.extend(c["id"] for c in page)
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+
+    assert paged_ids == all_ids
+    assert len(paged_ids) == 5
+
+def test_list_user_courses_rejects_missing_cursor(client: TestClient, setup_user_with_many_courses):
+    # cursor のコースが削除された場合は、空のページではなく400を返すことを検証する
+    user, _ = setup_user_with_many_courses
+    base_url = f"/users/{user.id}/courses?current_lat=35.0&current_lng=139.0&limit=2"
+    cursor = client.get(base_url).headers["x-next-cursor"]
+    assert client.delete(f"/users/{user.id}/courses/{cursor}").status_code == 204
+
+    response = client.get(f"{base_url}&cursor={cursor}")
+    assert response.status_code == 400
+
+def test_list_user_courses_without_location_keeps_creation_order(client: TestClient, db_session: Session):
+    # 現在地を指定しない距離順では作成順に並び、ページングしても同じ順序になることを検証する
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    created = [datetime(2025, 1, 1, 0, 0, i // 2, tzinfo=timezone.utc) for i in range(5)]
+    courses = [
+        models.Course(user_id=user.id, total_distance_km=1.0, is_favorite=False,
+                      route_points=[{"lat": 35.0, "lng": 139.0}], drawing_points=[], created_at=created_at)
+        for created_at in created
+    ]
+    db_session.add_all(courses)
+    db_session.commit()
+    # 同じ作成日時のコースは ID の順
+    expected_ids = [str(c.id) for c in sorted(courses, key=lambda c: (c.created_at, c.id))]
+
+    for sort_by in ("distance_asc", "distance_desc"):
+        base_url = f"/users/{user.id}/courses?sort_by={sort_by}"
+        assert [c["id"] for c in client.get(base_url).json()] == expected_ids
+
+        paged_ids, cursor = [], None
+        for _ in range(5):
+            response = client.get(f"{base_url}&limit=2" + (f"&cursor={cursor}" if cursor else ""))
+            paged_ids.extend(c["id"] for c in response.json())
+            cursor = response.headers.get("x-next-cursor")
+            if cursor is None:
+                break
+        assert paged_ids == expected_ids
+
+def test_list_nearby_courses(client: TestClient, setup_user_with_many_courses):
+    # 半径内のコースだけが近い順に返り、k 件で打ち切られることを検証する
+    user, courses = setup_user_with_many_courses
+
+    # 始点は (35.0 + 0.01 * i, 139.0)。半径 2.5km 以内は i = 0, 1, 2 の3件
+    response = client.get(f"/users/{user.id}/courses/nearby?lat=35.0&lng=139.0&radius_km=2.5")
+    assert response.status_code == 200
+    data = response.json()
+    assert [c["id"] for c in data] == [str(c.id) for c in courses[:3]]
+    assert data[2]["distance_to_start_km"] == pytest.approx(2.22, abs=0.01)
+    assert data[0]["drawing_points"] is None
+
+    # 最も近い2件（検索半径を広げて探す）
+    response = client.get(f"/users/{user.id}/courses/nearby?lat=35.045&lng=139.0&k=2")
+    assert [c["id"] for c in response.json()] == [str(courses[4].id), str(courses[3].id)]
+
+def test_list_nearby_courses_user_not_found(client: TestClient):
+    # 存在しないユーザーでは404が返ることを検証する
+    response = client.get(f"/users/{uuid.uuid4()}/courses/nearby?lat=35.0&lng=139.0")
+    assert response.status_code == 404
+
+
+def test_list_user_courses_returns_preview_geometry(client: TestClient, db_session: Session):
+    # 一覧では簡略化した経路を返し、詳細では全体の経路を返すことを検証する
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    route = [{"lat": 35.0 + 0.001 * (i % 2), "lng": 139.0 + 0.0001 * i} for i in range(500)]
+    course = models.Course(user_id=user.id, total_distance_km=5.0, route_points=route, drawing_points=[])
+    db_session.add(course)
+    db_session.commit()
+
+    response = client.get(f"/users/{user.id}/courses")
+    assert response.status_code == 200
+    preview = response.json()[0]["route_points"]
+    assert 2 <= len(preview) <= models.PREVIEW_MAX_POINTS
+    assert preview[0] == route[0] and preview[-1] == route[-1]
+
+    response = client.get(f"/users/{user.id}/courses/{course.id}")
+    assert response.json()["route_points"] == route
+
+
+def test_list_courses_without_stored_preview(client: TestClient, db_session: Session):
+    # preview_points が未設定（マイグレーション前）のコースも、一覧・近くのコースで簡略化した経路を返すことを検証する
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    route = [{"lat": 35.0 + 0.001 * (i % 2), "lng": 139.0 + 0.0001 * i} for i in range(500)]
+    course = models.Course(user_id=user.id, total_distance_km=5.0, route_points=route, drawing_points=[])
+    db_session.add(course)
+    db_session.commit()
+    db_session.execute(models.Course.__table__.update().values(preview_points=None))
+    db_session.commit()
+
+    for path in (f"/users/{user.id}/courses", f"/users/{user.id}/courses/nearby?lat=35.0&lng=139.0"):
+        response = client.get(path)
+        assert response.status_code == 200
+        preview = response.json()[0]["route_points"]
+        assert 2 <= len(preview) <= models.PREVIEW_MAX_POINTS
+        assert preview[0] == route[0]
+
+
+# --- Course Bulk Import / Export Tests ---
+
+def make_import_courses(count: int) -> list:
+    return [
+        {
+            "total_distance_km": 1.0 + i,
+            "route_points": [
+                {"lat": round(35.0 + 0.001 * i, 6), "lng": 139.0},
+                {"lat": 35.1, "lng": round(139.1 + 0.001 * i, 6)},
+            ],
+            "drawing_points": [{"lat": 35.05, "lng": 139.05}],
+            "is_favorite": i % 2 == 0,
+            "created_at": f"2025-01-01T00:00:{i % 60:02d}+00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def test_bulk_create_courses_in_batches(client: TestClient, db_session: Session, monkeypatch):
+    # 複数のバッチに分けて全件が保存され、始点・preview_points も設定されることを検証する
+    monkeypatch.setattr(main, "COURSE_IMPORT_BATCH_SIZE", 4)
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+
+    courses = make_import_courses(10)
+    response = client.post(f"/users/{user.id}/courses/bulk", json={"courses": courses})
+    assert response.status_code == 201
+    data = response.json()
+    assert data["created"] == 10 and len(data["course_ids"]) == 10
+
+    saved = db_session.get(models.Course, uuid.UUID(data["course_ids"][3]))
+    assert saved.total_distance_km == 4.0 and saved.is_favorite is False
+    assert saved.route_points == courses[3]["route_points"]
+    assert saved.start_lat == courses[3]["route_points"][0]["lat"]
+    assert saved.start_cell is not None and saved.preview_points is not None
+
+
+def test_bulk_create_courses_errors(client: TestClient, db_session: Session, monkeypatch):
+    # ユーザーが存在しない場合は404、件数が上限を超える場合は413を返すことを検証する
+    response = client.post(f"/users/{uuid.uuid4()}/courses/bulk", json={"courses": make_import_courses(1)})
+    assert response.status_code == 404
+
+    monkeypatch.setattr(main, "COURSE_IMPORT_MAX_COURSES", 2)
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    response = client.post(f"/users/{user.id}/courses/bulk", json={"courses": make_import_courses(3)})
+    assert response.status_code == 413
+    assert db_session.query(models.Course).count() == 0
+
+    # ボディのサイズが上限を超える場合は、コースを検証する前に413を返す（不正な項目があっても422にならない）
+    monkeypatch.setattr(main, "COURSE_IMPORT_MAX_BYTES", 100)
+    response = client.post(f"/users/{user.id}/courses/bulk", json={"courses": [{"total_distance_km": "x" * 100}]})
+    assert response.status_code == 413
+    assert client.post(f"/users/{user.id}/courses/bulk", json={"courses": []}).status_code == 201
+
+
+def test_export_courses_roundtrip(client: TestClient, db_session: Session, monkeypatch):
+    # NDJSON でエクスポートしたコースを別のユーザーにそのままインポートできることを検証する
+    monkeypatch.setattr(main, "COURSE_EXPORT_CHUNK_SIZE", 3)
+    source, target = models.User(), models.User()
+    db_session.add_all([source, target])
+    db_session.commit()
+    courses = make_import_courses(7)
+    client.post(f"/users/{source.id}/courses/bulk", json={"courses": courses})
+
+    response = client.get(f"/users/{source.id}/courses/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(serialization.NDJSON_MEDIA_TYPE)
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [course["total_distance_km"] for course in exported] == [course["total_distance_km"] for course in courses]
+    assert exported[0]["route_points"] == courses[0]["route_points"]
+
+    response = client.post(f"/users/{target.id}/courses/bulk", json={"courses": exported})
+    assert response.status_code == 201
+    response = client.get(f"/users/{target.id}/courses/export")
+    reimported = [json.loads(line) for line in response.text.splitlines()]
+    strip_id = lambda course: {key: value for key, value in course.items() if key != "id"}
+    assert [strip_id(course) for course in reimported] == [strip_id(course) for course in exported]
+
+
+def test_export_courses_geojson_and_gpx(client: TestClient, db_session: Session):
+    # GeoJSON と GPX の形式でエクスポートできることを検証する
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    courses = make_import_courses(2)
+    client.post(f"/users/{user.id}/courses/bulk", json={"courses": courses})
+
+    response = client.get(f"/users/{user.id}/courses/export", params={"format": "geojson"})
+    assert response.status_code == 200
+    collection = response.json()
+    assert collection["type"] == "FeatureCollection" and len(collection["features"]) == 2
+    first_point = courses[0]["route_points"][0]
+    assert collection["features"][0]["geometry"]["coordinates"][0] == [first_point["lng"], first_point["lat"]]
+
+    response = client.get(f"/users/{user.id}/courses/export", params={"format": "gpx"})
+    assert response.status_code == 200
+    namespace = {"gpx": "http://www.topografix.com/GPX/1/1"}
+    tracks = ElementTree.fromstring(response.content).findall("gpx:trk", namespace)
+    assert len(tracks) == 2
+    trkpt = tracks[0].find("gpx:trkseg/gpx:trkpt", namespace)
+    assert float(trkpt.get("lat")) == first_point["lat"] and float(trkpt.get("lon")) == first_point["lng"]
+
+    response = client.get(f"/users/{user.id}/courses/export", params={"format": "kml"})
+    assert response.status_code == 400
+
+
+# --- Handwriting API Tests ---
+
+@pytest.fixture
+def setup_handwritings(db_session: Session):
+    # 同じ created_at の手書きデータを含む5件を作成する
+    handwritings = [
+        models.Handwriting(
+            drawing_points=[{"x": float(i), "y": 0.0}],
+            created_at=datetime(2025, 1, 1, 0, 0, i // 2),
+        )
+        for i in range(5)
+    ]
+    db_session.add_all(handwritings)
+    db_session.commit()
+    return handwritings
+
+
+def test_get_handwritings_keyset_pagination(client: TestClient, setup_handwritings):
+    # limit と cursor で新しい順に重複・欠落なく全件を取得できることを検証する
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        response = client.get("/handwritings", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        seen.extend(page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert len({hw["id"] for hw in seen}) == 5
+    created_at = [hw["created_at"] for hw in seen]
+    assert created_at == sorted(created_at, reverse=True)
+    assert created_at[0].endswith("Z") or created_at[0].endswith("+00:00")
+    assert seen == client.get("/handwritings").json()
+
+
+def test_export_handwritings_streams_ndjson(client: TestClient, setup_handwritings):
+    # エクスポートが古い順の NDJSON を返すことを検証する
+    response = client.get("/handwritings/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(row["drawing_points"][0]["x"] for row in rows) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert [row["created_at"] for row in rows] == sorted(row["created_at"] for row in rows)
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from backend import metrics, routing
+
+
+def test_format_server_timing_aggregates_repeated_stages():
+    # 同じ段階が複数回記録された場合は合計され、回数が desc に入ることを検証する
+    timings = [("cache_lookup", 0.002), ("segment_routing", 0.1), ("segment_routing", 0.2)]
+    header = metrics.format_server_timing(timings)
+    assert header == 'cache_lookup;dur=2.0, segment_routing;dur=300.0;desc="2 calls"'
+
+
+def test_histogram_renders_prometheus_buckets():
+    # ヒストグラムが累積バケット・合計・件数を Prometheus 形式で出力することを検証する
+    registry = metrics.MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "test", labelnames=("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+
+    text = registry.render()
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1.0' in text
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2.0' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 2.0' in text
+    assert 'test_seconds_count{stage="a"} 2.0' in text
+
+
+def test_calculate_route_returns_server_timing(client: TestClient, monkeypatch):
+    # コース計算のレスポンスに各段階の Server-Timing が付与され、/metrics に集計されることを検証する
+    def fake_calculate_route(drawing_display_points, start_location, target_distance_km):
+        with metrics.timed_stage("rotation_search"):
+            pass
+        return {
+            "total_distance_km": 1.0,
+            "route_points": [{"lat": 35.0, "lng": 139.0}],
+            "drawing_points": [{"lat": 35.0, "lng": 139.0}],
+        }
+
+    monkeypatch.setattr(routing, "get_generator", lambda: SimpleNamespace(calculate_route=fake_calculate_route))
+    before = metrics.stage_duration_seconds.count(stage="rotation_search")
+
+    response = client.post("/routes/calculate", json={
+        "drawing_display_points": [{"x": 0, "y": 0}, {"x": 1, "y": 1}],
+        "start_location": {"lat": 35.0, "lng": 139.0},
+        "target_distance_km": 1.0,
+    })
+    assert response.status_code == 200
+    assert response.json()["route_points"] == [{"lat": 35.0, "lng": 139.0}]
+
+    stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert stages == ["rotation_search", "serialization"]
+    assert metrics.stage_duration_seconds.count(stage="rotation_search") == before + 1
+
+    metrics_response = client.get("/metrics")
+    assert metrics_response.status_code == 200
+    assert 'gps_art_stage_duration_seconds_count{stage="rotation_search"}' in metrics_response.text
+    assert "gps_art_http_requests_in_flight" in metrics_response.text
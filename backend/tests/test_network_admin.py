@@ -0,0 +1,152 @@
+import networkx as nx
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import routing
+from backend.calculator import network_cache
+from backend.calculator.gps_art_generator import GPSArtGenerator
+from backend.calculator.network_cache import LoadedNetwork, NetworkDiskCache
+
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+
+def small_network(nodes: int = 3) -> nx.MultiDiGraph:
+    graph = nx.MultiDiGraph(crs="EPSG:32654")
+    for node in range(nodes):
+        graph.add_node(node, x=node * 100.0, y=0.0, coords=np.array([node * 100.0, 0.0]))
+        if node > 0:
+            graph.add_edge(node - 1, node, length=100.0)
+    return graph
+
+
+def loaded_network(lat: float, lon: float, distance_m: int, nodes: int = 3) -> LoadedNetwork:
+    graph = small_network(nodes)
+    return LoadedNetwork((lat, lon), distance_m, graph, graph, build_seconds=1.5)
+
+
+@pytest.fixture
+def admin_token(monkeypatch, tmp_path):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(network_cache, "NETWORK_CACHE_DIR", str(tmp_path))
+
+
+@pytest.fixture
+def admin_generator(monkeypatch, admin_token, empty_generator):
+    """経路計算の初期化が済んだ状態（routing.get_generator() が返す GPSArtGenerator）"""
+    monkeypatch.setattr(routing, "_generator", empty_generator)
+    return empty_generator
+
+
+def add_network(generator: GPSArtGenerator, network: LoadedNetwork, store: bool = False):
+    with generator._network_lock:
+        generator.memory_networks.add(network)
+        generator._activate_network(network)
+        if store:
+            generator._store_network(network)
+
+
+def test_admin_endpoints_require_token(client: TestClient, admin_token):
+    # 管理者トークンがない場合は403を返すことを検証する
+    assert client.get("/admin/networks").status_code == 403
+    assert client.post("/admin/warmup", json={}).status_code == 403
+    assert client.delete("/admin/networks/network_35.0000_139.0000_1000m").status_code == 403
+
+
+def test_lists_disk_cache_without_initializing_routing(client: TestClient, admin_token, tmp_path, monkeypatch):
+    # 経路計算を初期化していなくても、ディスクキャッシュの一覧とメタデータを返すことを検証する
+    monkeypatch.setattr(routing, "_generator", None)
+    NetworkDiskCache(str(tmp_path)).store(
+        35.0, 139.0, 1000, {"anchor_point": (35.0, 139.0)}, metadata={"node_count": 10, "edge_count": 20, "build_seconds": 2.5}
+    )
+
+    response = client.get("/admin/networks", headers=ADMIN_HEADERS)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["routing_ready"] is False
+    assert body["disk"]["entries"] == 1
+    [network] = body["networks"]
+    assert network["id"] == "network_35.0000_139.0000_1000m"
+    assert (network["on_disk"], network["in_memory"]) == (True, False)
+    assert (network["node_count"], network["edge_count"], network["build_seconds"]) == (10, 20, 2.5)
+    assert network["size_bytes"] > 0 and network["last_access"] is not None
+
+
+def test_lists_memory_and_disk_networks(client: TestClient, admin_generator):
+    # メモリとディスクのネットワークを識別子ごとにまとめ、ヒット回数や固定の有無を返すことを検証する
+    admin_generator.memory_networks.max_entries = 2
+    add_network(admin_generator, loaded_network(35.0, 139.0, 1000, nodes=4), store=True)
+    add_network(admin_generator, loaded_network(36.0, 140.0, 2000))
+    admin_generator._load_road_network(35.0, 139.0, distance_m=500)
+
+    networks = {network["id"]: network for network in client.get("/admin/networks", headers=ADMIN_HEADERS).json()["networks"]}
+    stored = networks["network_35.0000_139.0000_1000m"]
+    assert (stored["in_memory"], stored["on_disk"], stored["active"]) == (True, True, True)
+    assert (stored["node_count"], stored["edge_count"], stored["memory_hits"]) == (4, 3, 1)
+    assert stored["build_seconds"] == 1.5
+    memory_only = networks["network_36.0000_140.0000_2000m"]
+    assert (memory_only["in_memory"], memory_only["on_disk"], memory_only["active"]) == (True, False, False)
+    assert memory_only["size_bytes"] is None
+
+
+def test_pinned_networks_survive_memory_limit(client: TestClient, admin_generator):
+    # 固定したネットワークはメモリの上限を超えても破棄せず、固定を外すと破棄されることを検証する
+    add_network(admin_generator, loaded_network(35.0, 139.0, 1000))
+    response = client.post("/admin/networks/pin", json={"lat": 35.0, "lng": 139.0, "distance_m": 800}, headers=ADMIN_HEADERS)
+    assert response.status_code == 200
+    assert response.json()["id"] == "network_35.0000_139.0000_1000m" and response.json()["pinned"] is True
+
+    add_network(admin_generator, loaded_network(36.0, 140.0, 1000))
+    add_network(admin_generator, loaded_network(37.0, 141.0, 1000))
+    assert [network.id for network in admin_generator.memory_networks.networks()] == [
+        "network_35.0000_139.0000_1000m", "network_37.0000_141.0000_1000m",
+    ]
+
+    assert client.delete("/admin/networks/network_35.0000_139.0000_1000m/pin", headers=ADMIN_HEADERS).status_code == 204
+    assert [network.id for network in admin_generator.memory_networks.networks()] == ["network_37.0000_141.0000_1000m"]
+    assert client.delete("/admin/networks/network_35.0000_139.0000_1000m/pin", headers=ADMIN_HEADERS).status_code == 404
+
+
+def test_evict_network_from_memory_and_disk(client: TestClient, admin_generator, tmp_path):
+    # メモリから破棄し、from_disk=true の場合はキャッシュファイルとメタデータも削除することを検証する
+    add_network(admin_generator, loaded_network(35.0, 139.0, 1000), store=True)
+    network_id = "network_35.0000_139.0000_1000m"
+
+    response = client.delete(f"/admin/networks/{network_id}", headers=ADMIN_HEADERS)
+    assert response.json() == {"memory": True, "disk": False}
+    assert (tmp_path / f"{network_id}.pkl").exists()
+
+    response = client.delete(f"/admin/networks/{network_id}?from_disk=true", headers=ADMIN_HEADERS)
+    assert response.json() == {"memory": False, "disk": True}
+    assert not list(tmp_path.glob("network_*"))
+
+    assert client.delete(f"/admin/networks/{network_id}?from_disk=true", headers=ADMIN_HEADERS).status_code == 404
+    assert client.delete("/admin/networks/..%2F..%2Fsecret?from_disk=true", headers=ADMIN_HEADERS).status_code == 404
+
+
+def test_warmup_and_rebuild_run_in_background(client: TestClient, admin_generator, monkeypatch):
+    # ウォームアップと再取得はバックグラウンドで実行し、すぐに202を返すことを検証する
+    calls = []
+
+    def fake_fetch(lat, lon, distance_m):
+        # _load_road_network が _network_lock を保持した状態で呼ばれる
+        calls.append((lat, lon, distance_m))
+        network = loaded_network(lat, lon, distance_m)
+        admin_generator.memory_networks.add(network)
+        admin_generator._activate_network(network)
+        return network
+
+    monkeypatch.setattr(admin_generator, "_fetch_road_network", fake_fetch)
+
+    response = client.post(
+        "/admin/warmup", json={"regions": [{"lat": 35.0, "lng": 139.0, "distance_m": 1000}], "pin": True}, headers=ADMIN_HEADERS
+    )
+    assert response.status_code == 202
+    assert calls == [(35.0, 139.0, 1000)]
+    assert admin_generator.memory_networks.get("network_35.0000_139.0000_1000m").pinned
+
+    response = client.post("/admin/networks/rebuild", json={"lat": 35.0, "lng": 139.0, "distance_m": 1000}, headers=ADMIN_HEADERS)
+    assert response.status_code == 202
+    assert calls == [(35.0, 139.0, 1000)] * 2
+    # 再取得しても固定の状態は引き継ぐ
+    assert admin_generator.memory_networks.get("network_35.0000_139.0000_1000m").pinned
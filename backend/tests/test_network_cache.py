@@ -0,0 +1,173 @@
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+
+from backend.calculator.network_cache import NetworkDiskCache, extent_covers
+
+
+def network_data(size: int = 0) -> dict:
+    return {"anchor_point": (0.0, 0.0), "road_network_latlon": "latlon", "road_network": "x" * size}
+
+
+def set_last_access(path: str, timestamp: float):
+    os.utime(path, (timestamp, timestamp))
+
+
+def test_find_returns_nearby_network_and_updates_access_time(tmp_path):
+    # 中心点に近いキャッシュを読み込み、最後に使われた日時を更新することを検証する
+    cache = NetworkDiskCache(str(tmp_path))
+    path = cache.store(35.0, 139.0, 1000, network_data())
+    set_last_access(path, 1_000_000)
+
+    assert cache.find(36.0, 139.0, 1000) is None
+    data = cache.find(35.001, 139.001, 500)
+    assert data["path"] == path and data["road_network_latlon"] == "latlon"
+    assert os.path.getmtime(path) > 1_000_000
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+
+def test_find_chooses_smallest_network_covering_requested_extent(tmp_path):
+    # 要求された範囲をすべて含むキャッシュのうち、取得範囲が最も小さいものを選ぶことを検証する
+    cache = NetworkDiskCache(str(tmp_path))
+    small = cache.store(35.0, 139.0, 1000, network_data())
+    large = cache.store(35.0, 139.0, 5000, network_data())
+    shifted = cache.store(35.02, 139.0, 3000, network_data())
+
+    assert cache.find(35.0, 139.0, 800)["path"] == small
+    assert cache.find(35.0, 139.0, 2000)["path"] == large
+    # 北に約1.1km ずれた中心点の 1500m の範囲は、北に約2.2km の 3000m のネットワークに含まれる
+    assert cache.find(35.01, 139.0, 1500)["path"] == shifted
+    assert cache.find(35.0, 139.0, 8000) is None
+    assert cache.find(35.0, 139.0, 800)["distance_m"] == 1000
+
+
+def test_extent_covers_and_legacy_filenames(tmp_path):
+    # 範囲の包含判定と、取得範囲を含まない以前のファイル名を 4000m として扱うことを検証する
+    assert extent_covers(35.0, 139.0, 2000, 35.0, 139.0, 2000)
+    assert extent_covers(35.0, 139.0, 2000, 35.005, 139.0, 1000)
+    assert not extent_covers(35.0, 139.0, 2000, 35.0, 139.02, 1000)
+    assert not extent_covers(35.0, 139.0, 1000, 35.0, 139.0, 2000)
+
+    with open(tmp_path / "network_35.0000_139.0000.pkl", "wb") as f:
+        pickle.dump(network_data(), f)
+    cache = NetworkDiskCache(str(tmp_path))
+    assert [entry.distance_m for entry in cache.entries()] == [4000]
+    assert cache.find(35.0, 139.0, 3000) is not None
+
+def test_store_evicts_least_recently_used_entries(tmp_path):
+    # 件数の上限を超えると、最後に使われた日時が古いものから削除することを検証する
+    cache = NetworkDiskCache(str(tmp_path), max_bytes=0, max_entries=2)
+    first = cache.store(35.0, 139.0, 1000, network_data())
+    second = cache.store(35.1, 139.0, 1000, network_data())
+    set_last_access(first, 2_000_000)
+    set_last_access(second, 1_000_000)
+
+    third = cache.store(35.2, 139.0, 1000, network_data())
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in (first, third))
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evict_respects_byte_budget_and_protected_entries(tmp_path):
+    # 合計サイズの上限を超えた分を削除し、メモリに読み込まれているファイルは削除しないことを検証する
+    cache = NetworkDiskCache(str(tmp_path), max_bytes=0, max_entries=0)
+    paths = [cache.store(35.0 + i / 10, 139.0, 1000, network_data(10_000)) for i in range(4)]
+    for i, path in enumerate(paths):
+        set_last_access(path, 1_000_000 + i)
+
+    cache.max_bytes = os.path.getsize(paths[0]) * 2
+    removed = cache.evict(protected={paths[0]})
+    assert removed == paths[1:3]
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_find_removes_broken_files(tmp_path):
+    # 読み込めないキャッシュファイルは削除し、キャッシュミスとして扱うことを検証する
+    cache = NetworkDiskCache(str(tmp_path))
+    broken = tmp_path / NetworkDiskCache.filename(35.0, 139.0, 1000)
+    broken.write_bytes(pickle.dumps({"anchor_point": (35.0, 139.0)}))
+
+    assert cache.find(35.0, 139.0, 1000) is None
+    assert not broken.exists()
+
+
+def test_store_publishes_atomically(tmp_path, monkeypatch):
+    # 保存は一時ファイルからのリネームで行い、書き込みに失敗しても書きかけのファイルを残さないことを検証する
+    cache = NetworkDiskCache(str(tmp_path))
+    path = cache.store(35.0, 139.0, 1000, network_data())
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(path)]
+
+    def broken_dump(data, f):
+        f.write(b"half-written")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pickle, "dump", broken_dump)
+    try:
+        cache.store(35.1, 139.0, 1000, network_data())
+    except OSError:
+        pass
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(path)]
+    assert cache.find(35.0, 139.0, 1000)["path"] == path
+
+
+def test_build_lock_makes_waiters_read_published_network(tmp_path):
+    # 同じ領域の取得は1つに限られ、待っていた側は保存されたキャッシュを読み込むことを検証する
+    cache = NetworkDiskCache(str(tmp_path))
+    builds = []
+
+    def load(center_lat):
+        with cache.build_lock(center_lat, 139.0, threshold=0.01):
+            if cache.find(center_lat, 139.0, 500) is not None:
+                return
+            builds.append(center_lat)
+            time.sleep(0.2)
+            cache.store(center_lat, 139.0, 1000, network_data())
+
+    threads = [threading.Thread(target=load, args=(35.001 + i * 0.001,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(builds) == 1
+
+
+def test_build_lock_is_shared_across_processes(tmp_path):
+    # 他のプロセスがロックを持っている間は待ち、タイムアウトした場合はロックせずに進むことを検証する
+    script = (
+        "import sys, time; from backend.calculator.network_cache import NetworkDiskCache, extent_covers; "
+        f"cache = NetworkDiskCache({str(tmp_path)!r}); "
+        "lock = cache.build_lock(35.0, 139.0, 0.01); lock.__enter__(); "
+        "print('locked', flush=True); time.sleep(1.0)"
+    )
+    holder = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        cache = NetworkDiskCache(str(tmp_path), lock_timeout=0.2)
+        with cache.build_lock(35.002, 139.002, threshold=0.01) as acquired:
+            assert acquired is False
+        cache.lock_timeout = 10
+        with cache.build_lock(35.002, 139.002, threshold=0.01) as acquired:
+            assert acquired is True
+    finally:
+        holder.wait(10)
+
+
+def test_find_skips_files_removed_by_another_process(tmp_path, monkeypatch):
+    # 一覧を取得した後に他のプロセスがファイルを削除した場合は、次の候補を読み込むことを検証する
+    cache = NetworkDiskCache(str(tmp_path))
+    small = cache.store(35.0, 139.0, 1000, network_data())
+    large = cache.store(35.0, 139.0, 5000, network_data())
+
+    entries = cache.entries
+    def entries_then_remove_small():
+        listed = entries()
+        os.remove(small)
+        return listed
+    monkeypatch.setattr(cache, "entries", entries_then_remove_small)
+
+    assert cache.find(35.0, 139.0, 800)["path"] == large
+    assert os.path.exists(large)
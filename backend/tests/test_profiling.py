@@ -0,0 +1,86 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import profiling, routing
+
+CALCULATE_PAYLOAD = {
+    "drawing_display_points": [{"x": 0, "y": 0}, {"x": 1, "y": 1}],
+    "start_location": {"lat": 35.0, "lng": 139.0},
+    "target_distance_km": 1.0,
+}
+
+
+def busy_route_search(n):
+    return sum(i * i for i in range(n))
+
+
+@pytest.fixture
+def fake_generator(monkeypatch):
+    def fake_calculate_route(drawing_display_points, start_location, target_distance_km):
+        busy_route_search(300000)
+        return {
+            "total_distance_km": 1.0,
+            "route_points": [{"lat": 35.0, "lng": 139.0}],
+            "drawing_points": [{"lat": 35.0, "lng": 139.0}],
+        }
+
+    monkeypatch.setattr(routing, "get_generator", lambda: SimpleNamespace(calculate_route=fake_calculate_route))
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+
+def test_profile_requires_admin_token(client: TestClient, fake_generator):
+    # 管理者トークンなしでプロファイルを要求すると403が返ることを検証する
+    response = client.post("/routes/calculate", json=CALCULATE_PAYLOAD, headers={"X-Profile": "sample"})
+    assert response.status_code == 403
+
+
+def test_profile_inline_returns_folded_stacks(client: TestClient, fake_generator):
+    # inline 指定時は collapsed stack 形式のプロファイルが返ることを検証する
+    response = client.post(
+        "/routes/calculate?profile=sample&profile_output=inline",
+        json=CALCULATE_PAYLOAD,
+        headers={"X-Admin-Token": "secret"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    lines = response.text.strip().splitlines()
+    assert lines
+    assert any("busy_route_search" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_profile_saved_to_profile_dir(client: TestClient, fake_generator, monkeypatch, tmp_path):
+    # 保存モードではコース計算結果が通常どおり返り、プロファイルがディレクトリに保存されることを検証する
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    response = client.post(
+        "/routes/calculate",
+        json=CALCULATE_PAYLOAD,
+        headers={"X-Admin-Token": "secret", "X-Profile": "cprofile"},
+    )
+    assert response.status_code == 200
+    assert response.json()["total_distance_km"] == 1.0
+    profile_path = response.headers["x-profile-path"]
+    assert os.path.dirname(profile_path) == str(tmp_path)
+    assert profile_path.endswith(".prof")
+    assert os.path.getsize(profile_path) > 0
+
+
+def test_concurrent_cprofile_returns_conflict(client: TestClient, fake_generator):
+    # cprofile モードのプロファイル中に別のリクエストが cprofile を要求すると409が返ることを検証する
+    with profiling.profile("cprofile"):
+        response = client.post(
+            "/routes/calculate?profile_output=inline",
+            json=CALCULATE_PAYLOAD,
+            headers={"X-Admin-Token": "secret", "X-Profile": "cprofile"},
+        )
+    assert response.status_code == 409
+
+    response = client.post(
+        "/routes/calculate?profile_output=inline",
+        json=CALCULATE_PAYLOAD,
+        headers={"X-Admin-Token": "secret", "X-Profile": "cprofile"},
+    )
+    assert response.status_code == 200
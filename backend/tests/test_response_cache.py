@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from backend import metrics, migrations, models, response_cache
+
+ROUTE = [{"lat": 35.0, "lng": 139.0}, {"lat": 35.01, "lng": 139.01}]
+COURSE = {"total_distance_km": 1.0, "route_points": ROUTE, "drawing_points": ROUTE}
+
+
+@pytest.fixture
+def user_id(client: TestClient, db_session: Session):
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    for _ in range(3):
+        client.post(f"/users/{user.id}/courses", json=COURSE)
+    # 最終更新と同じ秒のうちは Last-Modified を付けないため、最終更新を1分前にする
+    db_session.refresh(user)
+    user.courses_updated_at = user.courses_updated_at - timedelta(minutes=1)
+    db_session.commit()
+    return str(user.id)
+
+
+def test_list_returns_not_modified_until_courses_change(client: TestClient, user_id):
+    # コースが変わるまでは同じ ETag で 304 を返し、作成・お気に入り・削除のたびに ETag が変わることを検証する
+    path = f"/users/{user_id}/courses"
+    response = client.get(path)
+    etag = response.headers["etag"]
+    assert response.status_code == 200 and etag.startswith('W/"')
+    assert response.headers["cache-control"] == "private, no-cache"
+    assert "last-modified" in response.headers
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["etag"] == etag
+
+    course_id = client.get(path).json()[0]["id"]
+    mutations = [
+        lambda: client.post(path, json=COURSE),
+        lambda: client.post(f"{path}/{course_id}/toggle_favorite"),
+        lambda: client.delete(f"{path}/{course_id}"),
+    ]
+    for mutate in mutations:
+        assert mutate().status_code < 300
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        etag = response.headers["etag"]
+
+
+def test_etag_depends_on_query_and_format(client: TestClient, user_id):
+    # クエリや compact 形式が違えば別の ETag になることを検証する
+    path = f"/users/{user_id}/courses"
+    etags = {
+        client.get(path).headers["etag"],
+        client.get(path, params={"sort_by": "created_at_desc"}).headers["etag"],
+        client.get(path, headers={"Accept": "application/vnd.gpsart.compact+json"}).headers["etag"],
+    }
+    assert len(etags) == 3
+
+
+def test_cached_response_is_reused(client: TestClient, user_id):
+    # 同じ版数の2回目以降はキャッシュしたレスポンス（X-Next-Cursor を含む）を返すことを検証する
+    path = f"/users/{user_id}/courses?limit=2"
+    before = metrics.response_cache_requests_total.value(result="hit")
+    first = client.get(path)
+    second = client.get(path)
+    assert metrics.response_cache_requests_total.value(result="hit") == before + 1
+    assert second.content == first.content
+    assert second.headers["x-next-cursor"] == first.headers["x-next-cursor"]
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+def test_detail_if_modified_since(client: TestClient, user_id):
+    # If-Modified-Since が最終更新日時以降なら 304 を返すことを検証する
+    course_id = client.get(f"/users/{user_id}/courses").json()[0]["id"]
+    path = f"/users/{user_id}/courses/{course_id}"
+    last_modified = client.get(path).headers["last-modified"]
+    assert client.get(path, headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(path, headers={"If-Modified-Since": "Thu, 01 Jan 2015 00:00:00 GMT"}).status_code == 200
+
+
+def test_last_modified_waits_until_the_update_second_has_passed():
+    # 最終更新と同じ秒のうちは Last-Modified を付けず、If-Modified-Since だけでは 304 にならないことを検証する
+    updated_at = datetime(2025, 1, 1, 0, 0, 0, 300_000, tzinfo=timezone.utc)
+    user = SimpleNamespace(courses_updated_at=updated_at)
+    request = SimpleNamespace(headers={"if-modified-since": "Wed, 01 Jan 2025 00:00:00 GMT"})
+
+    same_second = response_cache.validator_headers(("key",), user, now=updated_at + timedelta(milliseconds=500))
+    assert "Last-Modified" not in same_second
+    assert not response_cache.is_not_modified(request, same_second)
+
+    later = response_cache.validator_headers(("key",), user, now=updated_at + timedelta(seconds=1))
+    assert later["Last-Modified"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert response_cache.is_not_modified(request, later)
+
+
+def test_response_cache_evicts_least_recently_used():
+    # 上限を超えると最も使われていないレスポンスから削除されることを検証する
+    cache = response_cache.ResponseCache(max_entries=2)
+    entry = response_cache.CachedResponse(b"{}", "application/json", {})
+    cache.put(("a",), entry)
+    cache.put(("b",), entry)
+    assert cache.get(("a",)) is entry
+    cache.put(("c",), entry)
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) is entry and cache.get(("c",)) is entry
+
+
+def test_migration_adds_courses_version(tmp_path):
+    # 版数の列がない users テーブルに、既定値 0 で列が追加されることを検証する
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id CHAR(32) PRIMARY KEY, created_at DATETIME)"))
+        conn.execute(text("INSERT INTO users (id) VALUES ('00000000000000000000000000000001')"))
+
+    migrations.upgrade(engine)
+
+    assert {"courses_version", "courses_updated_at"} <= {c["name"] for c in inspect(engine).get_columns("users")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT courses_version FROM users")).scalar_one() == 0
+    engine.dispose()
@@ -0,0 +1,138 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import routing
+from backend.calculator import segment_routing
+from backend.calculator.network_cache import LoadedNetwork
+from backend.calculator.segment_routing import SegmentRoutingPool
+
+
+@pytest.fixture
+def fixture_network_distance_m():
+    return 2000
+
+
+@pytest.fixture
+def items(drawings):
+    circle, heart, star = drawings
+    return [
+        {"drawing_display_points": heart, "target_distance_km": 3.0},
+        {"drawing_display_points": [{"x": 0.0, "y": 0.0}], "target_distance_km": 3.0},
+        {"drawing_display_points": star, "target_distance_km": 2.0},
+        {"drawing_display_points": circle, "target_distance_km": 0},
+    ]
+
+
+def test_batch_matches_individual_routes_and_loads_network_once(generator, start_location, items, count_calls):
+    # まとめて計算した結果が1件ずつ計算した結果と同じで、道路ネットワークの読み込みは1回だけであることを検証する
+    expected = [generator.calculate_route(start_location=start_location, **items[i]) for i in (0, 2)]
+
+    loads = count_calls(generator, "_load_road_network")
+    results = generator.calculate_routes(items, start_location)
+
+    assert len(loads) == 1
+    assert [results[0], results[2]] == expected
+    assert results[0]["route_points"] and results[2]["total_distance_km"] > 0
+    # 計算できなかった項目は error のみ（他の項目は計算する）
+    assert results[1] == {"error": "手書きの図形には2点以上が必要です。"}
+    assert results[3] == {"error": "目標距離には正の値を指定してください。"}
+
+
+def test_route_keeps_its_network_when_another_is_activated(generator, start_location, drawings, monkeypatch):
+    # 計算の途中で他のリクエストが別のネットワークを読み込んでも、読み込んだネットワークで計算を続けることを検証する
+    heart = drawings[1]
+    expected = generator.calculate_route(heart, start_location, 3.0)
+
+    other = LoadedNetwork((0.0, 0.0), 500, None, None)
+    find_best_rotation = generator._find_best_rotation
+
+    def rotate_then_switch(network, shape):
+        angle = find_best_rotation(network, shape)
+        with generator._network_lock:
+            generator._activate_network(other)
+        return angle
+
+    monkeypatch.setattr(generator, "_find_best_rotation", rotate_then_switch)
+    assert generator.calculate_route(heart, start_location, 3.0) == expected
+
+
+def test_single_route_rejects_invalid_drawing(generator, start_location):
+    # 1件の計算では、計算できない項目は ValueError になることを検証する
+    with pytest.raises(ValueError):
+        generator.calculate_route([{"x": 0.0, "y": 0.0}], start_location, 3.0)
+
+
+@pytest.mark.skipif(not segment_routing.parallel_available(), reason="forkserver が使えない環境")
+def test_parallel_batch_matches_sequential(generator, start_location, items):
+    # 全項目の区間をまとめて並列に探索しても、逐次に探索した結果と同じになることを検証する
+    sequential = generator.calculate_routes(items, start_location)
+
+    generator.segment_routing = SegmentRoutingPool(workers=2)
+    assert generator.calculate_routes(items, start_location) == sequential
+
+
+def fake_generator(calls):
+    def calculate_routes(items, start_location, fit_distance=False):
+        calls.append((items, start_location, fit_distance))
+        if start_location["lat"] > 80:
+            raise ValueError("指定された場所の近くに道路が見つかりませんでした。")
+        return [
+            {"error": "手書きの図形には2点以上が必要です。"} if len(item["drawing_display_points"]) < 2 else {
+                "total_distance_km": item["target_distance_km"],
+                "route_points": [{"lat": 35.0, "lng": 139.0}, {"lat": 35.1, "lng": 139.1}],
+                "drawing_points": [{"lat": 35.0, "lng": 139.0}],
+            }
+            for item in items
+        ]
+    return SimpleNamespace(calculate_routes=calculate_routes)
+
+
+def test_batch_endpoint_returns_results_in_order(client: TestClient, monkeypatch):
+    # 項目と同じ順に結果を返し、計算できなかった項目は error だけを返すことを検証する
+    calls = []
+    monkeypatch.setattr(routing, "get_generator", lambda: fake_generator(calls))
+    drawing = [{"x": 0.0, "y": 0.0}, {"x": 10.0, "y": 10.0}]
+    payload = {
+        "start_location": {"lat": 35.0, "lng": 139.0},
+        "items": [
+            {"drawing_display_points": drawing, "target_distance_km": 3.0},
+            {"drawing_display_points": drawing[:1], "target_distance_km": 4.0},
+            {"drawing_display_points": drawing, "target_distance_km": 5.0},
+        ],
+    }
+
+    response = client.post("/routes/calculate-batch", json=payload)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["total_distance_km"] for result in results] == [3.0, None, 5.0]
+    assert results[1] == {"total_distance_km": None, "route_points": None, "drawing_points": None,
+                          "error": "手書きの図形には2点以上が必要です。"}
+    assert results[0]["route_points"] == [{"lat": 35.0, "lng": 139.0}, {"lat": 35.1, "lng": 139.1}]
+    assert len(calls) == 1
+
+    compact = client.post("/routes/calculate-batch", json=payload, headers={"Accept": "application/vnd.gpsart.compact+json"})
+    assert compact.json()["results"][2]["route_points"] == [[35.0, 139.0], [35.1, 139.1]]
+
+
+def test_batch_endpoint_rejects_network_errors_and_too_many_items(client: TestClient, monkeypatch):
+    # 道路ネットワークを読み込めない場合は 400、項目数やボディのサイズが上限を超える場合は 413 を返すことを検証する
+    calls = []
+    monkeypatch.setattr(routing, "get_generator", lambda: fake_generator(calls))
+    item = {"drawing_display_points": [{"x": 0.0, "y": 0.0}, {"x": 10.0, "y": 10.0}], "target_distance_km": 3.0}
+
+    response = client.post("/routes/calculate-batch", json={"start_location": {"lat": 85.0, "lng": 0.0}, "items": [item]})
+    assert response.status_code == 400
+
+    monkeypatch.setattr("backend.main.ROUTE_BATCH_MAX_ITEMS", 2)
+    response = client.post("/routes/calculate-batch", json={"start_location": {"lat": 35.0, "lng": 139.0}, "items": [item] * 3})
+    assert response.status_code == 413
+    assert len(calls) == 1
+
+    # ボディのサイズが上限を超える場合は、項目を検証する前に413を返す（不正な項目があっても422にならない）
+    monkeypatch.setattr("backend.main.ROUTE_BATCH_MAX_BYTES", 200)
+    invalid = {"drawing_display_points": [{"x": "x" * 200, "y": 0.0}], "target_distance_km": 3.0}
+    response = client.post("/routes/calculate-batch", json={"start_location": {"lat": 35.0, "lng": 139.0}, "items": [invalid]})
+    assert response.status_code == 413
+    assert len(calls) == 1
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+from backend import routing
+
+
+def test_importing_main_does_not_load_routing_stack():
+    # backend.main を import しただけでは osmnx などの経路計算のモジュールを読み込まないことを検証する
+    script = (
+        "import sys, backend.main; "
+        "print([m for m in ('osmnx', 'geopandas', 'networkx', 'scipy') if m in sys.modules])"
+    )
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_start_warmup_initializes_in_background(monkeypatch):
+    # ウォームアップが有効な場合のみ、バックグラウンドのスレッドで経路計算を初期化することを検証する
+    calls = []
+    monkeypatch.setattr(routing, "get_generator", lambda: calls.append("init"))
+
+    assert routing.start_warmup(enabled=False) is None
+    assert calls == []
+
+    thread = routing.start_warmup(enabled=True)
+    thread.join(5)
+    assert calls == ["init"]
@@ -0,0 +1,102 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.benchmarks.load_test import install_fixture_network
+from backend.calculator import segment_routing
+from backend.calculator.segment_routing import SegmentRoutingPool
+
+pytestmark = pytest.mark.skipif(not segment_routing.parallel_available(), reason="forkserver が使えない環境")
+
+
+@pytest.fixture
+def fixture_network_distance_m():
+    # 100m 間隔の 15 x 15 の格子
+    return 700
+
+
+@pytest.fixture
+def network(generator, start_location, fixture_network_distance_m):
+    """generator に読み込んだ格子状の道路ネットワーク（LoadedNetwork）"""
+    return generator._load_road_network(start_location["lat"], start_location["lng"],
+                                        distance_m=fixture_network_distance_m)
+
+
+@pytest.fixture
+def origin(network) -> np.ndarray:
+    """格子の南西の角（投影座標）"""
+    return np.array([
+        min(x for _, x in network.road_network.nodes(data="x")),
+        min(y for _, y in network.road_network.nodes(data="y")),
+    ])
+
+
+def star_shape(origin: np.ndarray) -> np.ndarray:
+    angles = np.radians(np.arange(0, 360 * 2 + 1, 144))
+    return origin + np.column_stack((700 + 600 * np.sin(angles), 700 + 600 * np.cos(angles)))
+
+
+def test_parallel_routing_matches_sequential(generator, network, origin):
+    # 並列に探索してつないだコースが逐次の探索と同じになることを検証する
+    shape = star_shape(origin)
+    sequential = generator._find_route_for_shape(network, shape)
+
+    generator.segment_routing = SegmentRoutingPool(workers=2)
+    parallel = generator._find_route_for_shape(network, shape)
+    assert parallel == sequential
+    assert len(parallel) > len(shape)
+
+
+def test_parallel_routing_repairs_joints_after_missing_segments(generator, network, origin):
+    # 経路が見つからない区間があっても、次の区間を前の区間の終点から探索し直してつなぐことを検証する
+    isolated = 10_000
+    x, y = origin + 1450
+    network.road_network.add_node(isolated, x=x, y=y, coords=np.array([x, y]))
+    shape = origin + np.array([(0, 0), (700, 0), (1450, 1450), (0, 700), (0, 0)], dtype=np.float64)
+    sequential = generator._find_route_for_shape(network, shape)
+    assert isolated not in sequential
+
+    generator.segment_routing = SegmentRoutingPool(workers=2)
+    parallel = generator._find_route_for_shape(network, shape)
+    assert parallel == sequential
+    # 区間ごとにつながっている（隣り合うノードの間にエッジがある）
+    assert all(network.road_network.has_edge(u, v) for u, v in zip(parallel[:-1], parallel[1:]))
+
+
+def test_pool_keeps_workers_across_networks_and_costs(generator, network, origin, fixture_network_distance_m):
+    # ネットワークやコストのパラメータが変わってもワーカープロセスを起動し直さず、
+    # 使われていないネットワークの一時ファイルは上限を超えた分を削除することを検証する
+    pool = SegmentRoutingPool(workers=2, max_networks=1)
+    generator.segment_routing = pool
+    shape = star_shape(origin)
+    generator._find_route_for_shape(network, shape)
+    first = pool._executor
+
+    generator.set_cost_parameters(beta=1)
+    parallel = generator._find_route_for_shape(network, shape)
+    assert pool._executor is first
+    generator.segment_routing = SegmentRoutingPool(workers=0)
+    assert parallel == generator._find_route_for_shape(network, shape)
+
+    generator.segment_routing = pool
+    other = install_fixture_network(generator, distance_m=fixture_network_distance_m)
+    generator._find_route_for_shape(other, shape)
+    assert pool._executor is first
+    assert list(pool._snapshots) == [other.version]
+    assert os.listdir(pool._snapshot_dir) == [f"network-{other.version}.pkl"]
+
+
+def test_concurrent_routes_on_different_networks(generator, network, origin, fixture_network_distance_m):
+    # 別のネットワークの探索が同時に実行されても、実行中の探索のワーカーやネットワークを止めないことを検証する
+    other = install_fixture_network(generator, distance_m=fixture_network_distance_m)
+    shape = star_shape(origin)
+    expected = generator._find_route_for_shape(network, shape)
+
+    pool = SegmentRoutingPool(workers=2, max_networks=1)
+    generator.segment_routing = pool
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        routes = list(threads.map(lambda n: generator._find_route_for_shape(n, shape), [network, other] * 4))
+    assert routes == [expected] * 8
+    assert len(pool._snapshots) == 1 and not pool._in_use
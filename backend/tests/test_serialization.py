@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from backend import models, routing, serialization
+
+CALCULATE_PAYLOAD = {
+    "drawing_display_points": [{"x": 0, "y": 0}, {"x": 1, "y": 1}],
+    "start_location": {"lat": 35.0, "lng": 139.0},
+    "target_distance_km": 1.0,
+}
+
+
+def fake_route(num_points):
+    route_points = [{"lat": 35.0 + i * 1e-5, "lng": 139.0 + i * 2e-5} for i in range(num_points)]
+
+    def fake_calculate_route(drawing_display_points, start_location, target_distance_km):
+        return {"total_distance_km": 1.5, "route_points": route_points, "drawing_points": route_points[:2]}
+
+    return route_points, fake_calculate_route
+
+
+def test_calculate_route_default_and_compact_formats(client: TestClient, monkeypatch):
+    # 既定では {lat, lng} のリスト、compact 形式を要求した場合は [lat, lng] の配列で返すことを検証する
+    route_points, fake_calculate_route = fake_route(3)
+    monkeypatch.setattr(routing, "get_generator", lambda: SimpleNamespace(calculate_route=fake_calculate_route))
+
+    response = client.post("/routes/calculate", json=CALCULATE_PAYLOAD)
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {
+        "total_distance_km": 1.5,
+        "route_points": route_points,
+        "drawing_points": route_points[:2],
+    }
+
+    response = client.post(
+        "/routes/calculate", json=CALCULATE_PAYLOAD, headers={"Accept": serialization.COMPACT_MEDIA_TYPE}
+    )
+    assert response.headers["content-type"] == serialization.COMPACT_MEDIA_TYPE
+    data = response.json()
+    assert data["route_points"] == [[p["lat"], p["lng"]] for p in route_points]
+    assert data["drawing_points"] == [[p["lat"], p["lng"]] for p in route_points[:2]]
+
+
+def test_large_responses_are_gzip_compressed(client: TestClient, monkeypatch):
+    # 大きなレスポンスは Accept-Encoding: gzip の場合に圧縮されることを検証する
+    route_points, fake_calculate_route = fake_route(2000)
+    monkeypatch.setattr(routing, "get_generator", lambda: SimpleNamespace(calculate_route=fake_calculate_route))
+
+    response = client.post("/routes/calculate", json=CALCULATE_PAYLOAD, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["route_points"]) == 2000
+
+
+def test_course_detail_compact_format(client: TestClient, db_session: Session):
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    course = models.Course(
+        user_id=user.id,
+        total_distance_km=5.0,
+        route_points=[{"lat": 35.0, "lng": 139.0}, {"lat": 35.1, "lng": 139.1}],
+        drawing_points=[{"lat": 35.2, "lng": 139.2}],
+    )
+    db_session.add(course)
+    db_session.commit()
+
+    response = client.get(
+        f"/users/{user.id}/courses/{course.id}", headers={"Accept": serialization.COMPACT_MEDIA_TYPE}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["route_points"] == [[35.0, 139.0], [35.1, 139.1]]
+    assert data["drawing_points"] == [[35.2, 139.2]]
+
+
+def test_openapi_keeps_response_models(client: TestClient):
+    # OpenAPI のスキーマが従来どおり response_model を指し、compact 形式も記載されることを検証する
+    content = client.get("/openapi.json").json()["paths"]["/users/{user_id}/courses"]["get"]["responses"]["200"]["content"]
+    assert content["application/json"]["schema"]["items"]["$ref"].endswith("/CourseSummary")
+    assert serialization.COMPACT_MEDIA_TYPE in content
@@ -0,0 +1,36 @@
+import numpy as np
+
+from backend import spatial
+from backend.calculator import geometry
+
+
+def test_cell_ranges_cover_every_point_within_radius():
+    # 半径内のどの点のセルIDも cell_ranges の範囲に含まれることを検証する
+    rng = np.random.default_rng(0)
+    center_lat, center_lng, radius_km = 43.0686, 141.3508, 3.0
+    lats = center_lat + rng.uniform(-0.05, 0.05, 2000)
+    lngs = center_lng + rng.uniform(-0.05, 0.05, 2000)
+    inside = geometry.haversine_km(center_lat, center_lng, lats, lngs) <= radius_km
+
+    ranges = spatial.cell_ranges(center_lat, center_lng, radius_km)
+    for lat, lng in zip(lats[inside], lngs[inside]):
+        cell = spatial.cell_id(lat, lng)
+        assert any(low <= cell <= high for low, high in ranges)
+
+
+def test_cell_id_rows_are_contiguous():
+    # 同じ緯度の隣り合うセルのIDが連続することを検証する
+    a = spatial.cell_id(35.005, 139.005)
+    b = spatial.cell_id(35.005, 139.015)
+    assert b == a + 1
+    assert spatial.cell_id(None, 139.0) is None
+
+
+def test_cell_ranges_cover_point_just_inside_radius_at_cell_edge():
+    # 円の北端がセルの境界をわずかに越える場合も、半径内の境界の向こうの点のセルが範囲に含まれることを検証する
+    center_lat, center_lng, radius_km = 35.01 - 1 / 111.32 - 1e-7, 139.005, 1.0
+    lat = 35.01 + 1e-6
+    assert geometry.haversine_km(center_lat, center_lng, [lat], [center_lng])[0] <= radius_km
+
+    cell = spatial.cell_id(lat, center_lng)
+    assert any(low <= cell <= high for low, high in spatial.cell_ranges(center_lat, center_lng, radius_km))
@@ -0,0 +1,93 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from backend import metrics, models
+
+ROUTE = [{"lat": 35.0, "lng": 139.0}, {"lat": 35.01, "lng": 139.01}]
+COURSE = {"total_distance_km": 1.0, "route_points": ROUTE, "drawing_points": ROUTE}
+
+
+def statement_count(response) -> int:
+    """Server-Timing ヘッダーの db 項目から、リクエストで実行したSQL文の数を取り出す"""
+    match = re.search(r'db;desc="(\d+) statements"', response.headers.get("server-timing", ""))
+    return int(match.group(1)) if match else 0
+
+
+@pytest.fixture
+def user_with_course(db_session: Session):
+    user = models.User()
+    db_session.add(user)
+    db_session.commit()
+    course = models.Course(user_id=user.id, total_distance_km=1.0, route_points=ROUTE, drawing_points=ROUTE)
+    db_session.add(course)
+    db_session.commit()
+    return str(user.id), str(course.id)
+
+
+# エンドポイントごとのSQL文の数の上限（増やす場合は理由をコメントに書くこと）
+@pytest.mark.parametrize("method, path, body, budget", [
+    ("post", "/users", None, 1),
+    # ユーザーの存在確認 + 一覧
+    ("get", "/users/{user_id}/courses", None, 2),
+    # ユーザーの存在確認 + 始点の候補 + 返却するコース（k 件見つからない場合は半径を広げて候補を再検索する）
+    ("get", "/users/{user_id}/courses/nearby?lat=35.0&lng=139.0&k=1", None, 3),
+    # ユーザーの版数（ETag 用） + コース
+    ("get", "/users/{user_id}/courses/{course_id}", None, 2),
+    # ユーザーの存在確認を兼ねた版数の更新 + INSERT ... SELECT
+    ("post", "/users/{user_id}/courses", COURSE, 2),
+    # ユーザーの存在確認を兼ねた版数の更新 + 1バッチ分の INSERT
+    ("post", "/users/{user_id}/courses/bulk", {"courses": [COURSE] * 3}, 2),
+    # UPDATE ... RETURNING + 版数の更新
+    ("post", "/users/{user_id}/courses/{course_id}/toggle_favorite", None, 2),
+    # DELETE + 版数の更新
+    ("delete", "/users/{user_id}/courses/{course_id}", None, 2),
+    ("get", "/handwritings", None, 1),
+])
+def test_endpoint_statement_budget(client: TestClient, user_with_course, method, path, body, budget):
+    # 各エンドポイントが上限以内の数のSQL文で処理されることを検証する
+    user_id, course_id = user_with_course
+    response = getattr(client, method)(
+        path.format(user_id=user_id, course_id=course_id), **({"json": body} if body else {})
+    )
+    assert response.status_code < 300
+    assert 0 < statement_count(response) <= budget
+
+
+def test_mutations_on_missing_course_use_one_statement(client: TestClient, user_with_course):
+    # 存在しないコース・ユーザーへの変更は1文で 404 になり、何も変更しないことを検証する
+    # (版数の更新は変更が成功した場合のみ行う)
+    user_id, course_id = user_with_course
+    missing = "00000000-0000-0000-0000-000000000000"
+
+    response = client.post(f"/users/{user_id}/courses/{missing}/toggle_favorite")
+    assert response.status_code == 404 and statement_count(response) == 1
+    response = client.delete(f"/users/{missing}/courses/{course_id}")
+    assert response.status_code == 404 and statement_count(response) == 1
+    response = client.post(f"/users/{missing}/courses", json=COURSE)
+    assert response.status_code == 404 and statement_count(response) == 1
+
+    response = client.get(f"/users/{user_id}/courses/{course_id}")
+    assert response.status_code == 200 and response.json()["is_favorite"] is False
+
+
+@pytest.mark.parametrize("path", ["/users/{user_id}/courses", "/users/{user_id}/courses/{course_id}"])
+def test_not_modified_loads_no_courses(client: TestClient, user_with_course, path):
+    # 304 を返す場合はユーザーの版数だけを読み込むことを検証する
+    path = path.format(user_id=user_with_course[0], course_id=user_with_course[1])
+    etag = client.get(path).headers["etag"]
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert statement_count(response) == 1
+
+
+def test_statement_counts_are_exported_per_route(client: TestClient, user_with_course):
+    # SQL文の数がエンドポイントのパスごとに /metrics に集計されることを検証する
+    user_id, course_id = user_with_course
+    route = "/users/{user_id}/courses/{course_id}"
+    before = metrics.db_statements_per_request.count(route=route)
+    client.get(f"/users/{user_id}/courses/{course_id}")
+    assert metrics.db_statements_per_request.count(route=route) == before + 1
+    assert f'gps_art_db_statements_per_request_count{{route="{route}"}}' in client.get("/metrics").text
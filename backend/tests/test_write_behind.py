@@ -0,0 +1,97 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from backend import main, metrics, models, routing
+from backend.write_behind import HandwritingWriter
+
+# conftest でテスト用のDBのセッションに差し替えられている
+TestingSessionLocal = main.handwriting_writer.session_factory
+
+DRAWING = [{"x": 0.0, "y": 0.0}, {"x": 1.5, "y": 2.0}]
+
+
+def test_flush_writes_queued_records_in_batches(db_session: Session):
+    # キューに積んだ記録が flush でまとめて書き込まれることを検証する
+    writer = HandwritingWriter(TestingSessionLocal, batch_size=2)
+    for _ in range(5):
+        assert writer.submit(DRAWING)
+    assert db_session.query(models.Handwriting).count() == 0
+
+    assert writer.flush() == 5
+    handwritings = db_session.query(models.Handwriting).all()
+    assert len(handwritings) == 5
+    assert handwritings[0].drawing_points == DRAWING
+    assert handwritings[0].created_at is not None
+
+
+def test_submit_drops_records_when_queue_is_full(db_session: Session):
+    # キューが満杯の場合は記録を破棄し、件数を数えることを検証する
+    writer = HandwritingWriter(TestingSessionLocal, queue_size=2)
+    before = metrics.handwriting_records_total.value(result="dropped")
+    assert writer.submit(DRAWING)
+    assert writer.submit(DRAWING)
+    assert not writer.submit(DRAWING)
+    assert metrics.handwriting_records_total.value(result="dropped") == before + 1
+    assert writer.flush() == 2
+
+
+def test_background_thread_writes_after_interval(db_session: Session):
+    # 書き込みスレッドが flush_interval 経過後に書き込むことを検証する
+    writer = HandwritingWriter(TestingSessionLocal, batch_size=100, flush_interval_ms=20)
+    writer.start()
+    try:
+        writer.submit(DRAWING)
+        deadline = time.monotonic() + 5
+        while db_session.query(models.Handwriting).count() == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert db_session.query(models.Handwriting).count() == 1
+    finally:
+        writer.stop()
+
+
+def test_stop_does_not_flush_while_writer_thread_is_busy(db_session: Session):
+    # 書き込みスレッドが時間内に終わらない場合は、呼び出し元のスレッドから同時に書き込まないことを検証する
+    release = threading.Event()
+
+    def slow_session():
+        release.wait(5)
+        return TestingSessionLocal()
+
+    writer = HandwritingWriter(slow_session, batch_size=1, flush_interval_ms=20)
+    writer.start()
+    writer.submit(DRAWING)
+    deadline = time.monotonic() + 5
+    while writer._queue.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.submit(DRAWING)
+    writer.submit(DRAWING)
+
+    assert writer.stop(timeout=0.05) == 0
+    assert writer._queue.qsize() >= 2
+    release.set()
+    # 書き込みスレッドが終わった後の stop() で残りを書き込む
+    assert writer.stop() == 2
+    assert db_session.query(models.Handwriting).count() == 3
+
+
+def test_calculate_route_persists_handwriting_on_shutdown(db_session: Session, monkeypatch):
+    # コース計算の手書きデータがキュー経由で保存され、終了時に書き込まれることを検証する
+    def fake_calculate_route(drawing_display_points, start_location, target_distance_km):
+        return {"total_distance_km": 1.0, "route_points": [], "drawing_points": []}
+
+    monkeypatch.setattr(routing, "get_generator", lambda: SimpleNamespace(calculate_route=fake_calculate_route))
+    monkeypatch.setattr(main.handwriting_writer, "flush_interval_s", 60.0)
+    with TestClient(main.app) as client:
+        response = client.post("/routes/calculate", json={
+            "drawing_display_points": DRAWING,
+            "start_location": {"lat": 35.0, "lng": 139.0},
+            "target_distance_km": 1.0,
+        })
+        assert response.status_code == 200
+
+    handwritings = db_session.query(models.Handwriting).all()
+    assert [hw.drawing_points for hw in handwritings] == [DRAWING]
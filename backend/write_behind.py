@@ -0,0 +1,160 @@
+"""
+手書きデータの非同期書き込み（write-behind）
+
+/routes/calculate のたびに手書きデータを INSERT・COMMIT すると、コース計算の前に
+DBとの往復（SQLite では書き込みロックの取得）が必要になる。
+そこで手書きデータはメモリ上のキューに積むだけにし、バックグラウンドのスレッドが
+batch_size 件ごと、または flush_interval_ms ミリ秒ごとに1つのトランザクションでまとめて INSERT する。
+
+- キューが queue_size 件に達している場合は新しい記録を破棄し、件数をメトリクスに記録する
+- アプリケーションの終了時には stop() でキューに残っている記録をすべて書き込む
+  （書き込みスレッドが時間内に終わらない場合は、同時に書き込まないよう残りの記録は書き込まない）
+
+設定は環境変数 HANDWRITING_QUEUE_SIZE / HANDWRITING_BATCH_SIZE / HANDWRITING_FLUSH_INTERVAL_MS で変更できる。
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from . import metrics, models
+
+HANDWRITING_QUEUE_SIZE = int(os.environ.get("HANDWRITING_QUEUE_SIZE", "10000"))
+HANDWRITING_BATCH_SIZE = int(os.environ.get("HANDWRITING_BATCH_SIZE", "100"))
+HANDWRITING_FLUSH_INTERVAL_MS = int(os.environ.get("HANDWRITING_FLUSH_INTERVAL_MS", "200"))
+
+# stop() で記録を待っている書き込みスレッドを起こすための目印
+_WAKE_UP = object()
+
+
+class HandwritingWriter:
+    """手書きデータをキューに積み、バックグラウンドでまとめて書き込む"""
+
+    def __init__(
+        self,
+        session_factory,
+        queue_size: int = HANDWRITING_QUEUE_SIZE,
+        batch_size: int = HANDWRITING_BATCH_SIZE,
+        flush_interval_ms: int = HANDWRITING_FLUSH_INTERVAL_MS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_ms / 1000
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, drawing_points) -> bool:
+        """
+        手書きデータを書き込みキューに積む。キューが満杯で破棄した場合は False を返す。
+        created_at は書き込み時ではなく、受け付けた時刻（UTC）を記録する。
+        """
+        record = {
+            "id": uuid.uuid4(),
+            "drawing_points": drawing_points,
+            "created_at": datetime.now(timezone.utc),
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.handwriting_records_total.inc(result="dropped")
+            return False
+        metrics.handwriting_records_total.inc(result="enqueued")
+        metrics.handwriting_queue_depth.set(self._queue.qsize())
+        return True
+
+    def start(self):
+        """バックグラウンドの書き込みスレッドを開始する"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="handwriting-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> int:
+        """
+        書き込みスレッドを停止し、キューに残っている記録をすべて書き込む。書き込んだ件数を返す。
+        timeout 秒以内に書き込みスレッドが終わらない場合は、2つのスレッドから同時に書き込まないよう
+        残りの記録を書き込まずに 0 を返す（書き込みスレッドは書き込み中のバッチを終えると停止する）。
+        """
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(_WAKE_UP)
+        except queue.Full:
+            pass  # キューが満杯なら書き込みスレッドは待っていない
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                remaining = sum(1 for record in list(self._queue.queue) if record is not _WAKE_UP)
+                print(
+                    f"手書きデータの書き込みスレッドが {timeout} 秒以内に終了しませんでした。"
+                    f"キューに残っている {remaining} 件は書き込みません。"
+                )
+                return 0
+            self._thread = None
+        written = self.flush()
+        if written:
+            print(f"終了時に手書きデータ {written} 件を書き込みました。")
+        return written
+
+    def flush(self) -> int:
+        """キューに残っている記録を呼び出し元のスレッドですべて書き込む。書き込んだ件数を返す。"""
+        written = 0
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def _take(self, max_items: int, deadline: Optional[float] = None) -> List[dict]:
+        """キューから最大 max_items 件を取り出す（deadline まで次の記録を待つ）"""
+        batch = []
+        while len(batch) < max_items:
+            try:
+                if deadline is None:
+                    record = self._queue.get_nowait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    record = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if record is _WAKE_UP:
+                if deadline is not None:
+                    break
+                continue
+            batch.append(record)
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval_s)
+            except queue.Empty:
+                continue
+            if first is _WAKE_UP:
+                continue
+            # 最初の1件から flush_interval_s 経過するか batch_size 件たまったら書き込む
+            deadline = time.monotonic() + self.flush_interval_s
+            self._write([first] + self._take(self.batch_size - 1, deadline))
+
+    def _write(self, batch: List[dict]) -> int:
+        metrics.handwriting_queue_depth.set(self._queue.qsize())
+        try:
+            with metrics.timed_stage("handwriting_flush"):
+                with self.session_factory() as session:
+                    session.execute(insert(models.Handwriting), batch)
+                    session.commit()
+        except Exception as e:
+            # 書き込みに失敗した記録は再試行せずに破棄する（コース計算には影響させない）
+            metrics.handwriting_records_total.inc(len(batch), result="failed")
+            print(f"手書きデータ {len(batch)} 件の書き込みに失敗しました: {e}")
+            return 0
+        metrics.handwriting_records_total.inc(len(batch), result="written")
+        return len(batch)
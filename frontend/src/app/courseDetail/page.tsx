@@ -24,20 +24,43 @@ function CourseDetailContent() {
         // SessionStorageからコース詳細データを取得
         const storedData = sessionStorage.getItem('courseDetailData');
 
-        if (storedData) {
-            try {
-                const parsedData = JSON.parse(storedData);
-                setCourseData(parsedData);
-            } catch (error) {
-                console.error('コース詳細データの解析に失敗しました:', error);
-                window.location.href = '/home';
-            }
-        } else {
+        if (!storedData) {
             console.warn('コース詳細データが見つかりません');
             window.location.href = '/home';
+            return;
+        }
+
+        let parsedData: CourseData;
+        try {
+            parsedData = JSON.parse(storedData);
+        } catch (error) {
+            console.error('コース詳細データの解析に失敗しました:', error);
+            window.location.href = '/home';
+            return;
         }
 
-        setIsLoading(false);
+        // 一覧の positions はサムネイル用に簡略化された経路のため、全体の経路を詳細APIから取得する
+        const fetchFullRoute = async () => {
+            const uuid = localStorage.getItem("uuid");
+            if (!uuid) return parsedData;
+            try {
+                const res = await fetch(`/api/users/${uuid}/courses/${parsedData.id}`);
+                if (!res.ok) throw new Error(`status ${res.status}`);
+                const detail = await res.json();
+                return {
+                    ...parsedData,
+                    positions: detail.route_points.map((p: { lat: number; lng: number }) => [p.lat, p.lng]),
+                };
+            } catch (error) {
+                console.error('コースの経路の取得に失敗しました:', error);
+                return parsedData;
+            }
+        };
+
+        fetchFullRoute().then((data) => {
+            setCourseData(data);
+            setIsLoading(false);
+        });
     }, []);
 
     if (isLoading || !courseData) {